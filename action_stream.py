@@ -0,0 +1,268 @@
+"""
+行动流式解析 - 单遍扫描 agent 回复，边收边吐出完整的行动对象
+取代正则：```json 块里的 .*? 和裸数组的 \\[\\s*\\{.*?\\}\\s*\\] 在又长又满是括号的回复上会反复回溯。
+这里每个字符只看一次（线性时间），可以直接喂 agent 的流式输出：
+一个行动对象的右括号一到就解析并交出去，不必等 agent 结束。
+
+语义和原来一致：
+  1. ```json 块：块内是数组就取其中每个对象，是对象就取它本身
+  2. 只有整份回复里没有 ```json 行动时，才用裸 JSON 数组（[ 后紧跟 { 的数组）里的对象
+     ——裸数组里的行动要到 close() 才交出，因为后面可能还会出现 ```json 块
+逐个对象校验：某个对象坏了只丢它自己，不连累同一块里其他对象。
+
+JSON 字符串里的 ``` 先当普通内容（"content": "用 ``` 包代码" 是合法行动）。
+只有这个字符串坏了——遇到裸换行（JSON 字符串里不允许）或输入结束还没闭合——
+才退回到它里面的第一个 ``` 当边界重扫，这一段之后字符串里的 ``` 一律当边界，
+所以每个字符最多看两次。
+
+缓冲区只放还没扫完的那一小段：扫过的文本只有在还可能用到时才留着
+（正在收的行动对象要解析、字符串里的 ``` 可能要退回重扫），存成分片列表不反复拼接，
+所以整份回复的拼接和扫描都是线性的。
+"""
+import json
+import re
+from collections import deque
+
+FENCE_OPEN = "```json"
+FENCE_CLOSE = "```"
+
+TEXT, FENCE, BARE = "text", "fence", "bare"
+
+# 块外只找这两种起点；都是字面量，search 不会回溯
+_TEXT_MARK = re.compile(r"```json|\[")
+_STRING_STOP = re.compile(r'["\\`\n]')
+
+# 记下回复开头的字符数（去掉前导空白），够判断 PASS 之类的开头
+HEAD_CHARS = 16
+
+
+class ActionScanner:
+    """增量扫描器：feed() 返回这次新完成的 ```json 行动，close() 返回剩下的"""
+
+    def __init__(self):
+        self.buf = ""        # 还没扫完的文本，从绝对位置 base 开始
+        self.base = 0
+        self.pos = 0         # buf 里的扫描位置
+        self.kept = deque()  # base 之前扫过、但还要用到的文本分片
+        self.kept_at = 0     # kept 第一片的绝对位置
+        self.head = ""       # 回复开头（去掉前导空白），最多 HEAD_CHARS 个字符
+        self.received = 0    # 收到的字符总数
+        self.mode = TEXT
+        self.fenced = 0      # 已交出的 ```json 行动数
+        self.emitted = 0     # feed() 已交出的行动数
+        self.bare = []       # 已闭合的裸数组里的行动，close() 时决定用不用
+        self.strict = 0      # 这个绝对位置之前字符串里的 ``` 也算边界（重扫过的区域）
+        self._reset_value()
+
+    def _reset_value(self):
+        self.depth = 0
+        self.in_str = False
+        self.escape = False
+        self.tick = None       # 当前字符串里第一个 ``` 的绝对位置，字符串坏了就退回这里
+        self.started = False   # 当前值是否已开始（块里跳过前导空白）
+        self.finished = False  # 当前值是否已结束（等 ``` 收尾）
+        self.container = None  # "[" 或 "{"
+        self.elem_start = None  # 正在收的行动对象的绝对起点
+        self.pending = []      # 裸数组里已闭合的对象，数组闭合后才算数
+
+    def feed(self, chunk):
+        self.received += len(chunk)
+        if len(self.head) < HEAD_CHARS:
+            self.head = (self.head + chunk).lstrip()[:HEAD_CHARS]
+        self._advance()
+        self.buf += chunk
+        actions = self._scan(final=False)
+        self.emitted += len(actions)
+        return actions
+
+    def close(self):
+        """输入结束：交出剩余的 ```json 行动；整份回复都没有时交出裸数组里的行动"""
+        out = self._scan(final=True)
+        if not self.fenced:
+            out.extend(self.bare)
+        self.bare = []
+        return out
+
+    # ------------------------------------------------------------
+
+    def _advance(self):
+        """把 buf 里扫过的部分移出去：还要用到的存进 kept，用不到的丢掉"""
+        done, self.buf = self.buf[:self.pos], self.buf[self.pos:]
+        self.base += self.pos
+        self.pos = 0
+        marks = [m for m in (self.elem_start, self.tick) if m is not None]
+        if not marks:
+            self.kept.clear()
+            self.kept_at = self.base
+            return
+        if done:
+            self.kept.append(done)
+        need = min(marks)
+        while self.kept and self.kept_at + len(self.kept[0]) <= need:
+            self.kept_at += len(self.kept.popleft())
+
+    def _since(self, start):
+        """从绝对位置 start 到 buf 开头之间扫过的文本"""
+        if start >= self.base:
+            return ""
+        return "".join(self.kept)[start - self.kept_at:]
+
+    def _scan(self, final):
+        out = []
+        i = self.pos
+        while True:
+            i = self._scan_from(i, final, out)
+            if not (final and self.in_str and self.tick is not None):
+                break
+            i = self._rewind(len(self.buf))  # 字符串到结尾都没闭合
+        self.pos = i
+        return out
+
+    def _rewind(self, upto):
+        """当前字符串坏了：退回到它里面的第一个 ```，upto 之前不再把字符串里的 ``` 当内容。
+        返回 buf 里的新扫描位置（退回点已移出 buf 时把那段接回来）"""
+        tick, self.tick = self.tick, None
+        self.in_str = self.escape = False
+        self.strict = self.base + upto
+        if tick < self.base:
+            done = "".join(self.kept)
+            cut = tick - self.kept_at
+            self.buf = done[cut:] + self.buf
+            self.kept = deque([done[:cut]])
+            self.base = tick
+        return tick - self.base
+
+    def _scan_from(self, i, final, out):
+        buf = self.buf
+        n = len(buf)
+        base = self.base
+        while i < n:
+            if self.mode == TEXT:
+                m = _TEXT_MARK.search(buf, i)
+                if m is None:
+                    # ```json 标记可能被切在两次 feed 之间，末尾几个字符留到下次
+                    i = n if final else max(i, n - len(FENCE_OPEN) + 1)
+                    break
+                if m.group() == FENCE_OPEN:
+                    i = m.end()
+                    self.mode = FENCE
+                    self._reset_value()
+                    continue
+                j = m.end()
+                while j < n and buf[j].isspace():
+                    j += 1
+                if j >= n and not final:
+                    i = m.start()  # [ 后面是什么还不知道，等下次
+                    break
+                if j < n and buf[j] == "{":
+                    self.mode = BARE
+                    self._reset_value()
+                    self.started = True
+                    self.container = "["
+                    self.depth = 1
+                    i = j
+                else:
+                    i = j
+                continue
+
+            # FENCE / BARE：结构扫描一个 JSON 值。字符串外的 ``` 是边界
+            c = buf[i]
+            if self.in_str and not self.escape and c not in '"\\`\n':
+                # 字符串内部成段跳过，只停在引号、反斜杠、反引号和换行上
+                m = _STRING_STOP.search(buf, i)
+                i = m.start() if m else n
+                continue
+            if self.in_str and c == "\n" and self.tick is not None:
+                i = self._rewind(i)  # 字符串里有裸换行，它里面的 ``` 其实是块结尾
+                buf, n, base = self.buf, len(self.buf), self.base
+                continue
+            if c == "`":
+                if i + len(FENCE_CLOSE) > n and not final:
+                    break  # 可能是被切开的 ```
+                if self.in_str and base + i >= self.strict and buf.startswith(FENCE_CLOSE, i):
+                    # 先当字符串内容，记下位置；字符串正常闭合就忘掉它
+                    if self.tick is None:
+                        self.tick = base + i
+                    i += len(FENCE_CLOSE)
+                    continue
+                if buf.startswith(FENCE_CLOSE, i):
+                    if self.mode == FENCE:
+                        # 块结束（值没闭合就是被截断了，已交出的对象保留）
+                        i += len(FENCE_CLOSE)
+                    self.mode = TEXT  # 没闭合的裸数组作废，从 ``` 处重新找
+                    continue
+
+            if self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_str = False
+                    self.tick = None
+                i += 1
+                continue
+
+            if self.finished:
+                i += 1
+                continue
+
+            if not self.started:
+                if c.isspace():
+                    i += 1
+                    continue
+                self.started = True
+                if c in "[{":
+                    self.container = c
+                    self.depth = 1
+                    self.elem_start = base + i if c == "{" else None
+                else:
+                    self.finished = True  # 不是数组也不是对象：这块没有行动
+                i += 1
+                continue
+
+            if c == '"':
+                self.in_str = True
+            elif c in "[{":
+                if self.depth == 1 and self.container == "[":
+                    self.elem_start = base + i if c == "{" else None
+                self.depth += 1
+            elif c in "]}":
+                self.depth -= 1
+                closes_element = self.elem_start is not None and (
+                    (self.container == "[" and self.depth == 1) or
+                    (self.container == "{" and self.depth == 0))
+                if closes_element:
+                    start = self.elem_start - base
+                    action = _parse_object(self._since(self.elem_start) + buf[max(start, 0):i + 1])
+                    self.elem_start = None
+                    if action is not None:
+                        if self.mode == FENCE:
+                            self.fenced += 1
+                            out.append(action)
+                        else:
+                            self.pending.append(action)
+                if self.depth <= 0:
+                    if self.mode == BARE:
+                        self.bare.extend(self.pending)
+                        self.mode = TEXT
+                    else:
+                        self.finished = True
+            i += 1
+        return i
+
+
+def _parse_object(text):
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def extract(text):
+    """一次性解析整份回复"""
+    scanner = ActionScanner()
+    actions = scanner.feed(text)
+    actions.extend(scanner.close())
+    return actions
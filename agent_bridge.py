@@ -8,12 +8,24 @@
   4. agent返回结构化行动JSON，世界层执行
   5. session持续 → agent有跨天记忆
 """
+import asyncio
+import contextlib
 import json
 import os
 import subprocess
-import re
+import sys
+import time
+from collections import Counter
 from datetime import datetime
 
+import storage
+import action_stream
+import scheduler
+import deadlines
+import breaker
+import cassette
+import fake_agent
+import worker_pool
 import economy
 import plaza
 import needs as needs_module
@@ -24,11 +36,19 @@ import chronicle
 # 配置
 # ============================================================
 
-AGENT_MAP = {
-    "C1": "c1", "C2": "c2", "C3": "c3", "C4": "c4", "C5": "c5",
-}
+# 居民 → agent 名的映射在经济状态的居民名册里（economy.agent_of）
 SESSION_PREFIX = "genesis"
-ACTION_TIMEOUT = 120
+# 单次调用的截止时间上限（含子进程宽限）；每回合实际截止时间见 deadlines.deadline
+ACTION_TIMEOUT = deadlines.MAX_DEADLINE
+# 熔断后健康检查的超时（秒）
+HEALTH_TIMEOUT = 15
+# agent 调用方式：cli = 每回合启动一次 openclaw CLI；pool = 每个居民一个常驻 worker（见 worker_pool.py）；
+# fake = 模拟居民，不调 LLM（见 fake_agent.py，压测用）
+AGENT_BACKEND = os.environ.get("GENESIS_AGENT_BACKEND", "cli")
+if AGENT_BACKEND == "pool" and not worker_pool.configured():
+    # 没有常驻 worker 命令时 pool 只会多一层转发进程，不如直接走 cli
+    print("[agent] GENESIS_AGENT_BACKEND=pool 需要设置 GENESIS_AGENT_WORKER，改用 cli", file=sys.stderr)
+    AGENT_BACKEND = "cli"
 
 # ============================================================
 # SOUL.md（一次性写入每个agent的workspace）
@@ -113,122 +133,286 @@ def init_soul(citizen_id):
 # 世界状态 -> 消息（每天动态生成）
 # ============================================================
 
-def build_daily_message(citizen_id, day, round_num=1, total_rounds=3):
+# 每个居民看到哪儿了：{"day", "plaza": 广场游标, "submissions": {need_id: 已看条数}, "votes": {need_id: {投票人: 候选}}}
+# 第2轮起只渲染游标之后的变化。游标在 agent 成功回复后才推进，没送达的内容下轮还会出现。
+_cursor_store = storage.Store("cursors", lambda: {"citizens": {}}, maps=("citizens",))
+_pending_cursors = {}
+
+
+def _commit_cursor(citizen_id):
+    cursor = _pending_cursors.pop(citizen_id, None)
+    if cursor is not None:
+        _cursor_store.apply(["set", ["citizens", citizen_id], cursor])
+
+
+def build_daily_message(citizen_id, day, round_num=1, total_rounds=3, snapshot=None):
     """把当天的世界状态打包成一条消息发给agent。
     第1轮：完整状态（需求、金库、昨日事件）
-    第2+轮：显示提交内容，鼓励投票和回应
+    第2+轮：只发自上轮以来的变化（新提交、新投票、新发言），鼓励投票和回应；
+           当天没收到过第1轮（游标不是今天的）则退回完整版本
+    一轮里给多个居民发消息时传入同一个 WorldSnapshot，共享部分只算一次。
     """
-    citizen_econ = economy.get_citizen(citizen_id)
-    if not citizen_econ or citizen_econ["status"] != "active":
-        return None
-
-    balance = citizen_econ["balance"]
-    days_to_live = balance // 5
-
-    msg = f"== 第 {day} 天，第 {round_num}/{total_rounds} 轮 ==\n\n"
-    msg += f"你的状态：{balance} token，还能活 {days_to_live} 天。\n"
+    if snapshot is None:
+        snapshot = WorldSnapshot(day, round_num, total_rounds)
+    return snapshot.render(citizen_id)
 
-    # 所有轮次都需要的数据
-    all_citizens = economy.get_all_citizens()
-    others = {cid: info["status"] for cid, info in all_citizens.items() if cid != citizen_id}
-    yesterday = [e for e in chronicle.get_full_history()
-                 if isinstance(e, dict) and e.get("day") == day - 1][-10:]
 
-    if round_num == 1:
-        # 第1轮：完整世界状态
-        treasury_status = __import__("treasury").get_status()
-        open_needs = needs_module.get_open_needs()
+class WorldSnapshot:
+    """一轮的共享世界状态：金库、需求、提交/投票、广场、昨日事件。
+    每轮只读一次存储，共享段落预先渲染好；render() 只补个人部分
+    （余额、其他居民、按游标的增量）。串行轮次里居民行动后调 refresh()
+    重新读会变的部分（余额、需求、广场），下一个居民就能看到前面的人做了什么。
+    """
 
-        msg += f"世界金库：{treasury_status['balance']} token（预计还能维持 {treasury_status['days_left']} 天）\n"
+    def __init__(self, day, round_num=1, total_rounds=3):
+        self.day = day
+        self.round_num = round_num
+        self.total_rounds = total_rounds
+        self.stale = False
+        with storage.unit_of_work():
+            self.yesterday = chronicle.get_digest(day - 1)
+            self.treasury = __import__("treasury").get_status() if round_num == 1 else None
+            self._read_live()
+        self._yesterday_text = self._render_yesterday()
+        self._footer_text = self._render_footer()
+
+    def refresh(self):
+        """重新读取一轮内会变化的状态（只在有人行动过后才需要）"""
+        if not self.stale:
+            return
+        with storage.unit_of_work():
+            self._read_live()
+        self.stale = False
+
+    def _read_live(self):
+        self.citizens = dict(economy.get_all_citizens())
+        self._others_lines = None
+        self.cursors = dict(_cursor_store.get("citizens"))
+        self.open_needs = needs_module.get_open_needs()
+        self.recent_plaza = plaza.get_recent(10)
+        self.plaza_cursor = plaza.get_cursor()
+        self._plaza_since = {}
+        self._board_text = None
+        self._submissions_text = None
+        self._plaza_text = None
+        self._need_cursor = {
+            "submissions": {n["id"]: len(n.get("submissions", [])) for n in self.open_needs},
+            "votes": {n["id"]: dict(n.get("votes", {})) for n in self.open_needs},
+        }
+
+    def plaza_since(self, cursor):
+        """游标之后的广场发言；同一轮里大家的游标基本相同，只读一次"""
+        key = tuple(cursor) if cursor else None
+        if key not in self._plaza_since:
+            self._plaza_since[key] = plaza.get_since(cursor)[0]
+        return self._plaza_since[key]
+
+    def render(self, citizen_id):
+        """给某个居民的完整消息；休眠或未知居民返回 None"""
+        citizen_econ = self.citizens.get(citizen_id)
+        if not citizen_econ or not economy.is_active(citizen_id):
+            return None
+
+        balance = citizen_econ["balance"]
+        days_to_live = balance // 5
+
+        msg = f"== 第 {self.day} 天，第 {self.round_num}/{self.total_rounds} 轮 ==\n\n"
+        msg += f"你的状态：{balance} token，还能活 {days_to_live} 天。\n"
+
+        cursor = self.cursors.get(citizen_id) or {}
+        delta = self.round_num > 1 and cursor.get("day") == self.day
+
+        if self.round_num == 1:
+            if self._board_text is None:
+                self._board_text = self._render_board()
+            msg += self._board_text
+            msg += self._render_others(citizen_id)
+            msg += self._yesterday_text
+        elif delta:
+            msg += _render_submission_delta(citizen_id, self.open_needs, cursor)
+        else:
+            if self._submissions_text is None:
+                self._submissions_text = _render_submissions(self.open_needs)
+            msg += self._submissions_text
+            msg += self._render_others(citizen_id)
+            msg += self._yesterday_text
+
+        if delta:
+            msg += self._render_plaza_delta(citizen_id, cursor)
+        else:
+            if self._plaza_text is None:
+                self._plaza_text = self._render_plaza()
+            msg += self._plaza_text
+
+        msg += self._footer_text
+
+        _pending_cursors[citizen_id] = {
+            "day": self.day,
+            "plaza": self.plaza_cursor,
+            "submissions": self._need_cursor["submissions"] if self.round_num > 1 else {},
+            "votes": self._need_cursor["votes"] if self.round_num > 1 else {},
+        }
+        return msg
+
+    def _render_board(self):
+        treasury_status = self.treasury
+        text = f"世界金库：{treasury_status['balance']} token（预计还能维持 {treasury_status['days_left']} 天）\n"
         if not treasury_status['healthy']:
-            msg += "!! 金库告急！\n"
+            text += "!! 金库告急！\n"
 
-        msg += "\n== 公告板（世界需求）==\n"
-        if open_needs:
-            for need in open_needs:
+        text += "\n== 公告板（世界需求）==\n"
+        if self.open_needs:
+            for need in self.open_needs:
                 subs = need.get("submissions", [])
-                msg += f"- [{need['id']}] {need['title']}（奖励 {need['reward']} token，已有 {len(subs)} 人提交）\n"
-                msg += f"  说明：{need['desc']}\n"
+                text += f"- [{need['id']}] {need['title']}（奖励 {need['reward']} token，已有 {len(subs)} 人提交）\n"
+                text += f"  说明：{need['desc']}\n"
                 if need["id"] == "chronicle":
-                    msg += f"  提示：把今天广场上发生的事、居民行动、经济变化整理成记录，直接写在 submit_need 的 content 里。\n"
+                    text += f"  提示：把今天广场上发生的事、居民行动、经济变化整理成记录，直接写在 submit_need 的 content 里。\n"
                 elif need["id"] == "quality_review":
-                    msg += f"  提示：根据广场发言和今日已有提交，评估各居民产出质量，给出评分和建议，写在 content 里。\n"
+                    text += f"  提示：根据广场发言和今日已有提交，评估各居民产出质量，给出评分和建议，写在 content 里。\n"
                 elif need["id"] == "open_research":
-                    msg += f"  提示：研究任何你感兴趣的主题，把报告内容直接写在 content 里提交。\n"
+                    text += f"  提示：研究任何你感兴趣的主题，把报告内容直接写在 content 里提交。\n"
         else:
-            msg += "今天没有开放的需求\n"
-
-        msg += "\n== 其他居民 ==\n"
-        for cid, status in others.items():
-            msg += f"- {cid}: {status}\n"
-
-        if yesterday:
-            msg += "\n== 昨天发生了什么 ==\n"
-            for e in yesterday:
-                desc = e.get("description", str(e.get("summary", ""))[:100])
-                msg += f"- {desc}\n"
-
-    # 第2轮起显示已有提交，让居民能看到、评价、投票
-    if round_num > 1:
-        open_needs_now = needs_module.get_open_needs()
-        has_subs = any(n.get("submissions") for n in open_needs_now)
-        if has_subs:
-            msg += "\n== 今日已有提交（请投票选出最好的）==\n"
-            for need in open_needs_now:
-                subs = need.get("submissions", [])
-                if not subs:
-                    msg += f"[{need['id']}] {need['title']}：无人提交\n"
-                    continue
-                votes = need.get("votes", {})
-                msg += f"[{need['id']}] {need['title']}（{len(subs)}人提交，{len(votes)}票）：\n"
-                for s in subs:
-                    preview = s["content"][:300].replace("\n", " ")
-                    vote_count = sum(1 for v in votes.values() if v == s["citizen_id"])
-                    msg += f"  - {s['citizen_id']}（{vote_count}票）: {preview}\n"
+            text += "今天没有开放的需求\n"
+        return text
+
+    def _render_others(self, citizen_id):
+        text = "\n== 其他居民 ==\n"
+        if self._others_lines is None:
+            self._others_lines = [(cid, f"- {cid}: {self.citizens[cid]['status']}\n")
+                                  for cid in economy.citizen_ids() if cid in self.citizens]
+        text += "".join(line for cid, line in self._others_lines if cid != citizen_id)
+        return text
+
+    def _render_yesterday(self):
+        # 昨天的摘要日终时已经渲染好（chronicle.record_day）
+        if not self.yesterday or not self.yesterday["lines"]:
+            return ""
+        text = "\n== 昨天发生了什么 ==\n"
+        text += "".join(f"- {line}\n" for line in self.yesterday["lines"])
+        return text
+
+    def _render_plaza(self):
+        text = "\n== 广场最新发言 ==\n"
+        if self.recent_plaza:
+            for m in self.recent_plaza[-8:]:
+                text += f"- {m['citizen_id']}: {m['content'][:120]}\n"
         else:
-            msg += "\n== 今日提交 ==\n还没有人提交需求\n"
-
-        msg += "\n== 其他居民 ==\n"
-        for cid, status in others.items():
-            msg += f"- {cid}: {status}\n"
-
-        if yesterday:
-            msg += "\n== 昨天发生了什么 ==\n"
-            for e in yesterday:
-                desc = e.get("description", str(e.get("summary", ""))[:100])
-                msg += f"- {desc}\n"
-
-    # 所有轮次都显示广场最新发言
-    recent_plaza = plaza.get_recent(10)
-    msg += "\n== 广场最新发言 ==\n"
-    if recent_plaza:
-        for m in recent_plaza[-8:]:
-            msg += f"- {m['citizen_id']}: {m['content'][:120]}\n"
-    else:
-        msg += "还没有人发言\n"
-
-    msg += "\n== 请行动 ==\n"
-    if round_num == 1:
-        msg += "决定你今天要做什么。搜索信息后，用 submit_need 把报告内容直接提交到公告板任务（content字段放完整内容）。也可以在广场发言、和其他居民交易。\n"
-        msg += "注意：写文件不等于提交需求。要赚token必须用 submit_need 提交。\n"
-    else:
-        msg += "你可以：补充提交需求、为已有提交投票（vote）、回应广场发言、交易。\n"
-        msg += '投票很重要：用 {"type": "vote", "need_id": "...", "candidate": "C?"} 为你认为最好的提交投票。\n'
-        msg += "如果这轮不需要行动，回复 PASS。\n"
-    msg += "完成后用 ```json 代码块汇报你的行动。\n"
-
-    return msg
+            text += "还没有人发言\n"
+        return text
+
+    def _render_plaza_delta(self, citizen_id, cursor):
+        # 第2轮起只显示上轮之后别人的新发言
+        fresh = [m for m in self.plaza_since(cursor.get("plaza")) if m["citizen_id"] != citizen_id]
+        text = "\n== 广场新发言（自上轮以来）==\n"
+        if fresh:
+            if len(fresh) > 8:
+                text += f"（另有 {len(fresh) - 8} 条更早的新发言未显示）\n"
+            for m in fresh[-8:]:
+                text += f"- {m['citizen_id']}: {m['content'][:120]}\n"
+        else:
+            text += "没有新发言\n"
+        return text
+
+    def _render_footer(self):
+        text = "\n== 请行动 ==\n"
+        if self.round_num == 1:
+            text += "决定你今天要做什么。搜索信息后，用 submit_need 把报告内容直接提交到公告板任务（content字段放完整内容）。也可以在广场发言、和其他居民交易。\n"
+            text += "注意：写文件不等于提交需求。要赚token必须用 submit_need 提交。\n"
+        else:
+            text += "你可以：补充提交需求、为已有提交投票（vote）、回应广场发言、交易。\n"
+            text += '投票很重要：用 {"type": "vote", "need_id": "...", "candidate": "C?"} 为你认为最好的提交投票。\n'
+            text += "如果这轮不需要行动，回复 PASS。\n"
+        text += "完成后用 ```json 代码块汇报你的行动。\n"
+        return text
+
+
+def _render_submissions(open_needs):
+    """完整的提交列表（含每份提交的预览）"""
+    has_subs = any(n.get("submissions") for n in open_needs)
+    if not has_subs:
+        return "\n== 今日提交 ==\n还没有人提交需求\n"
+    text = "\n== 今日已有提交（请投票选出最好的）==\n"
+    for need in open_needs:
+        subs = need.get("submissions", [])
+        if not subs:
+            text += f"[{need['id']}] {need['title']}：无人提交\n"
+            continue
+        votes = need.get("votes", {})
+        text += f"[{need['id']}] {need['title']}（{len(subs)}人提交，{len(votes)}票）：\n"
+        counts = Counter(votes.values())
+        for s in subs:
+            preview = s["content"][:300].replace("\n", " ")
+            vote_count = counts[s["citizen_id"]]
+            text += f"  - {s['citizen_id']}（{vote_count}票）: {preview}\n"
+        text += _render_duplicates(subs)
+    return text
+
+
+def _render_duplicates(subs):
+    """重复提交分组（见 dedup.py）：同组只有原件参加评判"""
+    groups, past = {}, []
+    for s in subs:
+        dup = s.get("duplicate_of")
+        if not dup:
+            continue
+        if "day" in dup:
+            past.append(f"  重复：{s['citizen_id']} 的提交与第 {dup['day']} 天 {dup['need_id']} "
+                        f"的获胜提交（{dup['citizen_id']}）高度相似，不参加评判\n")
+        else:
+            groups.setdefault(dup["citizen_id"], []).append(s["citizen_id"])
+    lines = []
+    for original, copies in groups.items():
+        others = list(dict.fromkeys(c for c in copies if c != original))
+        if others:
+            lines.append(f"  重复：{'、'.join(others)} 的提交与 {original} 高度相似，评判只看 {original}\n")
+        if original in copies:
+            lines.append(f"  重复：{original} 多次提交了相似内容，评判只看第一份\n")
+    return "".join(lines + past)
+
+
+def _render_submission_delta(citizen_id, open_needs, cursor):
+    """只渲染游标之后的新提交（带预览）和新投票，旧提交压缩成一行票数"""
+    seen_subs = cursor.get("submissions", {})
+    seen_votes = cursor.get("votes", {})
+    text = "\n== 提交和投票（自上轮以来的变化）==\n"
+    changed = False
+    for need in open_needs:
+        subs = need.get("submissions", [])
+        votes = need.get("votes", {})
+        if not subs:
+            text += f"[{need['id']}] {need['title']}：无人提交\n"
+            continue
+        authors = dict.fromkeys(s["citizen_id"] for s in subs)
+        counts = Counter(votes.values())
+        tally = "，".join(f"{cid} {counts[cid]}票" for cid in authors)
+        text += f"[{need['id']}] {need['title']}（{len(subs)}人提交，{len(votes)}票）：{tally}\n"
+        for s in subs[seen_subs.get(need["id"], 0):]:
+            if s["citizen_id"] == citizen_id:
+                continue
+            preview = s["content"][:300].replace("\n", " ")
+            text += f"  - 新提交 {s['citizen_id']}: {preview}\n"
+            changed = True
+        old_votes = seen_votes.get(need["id"], {})
+        for voter, candidate in votes.items():
+            if voter != citizen_id and old_votes.get(voter) != candidate:
+                text += f"  - 新投票 {voter} → {candidate}\n"
+                changed = True
+        text += _render_duplicates(subs)
+    if not changed:
+        text += "（自上轮以来没有新提交和新投票）\n"
+    return text
 
 
 # ============================================================
 # 调用OpenClaw agent
 # ============================================================
 
-def call_agent(citizen_id, message):
-    """给居民对应的 openclaw agent 发消息，拿回回复。"""
-    agent_name = AGENT_MAP.get(citizen_id)
+def _agent_command(citizen_id, message, timeout=ACTION_TIMEOUT):
+    """构建 openclaw agent 命令行和环境变量。未知居民返回 (None, None)。"""
+    agent_name = economy.agent_of(citizen_id)
     if not agent_name:
-        return None, "未知居民"
+        return None, None
 
     session_id = f"{SESSION_PREFIX}-{agent_name}"
     cmd = [
@@ -238,79 +422,213 @@ def call_agent(citizen_id, message):
         "--message", message,
         "--local",
         "--json",
-        "--timeout", str(ACTION_TIMEOUT),
+        "--timeout", str(deadlines.agent_timeout(timeout)),
     ]
 
     # 限制Node.js堆内存，防止OOM
     env = os.environ.copy()
     env["NODE_OPTIONS"] = "--max-old-space-size=256"
+    return cmd, env
 
+
+def _parse_agent_output(citizen_id, returncode, stdout, stderr):
+    """把 openclaw 进程输出转成 (回复文本, 错误)"""
+    if returncode != 0:
+        error = stderr[:200] if stderr else "未知错误"
+        print(f"  [{citizen_id}] agent返回错误: {error}")
+        return None, error
+
+    try:
+        output = json.loads(stdout)
+        texts = [p["text"] for p in output.get("payloads", []) if p.get("text")]
+        return "\n".join(texts), None
+    except json.JSONDecodeError:
+        return stdout, None
+
+
+def call_agent(citizen_id, message, timeout=None, turn=None, on_chunk=None):
+    """给居民对应的 openclaw agent 发消息，拿回回复。
+    timeout：本回合截止时间（秒，墙钟），到点取消；默认 ACTION_TIMEOUT。
+    turn：(天, 轮)，录放带按回合录制/回放时用（见 cassette.py）。
+    on_chunk：后端边生成边输出时（pool worker 的分块回复），每收到一段就回调一次；
+    所有分块拼起来就是最终回复。其他后端不回调。"""
+    if cassette.MODE == "replay":
+        return cassette.replay(citizen_id, message, turn)
+    reply, error = _call_agent_live(citizen_id, message, timeout, on_chunk)
+    if cassette.MODE == "record":
+        cassette.record(citizen_id, message, turn, reply, error)
+    return reply, error
+
+
+def _call_agent_live(citizen_id, message, timeout=None, on_chunk=None):
+    timeout = timeout or ACTION_TIMEOUT
+    if AGENT_BACKEND == "fake":
+        started = time.monotonic()
+        reply, error = fake_agent.reply(citizen_id, message, timeout)
+        _record_latency(citizen_id, time.monotonic() - started, timeout, error)
+        return reply, error
+    if AGENT_BACKEND == "pool":
+        started = time.monotonic()
+        reply, error = _call_worker(citizen_id, message, timeout, on_chunk)
+        _record_latency(citizen_id, time.monotonic() - started, timeout, error)
+        return reply, error
+
+    cmd, env = _agent_command(citizen_id, message, timeout)
+    if not cmd:
+        return None, "未知居民"
+
+    started = time.monotonic()
     try:
         result = subprocess.run(
             cmd, capture_output=True, text=True,
-            timeout=ACTION_TIMEOUT + 30,
+            timeout=timeout,
             env=env,
         )
-        if result.returncode != 0:
-            error = result.stderr[:200] if result.stderr else "未知错误"
-            print(f"  [{citizen_id}] agent返回错误: {error}")
-            return None, error
-
-        try:
-            output = json.loads(result.stdout)
-            texts = [p["text"] for p in output.get("payloads", []) if p.get("text")]
-            return "\n".join(texts), None
-        except json.JSONDecodeError:
-            return result.stdout, None
+        reply, error = _parse_agent_output(citizen_id, result.returncode, result.stdout, result.stderr)
+        _record_latency(citizen_id, time.monotonic() - started, timeout, error)
+        return reply, error
 
-    except subprocess.TimeoutExpired:
-        return None, f"超时（{ACTION_TIMEOUT}秒）"
+    except subprocess.TimeoutExpired as e:
+        return _timed_out(citizen_id, timeout, e.stdout)
     except FileNotFoundError:
         return None, "openclaw命令未找到"
     except Exception as e:
         return None, str(e)
 
 
+def _call_worker(citizen_id, message, timeout=ACTION_TIMEOUT, on_chunk=None):
+    agent_name = economy.agent_of(citizen_id)
+    if not agent_name:
+        return None, "未知居民"
+    return worker_pool.get_pool().request(
+        citizen_id, agent_name, f"{SESSION_PREFIX}-{agent_name}", message,
+        timeout, deadlines.agent_timeout(timeout), on_chunk=on_chunk)
+
+
+async def call_agent_async(citizen_id, message, agent_scheduler, timeout=None, turn=None):
+    """call_agent 的异步版本：子进程由调度器按内存预算和并发上限放行。
+    截止时间从准入后开始算，排队时间不计入。"""
+    if cassette.MODE == "replay":
+        return cassette.replay(citizen_id, message, turn)
+    reply, error = await _call_agent_live_async(citizen_id, message, agent_scheduler, timeout)
+    if cassette.MODE == "record":
+        cassette.record(citizen_id, message, turn, reply, error)
+    return reply, error
+
+
+async def _call_agent_live_async(citizen_id, message, agent_scheduler, timeout=None):
+    timeout = timeout or ACTION_TIMEOUT
+    if AGENT_BACKEND == "fake":
+        started = time.monotonic()
+        reply, error = await fake_agent.reply_async(citizen_id, message, timeout)
+        _record_latency(citizen_id, time.monotonic() - started, timeout, error)
+        return reply, error
+    if AGENT_BACKEND == "pool":
+        # 常驻 worker 不再新起进程，不经过内存准入
+        started = time.monotonic()
+        reply, error = await asyncio.to_thread(_call_worker, citizen_id, message, timeout)
+        _record_latency(citizen_id, time.monotonic() - started, timeout, error)
+        return reply, error
+
+    cmd, env = _agent_command(citizen_id, message, timeout)
+    if not cmd:
+        return None, "未知居民"
+
+    try:
+        returncode, stdout, stderr, elapsed = await agent_scheduler.run(
+            citizen_id, cmd, env=env, timeout=timeout)
+        reply, error = _parse_agent_output(citizen_id, returncode, stdout, stderr)
+        _record_latency(citizen_id, elapsed, timeout, error)
+        return reply, error
+
+    except scheduler.AgentTimeout as e:
+        return _timed_out(citizen_id, timeout, e.partial)
+    except FileNotFoundError:
+        return None, "openclaw命令未找到"
+    except Exception as e:
+        return None, str(e)
+
+
+def health_check(citizen_id):
+    """廉价的健康检查，给熔断器探测用：健康返回 None，否则返回错误信息。
+    cli：openclaw 能启动（--version）；pool：worker 能启动并应答 ping。"""
+    agent_name = economy.agent_of(citizen_id)
+    if not agent_name:
+        return "未知居民"
+    if cassette.MODE == "replay" or AGENT_BACKEND == "fake":
+        return None  # 回放和模拟居民不依赖 openclaw
+    if AGENT_BACKEND == "pool":
+        _, error = worker_pool.get_pool().request(
+            citizen_id, agent_name, f"{SESSION_PREFIX}-{agent_name}", None,
+            HEALTH_TIMEOUT, ping=True)
+        return error
+    try:
+        result = subprocess.run(["openclaw", "--version"], capture_output=True,
+                                text=True, timeout=HEALTH_TIMEOUT)
+    except FileNotFoundError:
+        return "openclaw命令未找到"
+    except subprocess.TimeoutExpired:
+        return f"健康检查超时（{HEALTH_TIMEOUT}秒）"
+    except Exception as e:
+        return str(e)
+    if result.returncode != 0:
+        return result.stderr[:200] if result.stderr else "未知错误"
+    return None
+
+
+def _record_latency(citizen_id, elapsed, timeout, error):
+    """成功的调用和超时计入耗时直方图；其他错误（命令不存在、崩溃）不计"""
+    if error is None:
+        deadlines.record(citizen_id, elapsed)
+    elif deadlines.is_timeout(elapsed, timeout):
+        deadlines.record(citizen_id, timeout, timed_out=True)
+
+
+def _timed_out(citizen_id, timeout, partial):
+    """截止时间到、进程已被取消：记一次超时，把已经输出的部分记进日志"""
+    deadlines.record(citizen_id, timeout, timed_out=True)
+    if isinstance(partial, bytes):
+        partial = partial.decode("utf-8", errors="replace")
+    if partial:
+        preview = partial.strip().replace("\n", " ")[:80]
+        print(f"  [{citizen_id}] 超时取消，已输出 {len(partial)} 字: {preview}")
+    return None, f"超时（{timeout}秒）"
+
+
 # ============================================================
 # 解析行动 + 执行行动
 # ============================================================
 
 def extract_actions(text):
-    """从agent回复中提取行动JSON。只认 ```json 块和裸JSON数组。"""
+    """从agent回复中提取行动JSON。只认 ```json 块和裸JSON数组（见 action_stream.py）。"""
     if not text:
         return []
+    actions = action_stream.extract(text)
+    # 不再降级：如果agent没返回JSON，就是没有行动
+    if not actions:
+        _warn_no_actions(text)
+    return actions
 
-    actions = []
-    # 第1层：找 ```json 块
-    for match in re.findall(r'```json\s*(.*?)\s*```', text, re.DOTALL):
-        try:
-            parsed = json.loads(match)
-            if isinstance(parsed, list):
-                actions.extend(parsed)
-            elif isinstance(parsed, dict):
-                actions.append(parsed)
-        except json.JSONDecodeError:
-            continue
 
-    # 第2层：找裸JSON数组
-    if not actions:
-        for match in re.findall(r'\[\s*\{.*?\}\s*\]', text, re.DOTALL):
-            try:
-                parsed = json.loads(match)
-                if isinstance(parsed, list):
-                    actions.extend(parsed)
-            except json.JSONDecodeError:
-                continue
+def _is_pass(text):
+    return bool(text) and text.strip().upper().startswith("PASS")
 
-    # 不再降级：如果agent没返回JSON，就是没有行动
-    if not actions and text.strip() and not text.strip().upper().startswith("PASS"):
+
+def _warn_no_actions(text):
+    if text and text.strip() and not _is_pass(text):
         print(f"  [警告] 未提取到行动JSON，回复前80字: {text.strip()[:80]}")
 
-    return actions
 
+def process_action(citizen_id, action, day=0, events=None):
+    """处理居民的一个行动。
+    events：传入列表时编年史事件只收集进去，由调用方批量写入（见 apply_actions）。"""
+    def note(event_type, description):
+        event = chronicle.make_event(day, event_type, description, citizen_id)
+        if events is None:
+            chronicle.record_events([event])
+        else:
+            events.append(event)
 
-def process_action(citizen_id, action, day=0):
-    """处理居民的一个行动。"""
     action_type = action.get("type")
 
     if action_type == "plaza_speak":
@@ -321,8 +639,7 @@ def process_action(citizen_id, action, day=0):
             action.get("need_id"), citizen_id, action.get("content", "")
         )
         if result:
-            chronicle.record_event(day, "submission",
-                f"{citizen_id} 提交了 '{action.get('need_id')}'", citizen_id)
+            note("submission", f"{citizen_id} 提交了 '{action.get('need_id')}'")
         return result
 
     elif action_type == "vote":
@@ -330,8 +647,7 @@ def process_action(citizen_id, action, day=0):
             action.get("need_id"), citizen_id, action.get("candidate", "")
         )
         if result:
-            chronicle.record_event(day, "vote",
-                f"{citizen_id} 投票给 {action.get('candidate')}（{action.get('need_id')}）", citizen_id)
+            note("vote", f"{citizen_id} 投票给 {action.get('candidate')}（{action.get('need_id')}）")
         return result
 
     elif action_type == "pay":
@@ -340,8 +656,7 @@ def process_action(citizen_id, action, day=0):
             action.get("amount", 0), action.get("reason", "")
         )
         if result:
-            chronicle.record_event(day, "transaction",
-                f"{citizen_id} 向 {action.get('to')} 转账 {action.get('amount')} token", citizen_id)
+            note("transaction", f"{citizen_id} 向 {action.get('to')} 转账 {action.get('amount')} token")
         return result
 
     elif action_type == "register_output":
@@ -349,66 +664,232 @@ def process_action(citizen_id, action, day=0):
             citizen_id, action.get("output_type", "unknown"),
             action.get("title", ""), action.get("content_path", ""), day
         )
-        chronicle.record_event(day, "output",
-            f"{citizen_id} 登记了外部产出: {action.get('title', '')}", citizen_id)
+        note("output", f"{citizen_id} 登记了外部产出: {action.get('title', '')}")
         return result
 
     else:
-        chronicle.record_event(day, "unknown_action",
-            f"{citizen_id} 尝试了: {action_type}", citizen_id)
+        note("unknown_action", f"{citizen_id} 尝试了: {action_type}")
         return {"error": f"未知行动: {action_type}"}
 
 
+def apply_actions(batch, day):
+    """批量执行行动：batch 是 [(居民, 行动), ...]，按顺序执行。
+    整批在一个工作单元里：每个受影响的 store 只提交一次，编年史事件最后一次性追加。
+    返回每个行动的 {"action", "result"}，和逐个 process_action 的结果一样。"""
+    events = []
+    with storage.unit_of_work():
+        results = [_apply_one(citizen_id, action, day, events) for citizen_id, action in batch]
+        chronicle.record_events(events)
+    return results
+
+
 # ============================================================
 # 完整的居民回合
 # ============================================================
 
-def run_citizen_turn(citizen_id, day, round_num=1, total_rounds=3):
-    """一个居民的完整回合：构建消息 -> 调agent -> 提取行动 -> 执行行动。"""
-    message = build_daily_message(citizen_id, day, round_num, total_rounds)
+def run_citizen_turn(citizen_id, day, round_num=1, total_rounds=3, snapshot=None, budget=None):
+    """一个居民的完整回合：构建消息 -> 调agent -> 提取行动 -> 执行行动。
+    构建消息是一个工作单元；执行行动是另一个：流式的和最后剩下的行动一起提交一次，
+    编年史事件也只追加一次，每个行动都和批量执行一样先经过 _apply_one 的校验。
+    执行行动的工作单元在第一个流式行动到达时才打开，在此之前调 agent 期间不持有缓存，
+    避免覆盖这段时间里别处（如 human.py）的写入；不流式的回复等 agent 结束再打开。
+    snapshot：本轮共享的 WorldSnapshot（串行轮次里每个居民行动后会标记需要刷新）。
+    budget：当天的 deadlines.DayBudget，截止时间不超过它的剩余份额。
+    """
+    if snapshot is not None:
+        snapshot.refresh()
+    with storage.unit_of_work():
+        message = build_daily_message(citizen_id, day, round_num, total_rounds, snapshot)
     if message is None:
         print(f"  [{citizen_id}] 休眠中，跳过")
         return []
+    if not _breaker_allows(citizen_id, day):
+        return []
+
+    timeout = deadlines.deadline(citizen_id, budget)
+    results = []
+    events = []
+    with contextlib.ExitStack() as turn:
+        def apply_now(action):
+            # 流式回复里先闭合的行动立刻执行，不等 agent 结束；写入留在本回合的工作单元里
+            if not results:
+                turn.enter_context(storage.unit_of_work())
+            results.append(_apply_one(citizen_id, action, day, events))
+
+        started = time.monotonic()
+        actions = ask_agent(citizen_id, message, timeout, (day, round_num), on_action=apply_now)
+        if budget is not None:
+            budget.spend(time.monotonic() - started)
+        if not results:
+            turn.enter_context(storage.unit_of_work())
+        results += [_apply_one(citizen_id, action, day, events) for action in actions]
+        chronicle.record_events(events)
+    if snapshot is not None and results:
+        snapshot.stale = True  # 后面的居民要能看到这次的行动
+    return results
 
-    print(f"  [{citizen_id}] 思考中...")
-    reply, error = call_agent(citizen_id, message)
 
+def ask_agent(citizen_id, message, timeout=None, turn=(0, 0), on_action=None):
+    """调 agent 并解析出行动列表（出错、PASS、无行动都返回空列表）。turn = (天, 轮)。
+    on_action：回复是流式的时候，每个 ```json 行动一闭合就回调，不等 agent 结束；
+    回调过的行动不再出现在返回值里。
+    和一次性解析的区别：以 PASS 开头的回复一个行动都不回调（和原来一样整份作废），
+    但 agent 在行动之后才出错或超时的，出错前已经回调的行动不会撤销。"""
+    print(f"  [{citizen_id}] 思考中...{_deadline_note(timeout)}")
+    scanner = on_chunk = None
+    if on_action is not None:
+        scanner = action_stream.ActionScanner()
+
+        def on_chunk(chunk):
+            actions = scanner.feed(chunk)
+            # 行动对象闭合时回复开头一定已经到了，PASS 与否这时就能判断
+            if actions and _is_pass(scanner.head):
+                scanner.emitted -= len(actions)
+                return
+            for action in actions:
+                on_action(action)
+
+    reply, error = call_agent(citizen_id, message, timeout, turn, on_chunk)
+    breaker.record(citizen_id, turn[0], error)
+    return _reply_actions(citizen_id, reply, error, scanner)
+
+
+async def ask_agent_async(citizen_id, message, agent_scheduler, timeout=None, turn=(0, 0)):
+    print(f"  [{citizen_id}] 思考中...{_deadline_note(timeout)}")
+    reply, error = await call_agent_async(citizen_id, message, agent_scheduler, timeout, turn)
+    breaker.record(citizen_id, turn[0], error)
+    return _reply_actions(citizen_id, reply, error)
+
+
+def _breaker_allows(citizen_id, day):
+    """熔断中的居民跳过本回合（退避到期时先做健康检查）"""
+    if breaker.allow(citizen_id, day, lambda: health_check(citizen_id)):
+        return True
+    _pending_cursors.pop(citizen_id, None)
+    print(f"  [{citizen_id}] agent 熔断中，跳过")
+    return False
+
+
+def _deadline_note(timeout):
+    return f"（限时 {timeout} 秒）" if timeout and timeout < ACTION_TIMEOUT else ""
+
+
+def _reply_actions(citizen_id, reply, error, scanner=None):
+    """scanner：流式回复用过的 ActionScanner，它已经交出的行动不再返回"""
+    streamed = scanner.emitted if scanner is not None else 0
     if error:
+        _pending_cursors.pop(citizen_id, None)
         print(f"  [{citizen_id}] 错误: {error}")
+        if streamed:
+            print(f"  [{citizen_id}] 出错前已执行 {streamed} 个流式行动")
         return []
 
+    # agent 收到了这轮消息，推进它的阅读游标
+    _commit_cursor(citizen_id)
+
     # 居民选择跳过本轮
-    if reply and reply.strip().upper().startswith("PASS"):
+    if _is_pass(reply):
         print(f"  [{citizen_id}] PASS")
         return []
 
-    actions = extract_actions(reply)
-    if actions:
-        print(f"  [{citizen_id}] 返回 {len(actions)} 个行动")
+    if scanner is not None and scanner.received:
+        actions = scanner.close()
+        if not streamed and not actions:
+            _warn_no_actions(reply)
+    else:
+        actions = extract_actions(reply)
+    if streamed or actions:
+        print(f"  [{citizen_id}] 返回 {streamed + len(actions)} 个行动")
     else:
         print(f"  [{citizen_id}] 无有效行动")
+    return actions
 
-    results = []
-    for action in actions:
-        result = process_action(citizen_id, action, day)
-        results.append({"action": action, "result": result})
-        atype = action.get("type", "?")
-        if atype == "vote":
-            print(f"  [{citizen_id}] 行动: vote -> {action.get('candidate')}（{action.get('need_id')}）")
-        else:
-            print(f"  [{citizen_id}] 行动: {atype}")
 
+def _apply_one(citizen_id, action, day, events=None):
+    if not isinstance(action, dict):
+        print(f"  [{citizen_id}] 无效行动: {str(action)[:40]}")
+        return {"action": action, "result": {"error": "行动格式无效"}}
+    result = process_action(citizen_id, action, day, events)
+    atype = action.get("type", "?")
+    if atype == "vote":
+        print(f"  [{citizen_id}] 行动: vote -> {action.get('candidate')}（{action.get('need_id')}）")
+    else:
+        print(f"  [{citizen_id}] 行动: {atype}")
+    return {"action": action, "result": result}
+
+
+# ============================================================
+# 快照并行轮次
+# ============================================================
+
+# 并行轮次的执行顺序：先落地发言/提交/产出，再投票，最后转账。
+# 这样同一轮里的投票总能看到本轮所有提交，不受居民顺序影响；
+# 转账按居民顺序依次检查余额，余额不足的那笔被拒绝。
+APPLY_PHASES = [("plaza_speak", "submit_need", "register_output"), ("vote",), ("pay",)]
+
+
+def run_round_parallel(citizen_ids, day, round_num=1, total_rounds=3, budget=None):
+    """一轮里所有居民同时行动：
+    1. 从同一份冻结的世界快照给每个活跃居民生成消息
+    2. 所有 agent 并发调用（scheduler 按内存预算/并发上限放行），轮次耗时 ≈ 最慢的那个
+    3. 全部返回后按 APPLY_PHASES、居民顺序确定性地执行行动
+    每人按自己的截止时间取消，轮次耗时不超过其中最大的那个（受 budget 限制）。
+    返回 {citizen_id: [{"action", "result"}, ...]}，每人结果保持其行动原顺序。
+    """
+    snapshot = WorldSnapshot(day, round_num, total_rounds)
+    messages = {cid: snapshot.render(cid) for cid in citizen_ids}
+    for cid in citizen_ids:
+        if messages[cid] is None:
+            print(f"  [{cid}] 休眠中，跳过")
+    active = [cid for cid in citizen_ids
+              if messages[cid] is not None and _breaker_allows(cid, day)]
+
+    timeouts = {cid: deadlines.deadline(cid, budget) for cid in active}
+    started = time.monotonic()
+    replies = asyncio.run(_ask_round(active, messages, timeouts, (day, round_num))) if active else {}
+    if budget is not None:
+        budget.spend(time.monotonic() - started)
+
+    results = {cid: [None] * len(replies.get(cid, [])) for cid in citizen_ids}
+    order, placed = [], set()
+    for phase in APPLY_PHASES + [None]:
+        for cid in active:
+            for i, action in enumerate(replies[cid]):
+                if (cid, i) in placed or (phase and action.get("type") not in phase):
+                    continue
+                placed.add((cid, i))
+                order.append((cid, i))
+    batch = [(cid, replies[cid][i]) for cid, i in order]
+    for (cid, i), result in zip(order, apply_actions(batch, day)):
+        results[cid][i] = result
     return results
 
 
+async def _ask_round(active, messages, timeouts=None, turn=(0, 0)):
+    """同一轮所有居民的 agent 调用，由一个调度器统一做内存准入"""
+    agent_scheduler = scheduler.AgentScheduler()
+    timeouts = timeouts or {}
+    outcomes = await asyncio.gather(
+        *(ask_agent_async(cid, messages[cid], agent_scheduler, timeouts.get(cid), turn)
+          for cid in active),
+        return_exceptions=True)
+    replies = {}
+    for cid, outcome in zip(active, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"  [{cid}] 异常: {outcome}")
+            outcome = []
+        replies[cid] = outcome
+    return replies
+
+
 # ============================================================
 # 居民注册（创世用）
 # ============================================================
 
-def register(citizen_id, is_human=False):
-    """注册新居民到经济系统"""
-    economy.register_citizen(citizen_id)
+def register(citizen_id, is_human=False, agent=None, day=0):
+    """注册新居民到经济系统。agent 默认是居民编号的小写（C7 → c7）。"""
+    economy.register_citizen(citizen_id, None if is_human else (agent or citizen_id.lower()))
     if not is_human:
         init_soul(citizen_id)
-    chronicle.record_event(0, "birth", f"居民 {citizen_id} 来到了这个世界", citizen_id)
+    chronicle.record_event(day, "birth", f"居民 {citizen_id} 来到了这个世界", citizen_id)
     return citizen_id
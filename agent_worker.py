@@ -0,0 +1,99 @@
+"""
+常驻 agent 进程 - 居民的长连接 worker
+stdin/stdout 上逐行收发 JSON：
+  请求  {"id": 1, "message": "...", "timeout": 90}   （timeout 可省，默认 --timeout）
+  分块  {"id": 1, "chunk": "..."}                    （可选，边生成边发，拼起来等于 text）
+  回复  {"id": 1, "text": "...", "error": null}
+  探活  {"id": 2, "ping": true} → {"id": 2, "text": "pong", "error": null}
+
+用法：
+  python agent_worker.py --agent c1            → 每个请求转交 openclaw agent（兼容模式）
+  python agent_worker.py --agent c1 --stub     → 本地桩：不需要安装 openclaw，回固定格式的行动（逐行分块发送）
+  python agent_worker.py --agent c1 --stub --delay 0.5
+
+worker_pool 只依赖这个行协议。openclaw 若提供常驻模式，把
+GENESIS_AGENT_WORKER 指向它即可省掉每回合的 Node 启动和 session 重建；
+不带 --stub 的转发模式（GENESIS_AGENT_WORKER=forward）每个请求仍启动一次 openclaw。
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+
+
+def _stub_reply(agent, message):
+    """桩回复：在广场打招呼，第1轮提交公告板上的第一个需求"""
+    citizen_id = agent.upper()
+    actions = [{"type": "plaza_speak", "content": f"{citizen_id} 在线"}]
+    need = re.search(r"^- \[(\w+)\]", message, re.MULTILINE)
+    if need and "第 1/" in message:
+        actions.append({"type": "submit_need", "need_id": need.group(1),
+                        "content": f"{citizen_id} 的桩报告"})
+    body = ",\n".join(json.dumps(a, ensure_ascii=False) for a in actions)
+    return "```json\n[\n" + body + "\n]\n```"
+
+
+def _openclaw_reply(agent, session_id, message, timeout):
+    result = subprocess.run(
+        ["openclaw", "agent", "--agent", agent, "--session-id", session_id,
+         "--message", message, "--local", "--json", "--timeout", str(timeout)],
+        capture_output=True, text=True, timeout=timeout + 30,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[:200] if result.stderr else "未知错误")
+    try:
+        output = json.loads(result.stdout)
+        return "\n".join(p["text"] for p in output.get("payloads", []) if p.get("text"))
+    except json.JSONDecodeError:
+        return result.stdout
+
+
+def _send(stdout, obj):
+    stdout.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agent", required=True)
+    parser.add_argument("--session-id", default=None)
+    parser.add_argument("--timeout", type=int, default=120)
+    parser.add_argument("--stub", action="store_true")
+    parser.add_argument("--delay", type=float, default=0)
+    args = parser.parse_args()
+    session_id = args.session_id or f"genesis-{args.agent}"
+
+    stdin = open(sys.stdin.fileno(), "r", encoding="utf-8", closefd=False)
+    stdout = open(sys.stdout.fileno(), "w", encoding="utf-8", closefd=False)
+    for line in stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        reply = {"id": request.get("id"), "text": None, "error": None}
+        timeout = request.get("timeout") or args.timeout
+        try:
+            if request.get("ping"):
+                reply["text"] = "pong"
+            elif args.stub:
+                text = _stub_reply(args.agent, request.get("message", ""))
+                lines = text.splitlines(keepends=True)
+                for line in lines:
+                    time.sleep(args.delay / len(lines))
+                    _send(stdout, {"id": request.get("id"), "chunk": line})
+                reply["text"] = text
+            else:
+                reply["text"] = _openclaw_reply(args.agent, session_id,
+                                                request.get("message", ""), timeout)
+        except FileNotFoundError:
+            reply["error"] = "openclaw命令未找到"
+        except subprocess.TimeoutExpired:
+            reply["error"] = f"超时（{timeout}秒）"
+        except Exception as e:
+            reply["error"] = str(e)
+        _send(stdout, reply)
+
+
+if __name__ == "__main__":
+    main()
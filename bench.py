@@ -0,0 +1,150 @@
+"""
+基准测试 - 用模拟居民（fake_agent.py）跑 main.run_day，找人口增长时的性能断崖
+
+用法：
+  python bench.py                                  → 5 个居民跑 3 天
+  python bench.py --days 3 --citizens 5,50,500
+  python bench.py --citizens 50 --storage sqlite --parallel --latency 0.2
+
+每个规模在独立子进程、独立的临时世界目录里跑（不碰当前目录的 data/），报告：
+  墙钟时间、run_day 各阶段耗时（main.PHASE_TIMES）、
+  读写字节数（/proc/self/io 的 rchar/wchar）、峰值内存（ru_maxrss）。
+评判默认换成本地确定性规则（不调评判模型），--real-judge 保留原评判。
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _io_bytes():
+    """本进程累计读/写字节数；非 Linux 返回 (0, 0)"""
+    counters = {}
+    try:
+        with open("/proc/self/io", "r", encoding="utf-8") as f:
+            for line in f:
+                name, value = line.split(":")
+                counters[name] = int(value)
+    except OSError:
+        pass
+    return counters.get("rchar", 0), counters.get("wchar", 0)
+
+
+def _fake_judge(need_title, need_desc, submissions, strict=False):
+    """确定性评判：内容最长的胜出，一样长取先提交的"""
+    return max(submissions, key=lambda s: len(s["content"]))["citizen_id"]
+
+
+def run_one(args, world):
+    """在 world 目录里用 args.citizens 个模拟居民跑 args.days 天，返回测量结果"""
+    os.environ["GENESIS_AGENT_BACKEND"] = "fake"
+    os.environ["GENESIS_STORAGE"] = args.storage
+    os.environ["GENESIS_PARALLEL_ROUNDS"] = "1" if args.parallel else "0"
+    os.environ["GENESIS_FAKE_LATENCY"] = str(args.latency)
+    os.environ["GENESIS_FAKE_CHARS"] = str(args.chars)
+    os.environ["GENESIS_FAKE_ERROR_RATE"] = str(args.error_rate)
+    os.chdir(world)
+    sys.path.insert(0, HERE)
+
+    import main
+    import needs
+    import publish
+
+    main.GENESIS_CITIZENS = [f"C{i}" for i in range(1, args.citizens + 1)]
+    publish.OUTPUT_REPO = os.path.join(world, "site")
+    if not args.real_judge:
+        needs._llm_judge = _fake_judge
+
+    out = sys.stdout
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        main.init_world()
+        read0, written0 = _io_bytes()
+        started = time.perf_counter()
+        days = 0
+        for day in range(1, args.days + 1):
+            days += 1
+            if not main.run_day(day):
+                break
+        wall = time.perf_counter() - started
+        read1, written1 = _io_bytes()
+
+    result = {
+        "citizens": args.citizens,
+        "days": days,
+        "wall": round(wall, 3),
+        "phases": {k: round(v, 3) for k, v in main.PHASE_TIMES.items()},
+        "read_bytes": read1 - read0,
+        "written_bytes": written1 - written0,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    out.write(json.dumps(result) + "\n")
+    return result
+
+
+def _report(results):
+    print(f"{'居民':>6} {'天数':>4} {'墙钟(s)':>9} {'每天(s)':>9} {'读(MB)':>9} {'写(MB)':>9} {'峰值RSS(MB)':>12}")
+    for r in results:
+        per_day = r["wall"] / max(r["days"], 1)
+        print(f"{r['citizens']:>6} {r['days']:>4} {r['wall']:>9.2f} {per_day:>9.2f} "
+              f"{r['read_bytes'] / 1e6:>9.2f} {r['written_bytes'] / 1e6:>9.2f} {r['peak_rss_mb']:>12.1f}")
+    print()
+    for r in results:
+        phases = "  ".join(f"{k} {v:.2f}s" for k, v in r["phases"].items())
+        print(f"  {r['citizens']} 居民: {phases}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenClaw Genesis 世界引擎基准测试")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--citizens", default="5", help="居民数，逗号分隔可跑多个规模，如 5,50,500")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--parallel", action="store_true", help="快照并行轮次")
+    parser.add_argument("--latency", type=float, default=0, help="模拟 agent 平均耗时（秒）")
+    parser.add_argument("--chars", type=int, default=400, help="模拟发言/提交长度")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--real-judge", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="保留临时世界目录")
+    parser.add_argument("--one", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--world", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        args.citizens = int(args.citizens)
+        run_one(args, args.world)
+        return
+
+    results = []
+    for size in [int(x) for x in args.citizens.split(",") if x.strip()]:
+        world = tempfile.mkdtemp(prefix=f"genesis-bench-{size}-")
+        cmd = [sys.executable, os.path.abspath(__file__), "--one", "--world", world,
+               "--citizens", str(size), "--days", str(args.days), "--storage", args.storage,
+               "--latency", str(args.latency), "--chars", str(args.chars),
+               "--error-rate", str(args.error_rate)]
+        cmd += ["--parallel"] if args.parallel else []
+        cmd += ["--real-judge"] if args.real_judge else []
+        print(f"[基准] {size} 居民 × {args.days} 天 ...", flush=True)
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[基准] {size} 居民失败:\n{proc.stderr[-2000:]}")
+        else:
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if args.keep:
+            print(f"  世界目录: {world}")
+        else:
+            shutil.rmtree(world, ignore_errors=True)
+
+    if results:
+        print()
+        _report(results)
+
+
+if __name__ == "__main__":
+    main()
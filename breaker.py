@@ -0,0 +1,86 @@
+"""
+熔断器 - 连续失败的居民 agent 暂停调用
+agent 连续失败 FAILURE_THRESHOLD 次（命令不存在、非零退出、超时）后熔断（open）：
+跳过它的回合，不再每轮白等一个截止时间。
+退避时间到了先做一次廉价的健康检查，通过就半开（half_open）放行一个真实回合：
+成功 → 恢复（closed）；失败 → 重新熔断，退避时间翻倍。
+状态跨天保存，每次状态切换记进编年史。
+"""
+import os
+import time
+
+import storage
+import chronicle
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# 连续失败多少次熔断
+FAILURE_THRESHOLD = int(os.environ.get("GENESIS_BREAKER_FAILURES", "3"))
+# 第一次熔断后多久探测（秒），之后每次翻倍，最多 BACKOFF_MAX
+BACKOFF_BASE = 600
+BACKOFF_MAX = 24 * 3600
+
+_store = storage.Store("breaker", lambda: {"citizens": {}}, maps=("citizens",))
+
+_TRANSITIONS = {
+    OPEN: ("agent_circuit_open", "{cid} 的 agent 连续失败 {failures} 次，暂停调用（{backoff} 秒后探测）：{error}"),
+    HALF_OPEN: ("agent_circuit_half_open", "{cid} 的 agent 健康检查通过，试运行一个回合"),
+    CLOSED: ("agent_circuit_closed", "{cid} 的 agent 恢复正常"),
+}
+
+
+def _state(citizen_id):
+    return _store.get("citizens").get(citizen_id) or {
+        "state": CLOSED, "failures": 0, "backoff": 0, "retry_at": 0, "last_error": None}
+
+
+def _save(citizen_id, day, old, new):
+    _store.apply(["set", ["citizens", citizen_id], new])
+    if new["state"] != old["state"]:
+        event_type, template = _TRANSITIONS[new["state"]]
+        chronicle.record_event(day, event_type, template.format(
+            cid=citizen_id, failures=new["failures"], backoff=new["backoff"],
+            error=new.get("last_error") or "?"), citizen_id)
+
+
+def state(citizen_id):
+    return _state(citizen_id)["state"]
+
+
+def allow(citizen_id, day, probe):
+    """这回合能不能调该居民的 agent。
+    熔断中且退避时间已到 → 调 probe()（返回 None 表示健康，否则是错误信息）决定是否半开。"""
+    current = _state(citizen_id)
+    if current["state"] != OPEN:
+        return True
+    if time.time() < current["retry_at"]:
+        return False
+
+    error = probe()
+    if error is None:
+        _save(citizen_id, day, current, {**current, "state": HALF_OPEN})
+        return True
+    _save(citizen_id, day, current, _reopen(current, error))
+    return False
+
+
+def _reopen(current, error):
+    backoff = min(max(current["backoff"] * 2, BACKOFF_BASE), BACKOFF_MAX)
+    return {**current, "state": OPEN, "backoff": backoff,
+            "retry_at": time.time() + backoff, "last_error": str(error).strip()[:200]}
+
+
+def record(citizen_id, day, error):
+    """记一次 agent 调用结果（error 为 None 表示成功）"""
+    current = _state(citizen_id)
+    if error is None:
+        if current["state"] != CLOSED or current["failures"]:
+            _save(citizen_id, day, current, {
+                "state": CLOSED, "failures": 0, "backoff": 0, "retry_at": 0, "last_error": None})
+        return
+
+    failures = current["failures"] + 1
+    updated = {**current, "failures": failures, "last_error": str(error).strip()[:200]}
+    if current["state"] == HALF_OPEN or failures >= FAILURE_THRESHOLD:
+        updated = _reopen(updated, error)
+    _save(citizen_id, day, current, updated)
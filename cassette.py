@@ -0,0 +1,71 @@
+"""
+录放带 - 录下 agent 的回复，之后不启动 openclaw 原样回放
+用同一卷录放带重跑 main.run_day，经济、需求、编年史走真实代码，
+agent 这边确定且零延迟：可以单独对世界引擎做性能分析和基准测试。
+
+GENESIS_CASSETTE=record   每次 call_agent 的回复追加到录放带
+GENESIS_CASSETTE=replay   按键查录放带，查不到返回错误（不会去调 openclaw）
+GENESIS_CASSETTE_PATH     录放带文件，默认 data/cassette.jsonl
+GENESIS_CASSETTE_KEY      message = 按居民 + 消息哈希（默认，消息一变就对不上）
+                          turn    = 按 (天, 轮, 居民)（世界状态有出入也能回放）
+
+每行一条 JSON：{"citizen_id", "day", "round", "hash", "reply", "error"}，
+只存消息的哈希，不存消息原文。同一个键录了多次时按录制顺序依次回放。
+"""
+import hashlib
+import json
+import os
+from collections import defaultdict, deque
+
+import storage
+
+MODE = os.environ.get("GENESIS_CASSETTE", "")
+PATH = os.environ.get("GENESIS_CASSETTE_PATH", os.path.join(storage.DATA_DIR, "cassette.jsonl"))
+KEY = os.environ.get("GENESIS_CASSETTE_KEY", "message")
+
+_index = None
+
+
+def message_hash(message):
+    return hashlib.sha1(message.encode("utf-8")).hexdigest()[:16]
+
+
+def _key(citizen_id, digest, turn):
+    if KEY == "turn":
+        day, round_num = turn or (0, 0)
+        return (citizen_id, day, round_num)
+    return (citizen_id, digest)
+
+
+def record(citizen_id, message, turn, reply, error):
+    """追加一条录制"""
+    day, round_num = turn or (0, 0)
+    entry = {"citizen_id": citizen_id, "day": day, "round": round_num,
+             "hash": message_hash(message), "reply": reply, "error": error}
+    os.makedirs(os.path.dirname(PATH) or ".", exist_ok=True)
+    with open(PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _load_index():
+    """读整卷录放带，按当前 KEY 建索引（只读一次）"""
+    global _index
+    if _index is None:
+        _index = defaultdict(deque)
+        if os.path.exists(PATH):
+            with open(PATH, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    key = _key(entry["citizen_id"], entry["hash"], (entry["day"], entry["round"]))
+                    _index[key].append((entry["reply"], entry["error"]))
+    return _index
+
+
+def replay(citizen_id, message, turn):
+    """回放一条回复，返回 (回复文本, 错误)"""
+    queue = _load_index().get(_key(citizen_id, message_hash(message), turn))
+    if not queue:
+        return None, "录放带中没有这条回复"
+    return queue.popleft()
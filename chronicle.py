@@ -1,38 +1,47 @@
 """
 编年史 - 世界的记忆
 自动记录每天发生的事。这比代码重要。
+
+record_day 日终时把当天的事件过一遍，生成一份预先渲染好的日摘要（digest）：
+要事、经济变化、需求获胜者、休眠。第二天的提示词（昨天发生了什么）和当天的 md
+都直接用它，不再各自去筛整天的事件。
 """
-import json
 import os
 from datetime import datetime
 
-DATA_FILE = "data/chronicle.json"
+import storage
+
 CHRONICLE_DIR = "chronicle"
 
+_store = storage.Store("chronicle", lambda: {"entries": []},
+                       lists=("entries",), partitioned=("entries",))
+# days: 每天一份摘要（按天分段，取某天只读那一段）；balances: 上次日终各居民余额，算余额变化用
+_digests = storage.Store("digests", lambda: {"days": [], "balances": {}},
+                         lists=("days",), partitioned=("days",))
 
-def _load():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"entries": []}
+DIGEST_EVENTS = 8    # 摘要里列几条要事
+DIGEST_MOVERS = 3    # 余额涨跌各列几位
+DIGEST_CHARS = 100   # 每条要事的描述截断长度
+# 这些事件每天大量出现，不算要事；获胜和休眠单独列
+ROUTINE_EVENTS = {"submission", "vote", "output", "unknown_action", "day_summary",
+                  "need_completed", "hibernation"}
 
 
-def _save(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _load():
+    return _store.load()
 
 
-def _write_day_md(day):
-    """把某天的所有事件写成独立 md 文件"""
-    entries = get_day(day)
+def _write_day_md(day, entries, digest):
+    """把某天的摘要和所有事件写成独立 md 文件"""
     if not entries:
         return
 
     os.makedirs(CHRONICLE_DIR, exist_ok=True)
     path = os.path.join(CHRONICLE_DIR, f"D{day:03d}.md")
 
-    lines = [f"# 第 {day} 天\n"]
+    lines = [f"# 第 {day} 天\n", "\n## 摘要\n"]
+    lines += [f"- {line}\n" for line in digest["lines"]]
+    lines.append("\n## 事件\n")
     for e in entries:
         t = e.get("time", "")[:16]
         etype = e.get("type", "")
@@ -56,42 +65,116 @@ def _write_day_md(day):
         f.writelines(lines)
 
 
-def record_day(day, summary):
-    """记录一天的总结，并写 md 文件"""
-    data = _load()
+def record_day(day, summary, balances=None):
+    """记录一天的总结，生成当天摘要，并写 md 文件。
+    balances：日终各居民余额 {citizen_id: balance}，和上一次日终比出余额涨跌。"""
     entry = {
         "day": day,
         "type": "day_summary",
         "summary": summary,
         "time": datetime.now().isoformat()
     }
-    data["entries"].append(entry)
-    _save(data)
-    _write_day_md(day)
+    with storage.unit_of_work():
+        _store.apply(["append", ["entries"], entry])
+        entries = get_day(day)
+        digest = _build_digest(day, entries, summary, balances)
+        _digests.apply(["append", ["days"], digest])
+        if balances is not None:
+            _digests.apply(["set", ["balances"], balances])
+    _write_day_md(day, entries, digest)
     return entry
 
 
-def record_event(day, event_type, description, citizen_id=None):
-    """记录单个事件"""
-    data = _load()
-    event = {
+# ============================================================
+# 日摘要
+# ============================================================
+
+def _build_digest(day, entries, summary=None, balances=None):
+    """从当天事件生成摘要。lines 是渲染好的条目，提示词和 md 共用。"""
+    winners = [{"citizen_id": e.get("citizen_id"), "description": e.get("description", "")}
+               for e in entries if e.get("type") == "need_completed"]
+    hibernated = [e.get("citizen_id") for e in entries if e.get("type") == "hibernation"]
+    notable = [e for e in entries if e.get("type") not in ROUTINE_EVENTS][-DIGEST_EVENTS:]
+
+    econ = {}
+    treasury = (summary or {}).get("treasury")
+    if treasury:
+        econ["treasury"] = treasury["balance"]
+        previous = get_digest(day - 1, build=False)
+        if previous and "treasury" in previous["economy"]:
+            econ["treasury_delta"] = round(treasury["balance"] - previous["economy"]["treasury"], 2)
+    if balances is not None:
+        before = _digests.get("balances")
+        deltas = sorted(((round(b - before[cid], 2), cid) for cid, b in balances.items()
+                         if cid in before and b != before[cid]), reverse=True)
+        econ["gainers"] = [[cid, d] for d, cid in deltas[:DIGEST_MOVERS] if d > 0]
+        econ["losers"] = [[cid, d] for d, cid in reversed(deltas[-DIGEST_MOVERS:]) if d < 0]
+
+    lines = []
+    if "treasury" in econ:
+        delta = econ.get("treasury_delta")
+        lines.append(f"金库 {econ['treasury']} token" + (f"（{delta:+}）" if delta is not None else ""))
+    lines += [w["description"][:DIGEST_CHARS] for w in winners]
+    if hibernated:
+        lines.append(f"休眠：{'、'.join(hibernated)}")
+    movers = "、".join(f"{cid} {d:+}" for cid, d in econ.get("gainers", []) + econ.get("losers", []))
+    if movers:
+        lines.append(f"余额变化：{movers}")
+    lines += [e.get("description", "")[:DIGEST_CHARS] for e in notable]
+
+    return {"day": day, "winners": winners, "hibernated": hibernated,
+            "economy": econ, "events": len(entries), "lines": lines}
+
+
+def get_digest(day, build=True):
+    """某天的摘要。升级前记录的天没有存摘要，build 时按当天事件临时生成（不含余额变化）"""
+    found = _digests.query("days", day=day)
+    if found:
+        return found[-1]
+    if not build:
+        return None
+    entries = get_day(day)
+    if not entries:
+        return None
+    summary = next((e.get("summary") for e in reversed(entries) if e.get("type") == "day_summary"), None)
+    return _build_digest(day, entries, summary if isinstance(summary, dict) else None)
+
+
+def make_event(day, event_type, description, citizen_id=None):
+    """构造一条事件（不写入），配合 record_events 批量记录"""
+    return {
         "day": day,
         "type": event_type,
         "description": description,
         "citizen_id": citizen_id,
         "time": datetime.now().isoformat()
     }
-    data["entries"].append(event)
-    _save(data)
+
+
+def record_event(day, event_type, description, citizen_id=None):
+    """记录单个事件"""
+    event = make_event(day, event_type, description, citizen_id)
+    _store.apply(["append", ["entries"], event])
     return event
 
 
+def record_events(events):
+    """一次追加一批事件（make_event 构造的），按顺序写入"""
+    if events:
+        _store.apply(["extend", ["entries"], events])
+    return events
+
+
 def get_day(day):
     """获取某天的所有记录"""
-    data = _load()
-    return [e for e in data["entries"] if e.get("day") == day]
+    return _store.query("entries", day=day)
+
+
+def latest_day():
+    """有记录的最新一天（没有任何记录时为 None），只读 manifest/索引"""
+    return _store.latest_day("entries")
 
 
 def get_full_history():
     """获取完整编年史"""
-    return _load()["entries"]
+    return _store.get("entries")
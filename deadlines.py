@@ -0,0 +1,100 @@
+"""
+自适应截止时间 - 按每个居民的历史耗时决定这回合等多久
+每个居民一份跨天保存的耗时直方图。截止时间 = p95 × DEADLINE_FACTOR，
+夹在 [MIN_DEADLINE, MAX_DEADLINE] 之间，再受当天总预算的公平份额限制。
+截止时间是墙钟时间：到点子进程被杀掉；openclaw 自己的 --timeout 会提前一点（见 agent_timeout）。
+快的居民不用陪跑 150 秒，慢的居民到点就被取消，一天的总耗时有上界。
+"""
+import math
+import os
+
+import storage
+
+# 直方图桶上沿（秒）；最后一个桶收所有更慢的
+BUCKETS = [5, 10, 15, 20, 30, 45, 60, 90, 120, 150]
+DEADLINE_FACTOR = 1.5
+MIN_DEADLINE = 20
+MIN_SAMPLES = 5  # 样本太少时不调整，用 MAX_DEADLINE
+# 上限 = 原来固定的 120 秒 openclaw 超时 + 30 秒子进程宽限
+MAX_DEADLINE = 150
+TIMEOUT_GRACE = 30
+# 一天里所有 agent 调用的总时间预算（秒），0 表示不限
+DAY_BUDGET = int(os.environ.get("GENESIS_DAY_AGENT_BUDGET", "0"))
+
+_store = storage.Store("latency", lambda: {"citizens": {}}, maps=("citizens",))
+
+
+def _empty():
+    return {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "total": 0, "timeouts": 0}
+
+
+def record(citizen_id, seconds, timed_out=False):
+    """记一次 agent 调用耗时（超时按截止时间记，下次截止时间会相应放宽）"""
+    hist = _store.get("citizens").get(citizen_id)
+    if not hist or len(hist["buckets"]) != len(BUCKETS) + 1:
+        hist = _empty()
+    hist = {**hist, "buckets": list(hist["buckets"])}
+    index = next((i for i, edge in enumerate(BUCKETS) if seconds <= edge), len(BUCKETS))
+    hist["buckets"][index] += 1
+    hist["count"] += 1
+    hist["total"] = round(hist["total"] + seconds, 2)
+    if timed_out:
+        hist["timeouts"] += 1
+    _store.apply(["set", ["citizens", citizen_id], hist])
+
+
+def p95(citizen_id):
+    """耗时 p95（取所在桶的上沿），样本不足时为 None"""
+    hist = _store.get("citizens").get(citizen_id)
+    if not hist or hist["count"] < MIN_SAMPLES:
+        return None
+    target = math.ceil(hist["count"] * 0.95)
+    seen = 0
+    for i, n in enumerate(hist["buckets"]):
+        seen += n
+        if seen >= target:
+            return BUCKETS[i] if i < len(BUCKETS) else MAX_DEADLINE
+    return MAX_DEADLINE
+
+
+def deadline(citizen_id, budget=None):
+    """这回合给该居民的截止时间（秒）"""
+    latency = p95(citizen_id)
+    if latency is None:
+        seconds = MAX_DEADLINE
+    else:
+        seconds = min(max(latency * DEADLINE_FACTOR, MIN_DEADLINE), MAX_DEADLINE)
+    if budget is not None:
+        cap = budget.cap()
+        if cap is not None:
+            seconds = min(seconds, cap)
+    return int(math.ceil(seconds))
+
+
+def agent_timeout(seconds):
+    """传给 openclaw --timeout 的值：留出宽限让它自己收尾返回，而不是被杀"""
+    return max(seconds - min(TIMEOUT_GRACE, seconds // 4), 1)
+
+
+def is_timeout(elapsed, seconds):
+    """耗时到了 agent 自己的超时线就算超时（不管是 openclaw 报错还是被杀）"""
+    return elapsed >= agent_timeout(seconds)
+
+
+class DayBudget:
+    """一天的 agent 总时间预算，按剩余回合数平均分配。
+    slots：串行时是 轮数×居民数，并行轮次时是轮数（一轮只算最慢的那个）。"""
+
+    def __init__(self, seconds, slots):
+        self.seconds = seconds
+        self.remaining = seconds
+        self.slots = slots
+
+    def cap(self):
+        if not self.seconds:
+            return None
+        return max(self.remaining / max(self.slots, 1), 1)
+
+    def spend(self, elapsed):
+        self.remaining -= elapsed
+        self.slots -= 1
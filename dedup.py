@@ -0,0 +1,176 @@
+"""
+提交查重 - shingling + MinHash 相似度索引
+居民常把同一份搜索结果贴进 daily_intel，评判模型为几份几乎一样的报告重复付钱。
+submit 时给每份提交算一个 MinHash 签名，和同一需求已有的提交、往日获胜提交比对，
+相似度达到 THRESHOLD 的标记为重复（duplicate_of），评判只看不重复的候选。
+
+签名：内容规范化（小写、压缩空白）后切成 SHINGLE 个字符的 shingle，每个 shingle 是码点元组，
+取它的 hash（整数元组的 hash 不受 PYTHONHASHSEED 影响，zip 成元组全在 C 里做，比逐段切字节再 crc32 快一倍多），
+截到低 HASH_BITS 位（单 digit 的整数 list.sort 走快速比较，排序是签名里最贵的一步）。
+哈希值按最高几位分进 K 个桶，每桶留最小的一个（one-permutation MinHash，只需一个哈希函数），空桶记 None。
+相似度是 Jaccard 的估计：至少一边非空的桶里，两边取值相同的比例。
+查找走 LSH 分段：签名切成 BANDS 段、每段 ROWS 个桶，任意一段完全相同的条目才细算相似度；
+阈值 0.8 的一对漏掉的概率约 1-(1-0.8^4)^16 ≈ 0.02%，不相干的提交基本碰不到一起。
+往日获胜提交的签名存在 dedup store 里，跨天、跨进程复用；索引只收最近 WINNER_DAYS 天的，
+按天读记录，不随历史增长。签名方案（SCHEME）不同的旧记录不参与比较。
+
+GENESIS_DUP_THRESHOLD    相似度阈值，默认 0.8
+GENESIS_DUP_WINNER_DAYS  和最近多少天的获胜提交比较，默认 30
+"""
+import bisect
+import hashlib
+import os
+import re
+from array import array
+from itertools import chain
+
+import storage
+
+SHINGLE = 5         # 字符
+K = 64              # 签名长度（桶数，2 的幂）
+BANDS = 16          # LSH 段数，每段 K // BANDS 个桶
+ROWS = K // BANDS
+MAX_CHARS = 4000    # 只看内容开头这么多字
+THRESHOLD = float(os.environ.get("GENESIS_DUP_THRESHOLD", "0.8"))
+WINNER_DAYS = int(os.environ.get("GENESIS_DUP_WINNER_DAYS", "30"))
+# 签名方案：元组 hash 的算法跟着 Python 走，换了解释器的旧签名不可比
+HASH_BITS = 30      # CPython 整数一个 digit 的位数
+SCHEME = f"oph{K}b{HASH_BITS}:{hash((0x4e00,) * SHINGLE) & 0xffff:04x}"
+
+# 截断后的哈希按最高 log2(K) 位分桶，_BOUNDS[b] 是第 b 个桶的下界
+_MASK = (1 << HASH_BITS) - 1
+_SHIFT = HASH_BITS - (K.bit_length() - 1)
+_BOUNDS = [b << _SHIFT for b in range(K + 1)]
+
+_store = storage.Store("dedup", lambda: {"winners": []}, lists=("winners",))
+
+_WS = re.compile(r"\s+")
+_sig_cache = {}   # 内容哈希 → 签名（本进程内）
+_winners = None   # (窗口起始天, Index)：往日获胜提交的索引，第一次用到时从 store 建
+_open = {}        # need_id → (首份提交的时间, 已索引的提交数, Index)：当天开放需求的索引
+
+
+def signature(text):
+    """内容的 MinHash 签名（K 个桶的最小哈希值，空桶为 None），同一内容总是同一签名"""
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    sig = _sig_cache.get(digest)
+    if sig is None:
+        codes = array("I", _WS.sub(" ", text.lower()).strip()[:MAX_CHARS].encode("utf-32-le"))
+        if len(codes) <= SHINGLE:
+            hashes = [hash(tuple(codes)) & _MASK]
+        else:
+            # 重复的 shingle 不用去重：bisect 照样落在桶里最小的那个上
+            hashes = sorted(map(_MASK.__and__, map(hash, zip(*(codes[i:] for i in range(SHINGLE))))))
+        cuts = [bisect.bisect_left(hashes, bound) for bound in _BOUNDS]
+        sig = tuple(hashes[lo] if lo < hi else None for lo, hi in zip(cuts, cuts[1:]))
+        if len(_sig_cache) > 4096:
+            _sig_cache.clear()
+        _sig_cache[digest] = sig
+    return sig
+
+
+def similarity(a, b):
+    """两个签名的 Jaccard 估计（0~1）"""
+    if not a or not b:
+        return 0.0
+    same = seen = 0
+    for x, y in zip(a, b):
+        if x is not None or y is not None:
+            seen += 1
+            same += x == y
+    return same / seen if seen else 0.0
+
+
+def _bands(sig):
+    """LSH 分段的桶键；全空的段（短内容）不当键，否则所有短提交都挤在一个桶里"""
+    for b in range(BANDS):
+        rows = sig[b * ROWS:(b + 1) * ROWS]
+        if any(x is not None for x in rows):
+            yield (b, rows)
+
+
+class Index:
+    """签名的 LSH 索引：query 只和至少有一段完全相同的条目比较"""
+
+    def __init__(self):
+        self.entries = []
+        self.buckets = {}
+
+    def add(self, info, sig):
+        n = len(self.entries)
+        self.entries.append((info, sig))
+        for key in _bands(sig):
+            self.buckets.setdefault(key, []).append(n)
+
+    def query(self, sig, threshold=None):
+        """最相似且达到阈值的条目，返回 (info, 相似度) 或 None"""
+        threshold = THRESHOLD if threshold is None else threshold
+        best = None
+        for n in set(chain.from_iterable(self.buckets.get(key, ()) for key in _bands(sig))):
+            info, other = self.entries[n]
+            score = similarity(sig, other)
+            if score >= threshold and (best is None or score > best[1]):
+                best = (info, score)
+        return best
+
+
+def _winner_index(day=None):
+    """最近 WINNER_DAYS 天获胜提交的索引（day 为空时以记录里最新的一天为准）。
+    第一次只按天读这一段记录；之后窗口往后移时从内存里的条目重建，老记录不再参与比较。"""
+    global _winners
+    if day is None:
+        if _winners is not None:
+            return _winners[1]
+        day = _store.latest_day("winners") or 0
+    start = day - WINNER_DAYS + 1
+    if _winners is None:
+        index = Index()
+        for rec in _store.since("winners", [start, 0])[0]:
+            if rec.get("scheme") == SCHEME:
+                index.add({k: rec[k] for k in ("day", "need_id", "citizen_id")}, tuple(rec["sig"]))
+        _winners = (start, index)
+    elif _winners[0] < start:
+        index = Index()
+        for info, sig in _winners[1].entries:
+            if info["day"] >= start:
+                index.add(info, sig)
+        _winners = (start, index)
+    return _winners[1]
+
+
+def _open_index(need_id, earlier):
+    """同一需求已有提交的索引，增量补上新提交；换了一天（首份提交变了）就重建"""
+    first = earlier[0].get("time") if earlier else None
+    tag, count, index = _open.get(need_id, (None, 0, None))
+    if index is None or tag != first or count > len(earlier):
+        count, index = 0, Index()
+    for s in earlier[count:]:
+        if not s.get("duplicate_of"):  # 只索引原件，重复组都指向同一份
+            index.add({"citizen_id": s["citizen_id"]}, signature(s["content"]))
+    _open[need_id] = (first, len(earlier), index)
+    return index
+
+
+def find_duplicate(need_id, content, earlier):
+    """content 是否和 earlier（同一需求里先到的提交）或往日获胜提交高度相似。
+    返回 duplicate_of 标记 {"citizen_id", "similarity", 往日的还有 "day", "need_id"}，不重复返回 None。"""
+    sig = signature(content)
+    hit = _open_index(need_id, earlier).query(sig) or _winner_index().query(sig)
+    if hit is None:
+        return None
+    return {**hit[0], "similarity": round(hit[1], 2)}
+
+
+def remember_winner(day, need_id, citizen_id, content):
+    """把获胜提交加入往日索引（先建好索引再追加，同一工作单元里没提交的记录也在索引里）"""
+    sig = signature(content)
+    index = _winner_index(day)
+    _store.apply(["append", ["winners"], {
+        "day": day, "need_id": need_id, "citizen_id": citizen_id, "scheme": SCHEME, "sig": list(sig)}])
+    index.add({"day": day, "need_id": need_id, "citizen_id": citizen_id}, sig)
+
+
+def distinct(submissions):
+    """评判用的候选：去掉标记为重复的；全被标记时保留第一份"""
+    candidates = [s for s in submissions if not s.get("duplicate_of")]
+    return candidates or submissions[:1]
@@ -2,58 +2,80 @@
 经济系统 - 居民的钱包和交易
 每个居民有余额，每天扣生存成本，可以互相交易。
 """
-import json
-import os
 from datetime import datetime
 
-DATA_FILE = "data/economy.json"
+import storage
 
 SURVIVAL_COST = 5  # 每天每人扣5 token
 INITIAL_BALANCE = 50  # 每个居民初始50 token（从金库拨付）
 
+_store = storage.Store("economy", lambda: {"citizens": {}, "transactions": []},
+                       lists=("transactions",), maps=("citizens",))
+
 def _load():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"citizens": {}, "transactions": []}
-
-def _save(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def register_citizen(citizen_id):
-    """新居民注册，获得初始余额"""
-    data = _load()
-    if citizen_id in data["citizens"]:
-        return data["citizens"][citizen_id]
-    data["citizens"][citizen_id] = {
-        "balance": INITIAL_BALANCE,
-        "total_earned": 0,
-        "total_spent": 0,
-        "status": "active",  # active / hibernating
-        "registered": datetime.now().isoformat()
-    }
-    _save(data)
-    return data["citizens"][citizen_id]
+    return _store.load()
+
+def register_citizen(citizen_id, agent=None):
+    """新居民注册，获得初始余额。agent：对应的 openclaw agent 名，人类居民为 None。
+    已退休的居民重新注册时余额照旧，状态按余额恢复：余额耗尽的和 deduct_survival_cost 一样休眠。"""
+    citizens = _store.get("citizens")
+    if citizen_id in citizens:
+        citizen = citizens[citizen_id]
+        if citizen["status"] != "retired":
+            return citizen
+        status = "active" if citizen["balance"] > 0 else "hibernating"
+        citizen = {**citizen, "status": status, "agent": agent}
+    else:
+        citizen = {
+            "balance": INITIAL_BALANCE,
+            "total_earned": 0,
+            "total_spent": 0,
+            "status": "active",  # active / hibernating / retired
+            "agent": agent,
+            "registered": datetime.now().isoformat()
+        }
+    _store.apply(["set", ["citizens", citizen_id], citizen])
+    _track(citizen_id, citizen)
+    return citizen
+
+def retire_citizen(citizen_id):
+    """居民退休：不再行动、不再扣生存成本，余额和历史保留"""
+    citizen = _store.get("citizens").get(citizen_id)
+    if not citizen or citizen["status"] == "retired":
+        return None
+    citizen = {**citizen, "status": "retired"}
+    _store.apply(["set", ["citizens", citizen_id], citizen])
+    _track(citizen_id, citizen)
+    return citizen
 
 def get_citizen(citizen_id):
     """查询居民经济状态"""
-    data = _load()
-    return data["citizens"].get(citizen_id)
+    return _store.get("citizens").get(citizen_id)
 
 def get_all_citizens():
     """所有居民经济状态"""
-    return _load()["citizens"]
+    return _store.get("citizens")
+
+def get_transactions(citizen_id=None):
+    """交易记录；指定居民时返回他转出和收到的全部交易（按时间排序）"""
+    if not citizen_id:
+        return _store.get("transactions")
+    sent = _store.query("transactions", citizen_id=citizen_id)
+    received = [t for t in _store.query("transactions", peer=citizen_id)
+                if t["from"] != citizen_id]
+    return sorted(sent + received, key=lambda t: t["time"])
 
 def deduct_survival_cost():
     """每日结算：扣除所有活跃居民的生存成本。成本真实消耗，不回金库。"""
-    data = _load()
     results = {}
-    for cid, info in data["citizens"].items():
+    ops = []
+    citizens = _store.get("citizens")
+    for cid in citizen_ids():
+        info = citizens[cid]
         if info["status"] != "active":
             results[cid] = "hibernating"
             continue
+        info = dict(info)
         info["balance"] = round(info["balance"] - SURVIVAL_COST, 2)
         info["total_spent"] = round(info["total_spent"] + SURVIVAL_COST, 2)
         if info["balance"] <= 0:
@@ -62,46 +84,115 @@ def deduct_survival_cost():
             results[cid] = "hibernated"
         else:
             results[cid] = f"alive ({info['balance']} left)"
-    _save(data)
+        ops.append(["set", ["citizens", cid], info])
+    _store.apply(*ops)
+    for _, (_, cid), info in ops:
+        _track(cid, info)
     return results
 
 def pay(from_id, to_id, amount, reason=""):
     """居民间转账"""
-    data = _load()
-    sender = data["citizens"].get(from_id)
-    receiver = data["citizens"].get(to_id)
-    if not sender or not receiver:
+    citizens = _store.get("citizens")
+    if from_id not in citizens or to_id not in citizens:
         return None
-    if sender["balance"] < amount:
+    if citizens[from_id]["balance"] < amount:
         return None
+    sender = dict(citizens[from_id])
+    receiver = sender if to_id == from_id else dict(citizens[to_id])
     sender["balance"] = round(sender["balance"] - amount, 2)
     sender["total_spent"] = round(sender["total_spent"] + amount, 2)
     receiver["balance"] = round(receiver["balance"] + amount, 2)
     receiver["total_earned"] = round(receiver["total_earned"] + amount, 2)
-    data["transactions"].append({
-        "from": from_id,
-        "to": to_id,
-        "amount": amount,
-        "reason": reason,
-        "time": datetime.now().isoformat()
-    })
-    _save(data)
+    _store.apply(
+        ["set", ["citizens", from_id], sender],
+        ["set", ["citizens", to_id], receiver],
+        ["append", ["transactions"], {
+            "from": from_id,
+            "to": to_id,
+            "amount": amount,
+            "reason": reason,
+            "time": datetime.now().isoformat()
+        }],
+    )
     return {"sender_balance": sender["balance"], "receiver_balance": receiver["balance"]}
 
 def reward(citizen_id, amount, source="world_needs"):
     """世界奖励居民（完成基础需求等）"""
-    data = _load()
-    citizen = data["citizens"].get(citizen_id)
+    citizen = _store.get("citizens").get(citizen_id)
     if not citizen:
         return None
+    citizen = dict(citizen)
     citizen["balance"] = round(citizen["balance"] + amount, 2)
     citizen["total_earned"] = round(citizen["total_earned"] + amount, 2)
-    data["transactions"].append({
-        "from": "world",
-        "to": citizen_id,
-        "amount": amount,
-        "reason": source,
-        "time": datetime.now().isoformat()
-    })
-    _save(data)
+    _store.apply(
+        ["set", ["citizens", citizen_id], citizen],
+        ["append", ["transactions"], {
+            "from": "world",
+            "to": citizen_id,
+            "amount": amount,
+            "reason": source,
+            "time": datetime.now().isoformat()
+        }],
+    )
     return citizen["balance"]
+
+
+# ============================================================
+# 居民名册
+# ============================================================
+# citizens 里每个居民记着状态（active / hibernating / retired）和对应的
+# agent 名（人类居民为 None）。内存里按状态维护索引：遍历居民、查 agent 名
+# 都不用再逐个读经济状态。本模块的写入会同步更新索引；别的进程（human.py、
+# 命令行加人/退休）的改动在 reload_roster() 时读入，run_day 每天开始调一次。
+
+# 没有 agent 字段的老世界沿用原来写死的映射
+LEGACY_AGENTS = {"C1": "c1", "C2": "c2", "C3": "c3", "C4": "c4", "C5": "c5"}
+
+_roster = None
+
+
+def _track(citizen_id, info):
+    if _roster is None:
+        return
+    _roster["status"][citizen_id] = info["status"]
+    _roster["agents"][citizen_id] = info.get("agent", LEGACY_AGENTS.get(citizen_id))
+    for status in ("active", "hibernating"):
+        if info["status"] == status:
+            _roster[status][citizen_id] = None
+        else:
+            _roster[status].pop(citizen_id, None)
+
+
+def reload_roster():
+    """从经济状态重建名册索引"""
+    global _roster
+    _roster = {"status": {}, "agents": {}, "active": {}, "hibernating": {}}
+    for cid, info in _store.get("citizens").items():
+        _track(cid, info)
+    return _roster
+
+
+def _get_roster():
+    if _roster is None:
+        return reload_roster()
+    return _roster
+
+
+def citizen_ids(active_only=False, agents_only=False):
+    """居民编号（按注册顺序），不含已退休的。
+    active_only：只要活跃的；agents_only：只要有 agent 的（排除人类居民）。"""
+    roster = _get_roster()
+    ids = roster["active"] if active_only else (
+        cid for cid, status in roster["status"].items() if status != "retired")
+    if agents_only:
+        return [cid for cid in ids if roster["agents"].get(cid)]
+    return list(ids)
+
+
+def is_active(citizen_id):
+    return citizen_id in _get_roster()["active"]
+
+
+def agent_of(citizen_id):
+    """居民对应的 agent 名；人类居民或未知居民为 None"""
+    return _get_roster()["agents"].get(citizen_id)
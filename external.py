@@ -2,28 +2,19 @@
 外部接口 - 居民与真实世界的连接
 居民的外部产出在这里登记，外部收入从这里流入金库。
 """
-import json
-import os
 from datetime import datetime
 
+import storage
 import treasury
 
-DATA_FILE = "data/external.json"
+_store = storage.Store("external", lambda: {"outputs": [], "income_log": []},
+                       lists=("outputs", "income_log"))
 
 def _load():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"outputs": [], "income_log": []}
-
-def _save(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    return _store.load()
 
 def register_output(citizen_id, output_type, title, content_path, day=0):
     """登记居民的外部产出（文章、代码、报告等）"""
-    data = _load()
     output = {
         "citizen_id": citizen_id,
         "type": output_type,
@@ -33,16 +24,15 @@ def register_output(citizen_id, output_type, title, content_path, day=0):
         "time": datetime.now().isoformat(),
         "income_generated": 0
     }
-    data["outputs"].append(output)
-    _save(data)
+    _store.apply(["append", ["outputs"], output])
     return output
 
 TAX_RATE = 0.30  # 外层收入30%进金库
 
-def record_income(amount, citizen_id, source_desc):
-    """记录外部收入，70%归居民，30%进金库（税）"""
+def record_income(amount, citizen_id, source_desc, job=None):
+    """记录外部收入，70%归居民，30%进金库（税）。
+    job：发布任务的标识（publish_queue.job_key），记在收入记录里，同一任务不会记两次。"""
     import economy
-    data = _load()
     treasury_share = round(amount * TAX_RATE, 2)
     citizen_share = round(amount - treasury_share, 2)
 
@@ -51,20 +41,23 @@ def record_income(amount, citizen_id, source_desc):
     # 70% 给居民
     economy.reward(citizen_id, citizen_share, source=f"external:{source_desc}")
 
-    data["income_log"].append({
+    _store.apply(["append", ["income_log"], {
         "amount": amount,
         "citizen_id": citizen_id,
         "citizen_share": citizen_share,
         "treasury_share": treasury_share,
         "source": source_desc,
-        "time": datetime.now().isoformat()
-    })
-    _save(data)
+        "time": datetime.now().isoformat(),
+        **({"job": job} if job else {}),
+    }])
     return {"citizen_share": citizen_share, "treasury_share": treasury_share}
 
+def income_recorded(citizen_id, job):
+    """这个发布任务的收入是否已经记过"""
+    return bool(_store.query("income_log", citizen_id=citizen_id, job=job))
+
 def get_outputs(citizen_id=None):
     """查询外部产出"""
-    data = _load()
     if citizen_id:
-        return [o for o in data["outputs"] if o["citizen_id"] == citizen_id]
-    return data["outputs"]
+        return _store.query("outputs", citizen_id=citizen_id)
+    return _store.get("outputs")
@@ -0,0 +1,115 @@
+"""
+模拟居民 - 不调 LLM，按收到的消息生成像样的行动 JSON
+GENESIS_AGENT_BACKEND=fake 时 call_agent 走这里，用来压测世界引擎（见 bench.py）。
+从消息里认出公告板需求、已有提交和其他居民，然后：
+  第1轮：广场发言 + 提交一两个需求
+  第2轮起：给别人的提交投票，偶尔转账，偶尔 PASS
+同一居民收到同一消息时回复相同（随机数以 SEED、居民、消息哈希为种子），可复现。
+
+GENESIS_FAKE_LATENCY     平均回复耗时（秒），实际在 0.5~1.5 倍之间，默认 0
+GENESIS_FAKE_CHARS       发言/提交内容长度（字），默认 400
+GENESIS_FAKE_ERROR_RATE  返回错误的概率，默认 0
+GENESIS_FAKE_SEED        随机种子，默认 0
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+LATENCY = float(os.environ.get("GENESIS_FAKE_LATENCY", "0"))
+REPLY_CHARS = int(os.environ.get("GENESIS_FAKE_CHARS", "400"))
+ERROR_RATE = float(os.environ.get("GENESIS_FAKE_ERROR_RATE", "0"))
+SEED = os.environ.get("GENESIS_FAKE_SEED", "0")
+
+SPEAK_RATE = 0.8
+VOTE_RATE = 0.7
+PAY_RATE = 0.1
+PASS_RATE = 0.1
+
+_FILLER = "今天的观察：模型发布、开源项目、融资动态和论文摘要。"
+
+
+def _scan(message):
+    """从消息里认出 需求id → 已提交的居民，以及出现过的其他居民"""
+    needs, citizens = {}, set()
+    current = None
+    for line in message.splitlines():
+        m = re.match(r"^-? ?\[(\w+)\]", line)
+        if m:
+            current = m.group(1)
+            needs.setdefault(current, [])
+            needs[current] += re.findall(r"(\w+) \d+票", line)
+            continue
+        m = re.match(r"^  - (?:新提交 )?(\w+)[（:]", line)
+        if current and m:
+            needs[current].append(m.group(1))
+            continue
+        m = re.match(r"^- (\w+): ", line)
+        if m:
+            citizens.add(m.group(1))
+    return needs, citizens
+
+
+def _text(label):
+    body = (_FILLER * (REPLY_CHARS // len(_FILLER) + 1))[:max(REPLY_CHARS - len(label), 0)]
+    return f"{label}{body}"[:REPLY_CHARS] if REPLY_CHARS else label
+
+
+def _generate(citizen_id, message):
+    """返回 (回复文本, 错误, 耗时秒数)"""
+    digest = hashlib.sha1(message.encode("utf-8")).hexdigest()[:16]
+    rng = random.Random(f"{SEED}:{citizen_id}:{digest}")
+    latency = LATENCY * rng.uniform(0.5, 1.5)
+    if rng.random() < ERROR_RATE:
+        return None, "模拟错误", latency
+
+    first_round = re.search(r"第 1/\d+ 轮", message) is not None
+    needs, citizens = _scan(message)
+    citizens.discard(citizen_id)
+    if not first_round and rng.random() < PASS_RATE:
+        return "PASS", None, latency
+
+    actions = []
+    if rng.random() < SPEAK_RATE:
+        actions.append({"type": "plaza_speak", "content": _text(f"{citizen_id}：")})
+    if first_round:
+        for need_id in rng.sample(sorted(needs), min(len(needs), rng.randint(1, 2))):
+            actions.append({"type": "submit_need", "need_id": need_id,
+                            "content": _text(f"{citizen_id} 的{need_id}报告：")})
+    else:
+        for need_id, authors in sorted(needs.items()):
+            candidates = sorted(set(authors) - {citizen_id})
+            if candidates and rng.random() < VOTE_RATE:
+                actions.append({"type": "vote", "need_id": need_id,
+                                "candidate": rng.choice(candidates)})
+            citizens.update(candidates)
+    if citizens and rng.random() < PAY_RATE:
+        actions.append({"type": "pay", "to": rng.choice(sorted(citizens)),
+                        "amount": rng.randint(1, 3), "reason": "合作"})
+
+    reply = "好的，这是我这一轮的行动。\n```json\n" + json.dumps(actions, ensure_ascii=False) + "\n```"
+    return reply, None, latency
+
+
+def reply(citizen_id, message, timeout):
+    """同步版：按模拟耗时 sleep，超过截止时间按超时处理。返回 (回复文本, 错误)"""
+    text, error, latency = _generate(citizen_id, message)
+    if latency > timeout:
+        time.sleep(timeout)
+        return None, f"超时（{timeout}秒）"
+    if latency:
+        time.sleep(latency)
+    return text, error
+
+
+async def reply_async(citizen_id, message, timeout):
+    text, error, latency = _generate(citizen_id, message)
+    if latency > timeout:
+        await asyncio.sleep(timeout)
+        return None, f"超时（{timeout}秒）"
+    if latency:
+        await asyncio.sleep(latency)
+    return text, error
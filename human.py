@@ -76,11 +76,8 @@ def cmd_submit(need_id, content):
 
 
 def _current_day():
-    history = chronicle.get_full_history()
-    if not history:
-        return 1
-    days = [e.get("day", 0) for e in history if isinstance(e.get("day"), int)]
-    return max(days) if days else 1
+    latest = chronicle.latest_day()
+    return latest if latest is not None else 1
 
 
 if __name__ == "__main__":
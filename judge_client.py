@@ -0,0 +1,158 @@
+"""
+评判模型客户端 - 长连接池 + 重试退避
+日终评判各需求时并发调用（见 needs.judge_open_needs），连接复用，
+不必每个需求都重新握手 TLS。
+
+GENESIS_JUDGE_API          评判接口（OpenAI 兼容的 chat/completions），可指向本地桩
+GENESIS_JUDGE_CONCURRENCY  同时在途的评判请求数（也是连接池大小），默认 4
+GENESIS_JUDGE_RETRIES      网络错误、429、5xx 的重试次数，默认 2
+GENESIS_JUDGE_TIMEOUT      单次请求超时（秒），默认 30
+
+本地桩：python judge_client.py stub [--port 8765] [--delay 0.5]
+  然后 GENESIS_JUDGE_API=http://127.0.0.1:8765/v1/chat/completions
+  桩总是判第一个提交者获胜，--delay 模拟模型耗时。
+"""
+import atexit
+import http.client
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.parse
+
+API = os.environ.get("GENESIS_JUDGE_API", "https://api.siliconflow.cn/v1/chat/completions")
+CONCURRENCY = int(os.environ.get("GENESIS_JUDGE_CONCURRENCY", "4"))
+RETRIES = int(os.environ.get("GENESIS_JUDGE_RETRIES", "2"))
+TIMEOUT = float(os.environ.get("GENESIS_JUDGE_TIMEOUT", "30"))
+# 第 n 次重试前等 BACKOFF_BASE * 2^(n-1) 秒
+BACKOFF_BASE = 1.0
+
+
+class JudgeError(Exception):
+    """评判接口调用失败（已用完重试）"""
+
+
+class JudgeClient:
+    """到评判接口的长连接池，线程安全。同时在途的请求和空闲连接都最多 size 个。"""
+
+    def __init__(self, url=None, size=None, timeout=None, retries=None):
+        parts = urllib.parse.urlsplit(url or API)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path + (f"?{parts.query}" if parts.query else "")
+        self.size = size or CONCURRENCY
+        self.timeout = TIMEOUT if timeout is None else timeout
+        self.retries = RETRIES if retries is None else retries
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        # 需求之间并行、淘汰赛各组之间也并行，总的在途请求在这里封顶
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            return cls(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn):
+        with self._lock:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+                return
+        conn.close()
+
+    def post_json(self, payload, headers=None):
+        """POST 一个 JSON，返回解析后的响应。网络错误、429、5xx 退避重试，其他状态码直接失败。"""
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(BACKOFF_BASE * 2 ** (attempt - 1))
+            try:
+                with self._slots:
+                    conn = self._acquire()
+                    conn.request("POST", self.path, body, headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                # 服务端关掉的空闲连接也走这里：换一条新连接重试
+                conn.close()
+                error = JudgeError(str(e) or type(e).__name__)
+                continue
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if resp.status == 200:
+                return json.loads(data.decode("utf-8"))
+            error = JudgeError(f"HTTP {resp.status}: {data[:200].decode('utf-8', errors='replace')}")
+            if resp.status != 429 and resp.status < 500:
+                break
+        raise error
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = JudgeClient()
+            atexit.register(_client.close)
+    return _client
+
+
+# ============================================================
+# 本地桩服务
+# ============================================================
+
+def serve_stub(port=8765, delay=0.0):
+    """OpenAI 兼容的假评判接口：回复消息里第一个「来自Cx」的居民"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 保持连接
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = request["messages"][-1]["content"]
+            match = re.search(r"来自(\w+)", prompt)
+            time.sleep(delay)
+            body = json.dumps({"choices": [{"message": {"content": match.group(1) if match else ""}}]})
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"[评判桩] http://127.0.0.1:{port}/v1/chat/completions")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="评判接口本地桩")
+    parser.add_argument("command", choices=["stub"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    serve_stub(args.port, args.delay)
@@ -5,27 +5,47 @@ OpenClaw Genesis — 唯一入口
   python main.py        → 跑1天
   python main.py 3      → 跑3天
   python main.py daemon → 守护进程，每天自动跑一天
+  python main.py add C6 [agent]  → 新居民加入（agent 默认 c6）
+  python main.py retire C6       → 居民退休
 """
 import os
 import sys
 import io
 import time
+from collections import defaultdict
 from datetime import datetime, date
 ROUNDS_PER_DAY = 3
+# 快照并行轮次（opt-in）：GENESIS_PARALLEL_ROUNDS=1
+PARALLEL_ROUNDS = os.environ.get("GENESIS_PARALLEL_ROUNDS") == "1"
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
 
+import storage
 import treasury
 import economy
 import needs as needs_module
 import plaza
 import chronicle
 import agent_bridge
+import deadlines
+import settlement
 import publish
+import publish_queue
 import external
 
-CITIZEN_IDS = ["C1", "C2", "C3", "C4", "C5"]
+# 创世时的居民；之后的增减走 add / retire，名册在经济状态里（economy.citizen_ids）
+GENESIS_CITIZENS = ["C1", "C2", "C3", "C4", "C5"]
+
+# run_day 各阶段的累计耗时（秒），bench.py 读取
+PHASE_TIMES = defaultdict(float)
+
+
+def _lap(phase, started):
+    """把 started 到现在的耗时计入 phase，返回现在（作为下一阶段的起点）"""
+    now = time.perf_counter()
+    PHASE_TIMES[phase] += now - started
+    return now
 
 
 # ============================================================
@@ -37,20 +57,20 @@ def init_world():
     os.makedirs("data", exist_ok=True)
     os.makedirs("observations", exist_ok=True)
 
-    if os.path.exists("data/treasury.json"):
+    if storage.exists("treasury"):
         return  # 已初始化
 
     print("=" * 50)
     print("  OpenClaw Genesis — 创世纪")
     print("=" * 50)
 
-    for cid in CITIZEN_IDS:
+    for cid in GENESIS_CITIZENS:
         agent_bridge.register(cid)
         print(f"[创世] {cid} 来到了这个世界")
 
     ts = treasury.get_status()
     print(f"[金库] 种子基金: {ts['balance']} token，预计维持 {ts['days_left']} 天")
-    chronicle.record_event(0, "genesis", "世界创建。5个白板居民，800 token种子基金。")
+    chronicle.record_event(0, "genesis", f"世界创建。{len(GENESIS_CITIZENS)}个白板居民，800 token种子基金。")
     needs_module.generate_daily_needs(1)
 
 
@@ -63,6 +83,12 @@ def run_day(day):
     print(f"\n{'=' * 50}")
     print(f"  第 {day} 天")
     print(f"{'=' * 50}")
+    lap = time.perf_counter()
+    # 之前推送已确认的发布，先把发布奖励记上
+    _credit_publishes()
+    # 名册可能被别的进程改过（add / retire / human.py），每天开始重读一次
+    economy.reload_roster()
+    citizen_ids = economy.citizen_ids(agents_only=True)
 
     # 1. 确保当天需求已生成
     if not needs_module.get_open_needs():
@@ -71,72 +97,86 @@ def run_day(day):
             print(f"[需求] 发布 {len(daily_needs)} 个世界需求")
         else:
             print("[需求] 金库告急，今日无需求")
-
-    # 2. 多轮串行行动（节省内存，且后轮居民能看到前轮发言）
-    actions_log = {cid: [] for cid in CITIZEN_IDS}
+    lap = _lap("needs", lap)
+
+    # 2. 多轮行动
+    #    默认串行（节省内存，且同一轮后面的居民能看到前面的发言）；
+    #    PARALLEL_ROUNDS 时同一轮所有居民基于同一快照并发思考，轮次耗时≈最慢的那个
+    #    每个居民的截止时间由其历史耗时决定，当天总耗时受 deadlines.DAY_BUDGET 限制
+    actions_log = {cid: [] for cid in citizen_ids}
+    active_ids = economy.citizen_ids(active_only=True, agents_only=True)
+    slots = ROUNDS_PER_DAY if PARALLEL_ROUNDS else ROUNDS_PER_DAY * len(active_ids)
+    budget = deadlines.DayBudget(deadlines.DAY_BUDGET, slots)
     for round_num in range(1, ROUNDS_PER_DAY + 1):
         print(f"\n[第{round_num}轮/{ROUNDS_PER_DAY}]")
-        for cid in CITIZEN_IDS:
+        if PARALLEL_ROUNDS:
+            try:
+                round_results = agent_bridge.run_round_parallel(
+                    active_ids, day, round_num, ROUNDS_PER_DAY, budget)
+                for cid, results in round_results.items():
+                    actions_log[cid].extend(results)
+            except Exception as e:
+                print(f"  [第{round_num}轮] 异常: {e}")
+            continue
+        snapshot = agent_bridge.WorldSnapshot(day, round_num, ROUNDS_PER_DAY)
+        for cid in active_ids:
             try:
-                results = agent_bridge.run_citizen_turn(cid, day, round_num, ROUNDS_PER_DAY)
+                results = agent_bridge.run_citizen_turn(
+                    cid, day, round_num, ROUNDS_PER_DAY, snapshot, budget)
                 actions_log[cid].extend(results)
             except Exception as e:
                 print(f"  [{cid}] 异常: {e}")
+    lap = _lap("rounds", lap)
 
-    # 3. 评判世界需求
+    # 3. 评判世界需求（模型评判并发进行，不写状态）
     print("\n[评判] 评选世界需求...")
-    data = needs_module._load()
-    for need in data.get("active_needs", []):
-        if not need.get("submissions") or need["status"] != "open":
-            continue
-        reward = needs_module.judge_and_reward(need["id"])
-        if reward <= 0:
-            continue
-        updated = needs_module._load()
-        for n in updated.get("active_needs", []) + updated.get("history", []):
-            if n["id"] == need["id"] and n.get("winner"):
-                winner = n["winner"]
-                print(f"  {need['title']} → {winner} 获得 {reward} token")
-                chronicle.record_event(day, "need_completed",
-                    f"{winner} 完成了 '{need['title']}'，获得 {reward} token", winner)
-                if need.get("external"):
-                    subs = need.get("submissions", [])
-                    content = next((s["content"] for s in subs if s["citizen_id"] == winner), "")
-                    if content:
-                        _try_publish(day, need, content, winner)
-                break
-
-    # 4. 扣除生存成本
+    verdicts = needs_module.judge_open_needs()
+    lap = _lap("judge", lap)
+
+    # 4. 结算：发奖励、扣生存成本、休眠、归档需求，一次提交
+    def on_award(award, need):
+        winner, reward = award["winner"], award["reward"]
+        print(f"  {award['title']} → {winner} 获得 {reward} token")
+        if need.get("external"):
+            content = next((s["content"] for s in need["submissions"] if s["citizen_id"] == winner), "")
+            if content:
+                _try_publish(day, need, content, winner)
+
+    settled = settlement.settle(day, verdicts, on_award)
+    survival = settled["survival"]
     print("\n[生存] 扣除每日成本...")
-    survival = economy.deduct_survival_cost()
     for cid, status in survival.items():
         if status == "hibernated":
             print(f"  {cid} 余额归零，休眠")
-            chronicle.record_event(day, "hibernation", f"{cid} 休眠", cid)
         elif status != "hibernating":
             print(f"  {cid}: {status}")
+    lap = _lap("settle", lap)
 
-    # 5. 关闭当天需求 + 更新发布索引
-    needs_module.close_day()
+    # 5. 更新发布索引，当天的文章和索引由后台合成一次提交推送
     try:
         publish.update_index(day)
     except Exception:
         pass
+    publish_queue.flush(day)
+    lap = _lap("close", lap)
 
     # 6. 编年史
-    ts = treasury.get_status()
+    ts = settled["treasury"]
     chronicle.record_day(day, {
         "day": day,
         "treasury": ts,
         "survival": survival,
         "actions_count": {cid: len(acts) for cid, acts in actions_log.items()},
         "time": datetime.now().isoformat(),
-    })
+    }, balances={cid: c["balance"] for cid, c in economy.get_all_citizens().items()})
+    # 日终把各状态文件的追加日志压缩成快照
+    storage.compact_all()
+    lap = _lap("chronicle", lap)
 
     print(f"\n[金库] 余额: {ts['balance']} token（还能撑 {ts['days_left']} 天）")
-    active = sum(1 for cid in CITIZEN_IDS
-                 if economy.get_citizen(cid) and economy.get_citizen(cid)["status"] == "active")
-    print(f"[人口] {active}/{len(CITIZEN_IDS)} 活跃")
+    active = len(economy.citizen_ids(active_only=True, agents_only=True))
+    print(f"[人口] {active}/{len(citizen_ids)} 活跃")
+    _lap("census", lap)
     print(f"{'=' * 50}\n")
 
     if active == 0:
@@ -147,31 +187,50 @@ def run_day(day):
 
 
 def _try_publish(day, need, content, winner):
-    """尝试发布到外部，成功给1 token外部收入"""
+    """尝试发布到外部；推送确认后给1 token外部收入（见 _credit_publishes）"""
     try:
-        ok = False
+        job = None
+        source = f"publish:{need['id']}"
         if need["id"] == "daily_intel":
-            ok = publish.publish_daily_intel(day, content, winner)
+            job = publish.publish_daily_intel(day, content, winner, source=source)
         elif need["id"] == "open_research":
-            ok = publish.publish_research(day, need["title"], content, winner)
-        if ok:
-            print(f"  [发布] {need['title']} → GitHub Pages")
-            external.record_income(1, winner, f"publish:{need['id']}")
-            print(f"  [外部收入] {winner} 获得 1 token（发布奖励）")
+            job = publish.publish_research(day, need["title"], content, winner, source=source)
+        if job:
+            print(f"  [发布] {need['title']} → GitHub Pages（排队推送）")
     except Exception as e:
         print(f"  [发布] 失败: {e}")
 
 
+def _credit_publishes():
+    """推送已确认的发布各给1 token外部收入。
+    收入提交之后才从发布队列里 ack 掉；中间退出的，下次按收入记录里的 job 去重。"""
+    jobs = publish_queue.confirmed()
+    if not jobs:
+        return
+    with storage.unit_of_work():
+        for job in jobs:
+            key = publish_queue.job_key(job)
+            if not job.get("source") or external.income_recorded(job["author"], key):
+                continue
+            external.record_income(1, job["author"], job["source"], job=key)
+            print(f"  [外部收入] {job['author']} 获得 1 token（D{job['day']:03d} 发布已推送）")
+    publish_queue.ack(j["id"] for j in jobs)
+
+
 # ============================================================
 # 天数推断
 # ============================================================
 
 def get_current_day():
-    history = chronicle.get_full_history()
-    if not history:
-        return 1
-    days = [e.get("day", 0) for e in history if isinstance(e.get("day"), int)]
-    return max(days) + 1 if days else 1
+    latest = chronicle.latest_day()
+    return latest + 1 if latest is not None else 1
+
+
+def _roster_day():
+    """名册变动（加入、退休）记在最近有记录的一天，还没开始时记在第 0 天（和创世居民一样）。
+    不能记在 get_current_day()：那一天还没跑，记上事件就推进了天数推断，下次运行会跳过一天。"""
+    latest = chronicle.latest_day()
+    return latest if latest is not None else 0
 
 
 # ============================================================
@@ -184,6 +243,9 @@ def run_once(days=1):
     for d in range(current_day, current_day + days):
         if not run_day(d):
             break
+    # 等后台把最后一天推上去，发布奖励不留到下次运行
+    publish_queue.wait(publish_queue.WAIT)
+    _credit_publishes()
     print("[完毕] 记得写观察日志到 observations/ 目录。")
 
 
@@ -214,9 +276,33 @@ def run_daemon():
             time.sleep(300)
 
 
+def add_citizen(citizen_id, agent=None):
+    init_world()
+    existing = economy.get_citizen(citizen_id)
+    if existing and existing["status"] != "retired":
+        print(f"[名册] {citizen_id} 已经在世界里了")
+        return
+    agent_bridge.register(citizen_id, agent=agent, day=_roster_day())
+    print(f"[名册] {citizen_id} 加入世界（agent: {economy.agent_of(citizen_id)}）")
+    if not economy.is_active(citizen_id):
+        print(f"[名册] {citizen_id} 余额已耗尽，回来后处于休眠")
+
+
+def retire_citizen(citizen_id):
+    if not economy.retire_citizen(citizen_id):
+        print(f"[名册] 没有在世的居民 {citizen_id}")
+        return
+    chronicle.record_event(_roster_day(), "retirement", f"{citizen_id} 退休", citizen_id)
+    print(f"[名册] {citizen_id} 退休")
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "daemon":
         run_daemon()
+    elif len(sys.argv) > 2 and sys.argv[1] == "add":
+        add_citizen(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    elif len(sys.argv) > 2 and sys.argv[1] == "retire":
+        retire_citizen(sys.argv[2])
     else:
         days = int(sys.argv[1]) if len(sys.argv) > 1 else 1
         run_once(days=days)
@@ -4,19 +4,30 @@
 需求是竞争制的：多人可提交，质量最好的获得报酬。
 金库空了就停发，这是真实的经济压力。
 """
-import json
 import os
-import urllib.request
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import storage
 import treasury
+import judge_client
+import verdicts
+import dedup
 
-DATA_FILE = "data/needs.json"
-
-# 评判用付费模型（免费模型上下文不够评判长内容）
-JUDGE_API = "https://api.siliconflow.cn/v1/chat/completions"
+# 评判用付费模型（免费模型上下文不够评判长内容）；接口地址见 judge_client.API
 JUDGE_MODEL = "deepseek-ai/DeepSeek-V3.2"
 JUDGE_API_KEY = os.environ.get("SILICONFLOW_API_KEY", "")
+# 淘汰赛评判：每个提示词最多几个提交，每个提交最多给模型看多少字
+JUDGE_BATCH = max(2, int(os.environ.get("GENESIS_JUDGE_BATCH", "4")))
+JUDGE_EXCERPT = int(os.environ.get("GENESIS_JUDGE_EXCERPT", "2000"))
+JUDGE_SYSTEM = "你是公正的评判者，只回复获胜者编号。"
+JUDGE_PROMPT = (
+    "你是世界需求的评判者。需求是：{title} — {desc}\n\n"
+    "以下是所有提交：{entries}\n\n"
+    "请评判哪个提交质量最高。评判标准：内容真实性、信息量、结构清晰度。\n"
+    "只回复获胜者的居民编号（如C1），不要其他内容。"
+)
 
 # 每日自动生成的世界需求
 DAILY_NEEDS = [
@@ -50,165 +61,265 @@ DAILY_NEEDS = [
     },
 ]
 
+# active_needs 只存当天需求本身（几条、很小）；提交和投票各自是一条条记录，
+# 按需求的 day 分段、带 need_id 和 opened（这批需求生成的时间，同一天重新生成时不会串），
+# 每次 submit / vote 只追加一行，不重写整天的提交。
+_store = storage.Store("needs", lambda: {"day": 0, "active_needs": [], "history": [],
+                                         "submissions": [], "votes": []},
+                       lists=("history", "submissions", "votes"),
+                       partitioned=("submissions", "votes"))
+
+# 记录里定位需求的字段，拼回需求时去掉
+_RECORD_FIELDS = ("day", "need_id", "opened")
+
 def _load():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"day": 0, "active_needs": [], "history": []}
+    return _store.load()
+
+def _assemble(needs):
+    """需求加上它们的提交和投票（旧版整块存在需求里的也算上），格式和原来一样。
+    每个列表按天只查一次，再按需求分组"""
+    grouped = {}
+    for key in ("submissions", "votes"):
+        for day in {n.get("day") for n in needs}:
+            for r in _store.query(key, day=day):
+                grouped.setdefault((key, r["need_id"], r.get("opened")), []).append(r)
+    result = []
+    for need in needs:
+        where = (need["id"], need.get("opened"))
+        subs = list(need.get("submissions", []))
+        subs += [{k: v for k, v in r.items() if k not in _RECORD_FIELDS}
+                 for r in grouped.get(("submissions", *where), [])]
+        votes = dict(need.get("votes", {}))
+        for r in grouped.get(("votes", *where), []):
+            votes[r["citizen_id"]] = r["candidate"]  # 重新投票覆盖之前的
+        result.append({**need, "submissions": subs, "votes": votes})
+    return result
+
+def _find_open(need_id):
+    """找到开放中的需求，返回 (下标, 带提交和投票的 need)，没有则 (None, None)"""
+    for i, need in enumerate(_store.get("active_needs")):
+        if need["id"] == need_id and need["status"] == "open":
+            return i, _assemble([need])[0]
+    return None, None
 
-def _save(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _locate(need):
+    return {"day": need.get("day"), "need_id": need["id"], "opened": need.get("opened")}
 
 # 砍减优先级：金库不足时从低优先级开始砍
 NEED_PRIORITY = ["daily_intel", "chronicle", "quality_review", "open_research"]
 
 def generate_daily_needs(day):
     """生成当天的世界需求，金库不足时按优先级砍"""
-    data = _load()
-    data["day"] = day
-
     treasury_status = treasury.get_status()
     if not treasury_status["healthy"]:
-        data["active_needs"] = []
-        _save(data)
+        _store.apply(["set", ["day"], day], ["set", ["active_needs"], []])
         return []
 
     # 按优先级排序，高优先级先拿预算
     sorted_templates = sorted(DAILY_NEEDS,
         key=lambda t: NEED_PRIORITY.index(t["id"]) if t["id"] in NEED_PRIORITY else 99)
     budget = treasury_status["balance"]
+    opened = datetime.now().isoformat()
     needs = []
     for template in sorted_templates:
         if budget >= template["reward"]:
             needs.append({
                 **template,
                 "day": day,
-                "submissions": [],
-                "votes": {},
+                "opened": opened,
                 "winner": None,
                 "status": "open",
             })
             budget -= template["reward"]
 
-    data["active_needs"] = needs
-    _save(data)
-    return needs
+    _store.apply(["set", ["day"], day], ["set", ["active_needs"], needs])
+    return _assemble(needs)
 
 def submit(need_id, citizen_id, content):
     """居民提交需求成果"""
-    data = _load()
-    for need in data["active_needs"]:
-        if need["id"] == need_id and need["status"] == "open":
-            need["submissions"].append({
-                "citizen_id": citizen_id,
-                "content": content,
-                "time": datetime.now().isoformat()
-            })
-            _save(data)
-            return True
-    return False
+    _, need = _find_open(need_id)
+    if need is None:
+        return False
+    submission = {
+        "citizen_id": citizen_id,
+        "content": content,
+        "time": datetime.now().isoformat()
+    }
+    # 和已有提交、往日获胜提交高度相似的标记为重复，评判时不再送给模型
+    duplicate = dedup.find_duplicate(need_id, content, need.get("submissions", []))
+    if duplicate:
+        submission["duplicate_of"] = duplicate
+    _store.apply(["append", ["submissions"], {**_locate(need), **submission}])
+    return True
 
 def vote(need_id, citizen_id, candidate):
     """居民为某个需求的提交投票"""
-    data = _load()
-    for need in data["active_needs"]:
-        if need["id"] == need_id and need["status"] == "open":
-            if citizen_id == candidate:
-                return False
-            if not any(s["citizen_id"] == candidate for s in need.get("submissions", [])):
-                return False
-            votes = need.setdefault("votes", {})
-            votes[citizen_id] = candidate
-            _save(data)
-            return True
-    return False
-
-def _llm_judge(need_title, need_desc, submissions):
-    """用免费模型评判提交质量，返回winner的citizen_id"""
+    _, need = _find_open(need_id)
+    if need is None:
+        return False
+    if citizen_id == candidate:
+        return False
+    if not any(s["citizen_id"] == candidate for s in need.get("submissions", [])):
+        return False
+    _store.apply(["append", ["votes"], {**_locate(need), "citizen_id": citizen_id, "candidate": candidate}])
+    return True
+
+def _llm_judge(need_title, need_desc, submissions, strict=False):
+    """用免费模型评判提交质量，返回winner的citizen_id。
+    提交多时按淘汰赛评：每 JUDGE_BATCH 个一组，各组并行评出胜者进入下一轮，
+    直到剩一组决出冠军。每个提示词最多 JUDGE_BATCH 个提交、每个最多 JUDGE_EXCERPT 字，
+    长度不随提交数增长。胜者按原提交顺序晋级，模型回复里认不出编号时取组内第一个。
+    调用失败时回退到第一个提交；strict=True 时改为抛出异常（缓存据此只存真实结果）。"""
     if len(submissions) == 1:
         return submissions[0]["citizen_id"]
 
+    try:
+        field = list(submissions)
+        while len(field) > 1:
+            groups = [field[i:i + JUDGE_BATCH] for i in range(0, len(field), JUDGE_BATCH)]
+            if len(groups) == 1:
+                winners = [_judge_batch(need_title, need_desc, groups[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(groups), judge_client.CONCURRENCY)) as pool:
+                    winners = list(pool.map(lambda g: _judge_batch(need_title, need_desc, g), groups))
+            field = winners
+        return field[0]["citizen_id"]
+    except Exception:
+        if strict:
+            raise
+        return submissions[0]["citizen_id"]
+
+
+def _judge_batch(need_title, need_desc, batch):
+    """一组提交调一次模型，返回胜出的那个提交（只有一个时不调）"""
+    if len(batch) == 1:
+        return batch[0]
+
     entries = ""
-    for i, s in enumerate(submissions):
-        entries += f"\n提交{i+1} (来自{s['citizen_id']}):\n{s['content'][:500]}\n"
-
-    prompt = (
-        f"你是世界需求的评判者。需求是：{need_title} — {need_desc}\n\n"
-        f"以下是所有提交：{entries}\n\n"
-        f"请评判哪个提交质量最高。评判标准：内容真实性、信息量、结构清晰度。\n"
-        f"只回复获胜者的居民编号（如C1），不要其他内容。"
-    )
+    for i, s in enumerate(batch):
+        entries += f"\n提交{i+1} (来自{s['citizen_id']}):\n{s['content'][:JUDGE_EXCERPT]}\n"
 
-    payload = json.dumps({
+    prompt = JUDGE_PROMPT.format(title=need_title, desc=need_desc, entries=entries)
+
+    payload = {
         "model": JUDGE_MODEL,
         "messages": [
-            {"role": "system", "content": "你是公正的评判者，只回复获胜者编号。"},
+            {"role": "system", "content": JUDGE_SYSTEM},
             {"role": "user", "content": prompt}
         ],
         "max_tokens": 32,
         "temperature": 0.1,
-    }).encode("utf-8")
+    }
 
-    req = urllib.request.Request(
-        JUDGE_API, data=payload,
-        headers={"Content-Type": "application/json", "Authorization": f"Bearer {JUDGE_API_KEY}"}
-    )
+    data = judge_client.get_client().post_json(
+        payload, {"Authorization": f"Bearer {JUDGE_API_KEY}"})
+    text = data["choices"][0]["message"]["content"].strip()
+    # 从回复中提取居民ID：取最先出现的完整编号（C1 不会误中 C12）
+    found = []
+    for s in batch:
+        m = re.search(rf"(?<![A-Za-z0-9_]){re.escape(s['citizen_id'])}(?![A-Za-z0-9_])", text)
+        if m:
+            found.append((m.start(), s))
+    # 没匹配到就给第一个
+    return min(found, key=lambda f: f[0])[1] if found else batch[0]
+
+
+def _verdict_key(need):
+    template = f"{JUDGE_SYSTEM}{JUDGE_PROMPT}|batch={JUDGE_BATCH}|excerpt={JUDGE_EXCERPT}"
+    return verdicts.key(need["id"], JUDGE_MODEL, template, dedup.distinct(need["submissions"]))
+
+
+def _judge_uncached(need):
+    """调模型评判一个需求，返回 (获胜者, 是否是模型给出的结果)。不碰状态，可在线程里跑。
+    标记为重复的提交不参加评判（见 dedup.py）。"""
+    candidates = dedup.distinct(need["submissions"])
+    if len(candidates) == 1:
+        return candidates[0]["citizen_id"], False  # 不用调模型，也不必缓存
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-            text = data["choices"][0]["message"]["content"].strip()
-            # 从回复中提取居民ID
-            for s in submissions:
-                if s["citizen_id"] in text:
-                    return s["citizen_id"]
-            # 没匹配到就给第一个
-            return submissions[0]["citizen_id"]
+        return _llm_judge(need["title"], need["desc"], candidates, strict=True), True
     except Exception:
-        return submissions[0]["citizen_id"]
+        return candidates[0]["citizen_id"], False
 
 
-def judge_and_reward(need_id):
-    """评判并发放奖励（有投票用投票，否则LLM评分）"""
-    data = _load()
-    for need in data["active_needs"]:
-        if need["id"] == need_id and need["status"] == "open":
-            subs = need.get("submissions", [])
-            if not subs:
-                return 0
-
-            votes = need.get("votes", {})
-            if votes:
-                from collections import Counter
-                counts = Counter(votes.values())
-                winner_id = counts.most_common(1)[0][0]
-            else:
-                winner_id = _llm_judge(need["title"], need["desc"], subs)
+def _remember(need, outcome):
+    winner, judged = outcome
+    if judged:
+        verdicts.put(_verdict_key(need), winner)
+    return winner
 
-            need["winner"] = winner_id
-            need["status"] = "completed"
 
-            result = treasury.withdraw(need["reward"], purpose=f"need:{need_id}")
-            if result is not None:
-                from economy import reward
-                reward(winner_id, need["reward"], source=f"need:{need_id}")
-                _save(data)
-                return need["reward"]
-            else:
-                need["status"] = "unfunded"
-                _save(data)
-                return 0
-    return 0
+def judge_open_needs():
+    """并发评判所有有提交、没人投票的开放需求（最多 judge_client.CONCURRENCY 个同时进行），
+    返回 {need_id: winner_id}。同一批提交评过的直接用 verdicts 缓存，不调模型；
+    发奖励交给 judge_and_reward。"""
+    results = {}
+    pending = []
+    for need in get_open_needs():
+        if not need.get("submissions") or need.get("votes"):
+            continue
+        winner = verdicts.get(_verdict_key(need))
+        if winner is not None:
+            results[need["id"]] = winner
+        else:
+            pending.append(need)
+    if not pending:
+        return results
+    workers = max(1, min(len(pending), judge_client.CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(_judge_uncached, pending))
+    for need, outcome in zip(pending, outcomes):
+        results[need["id"]] = _remember(need, outcome)
+    return results
+
+
+def judge_and_reward(need_id, winner_id=None):
+    """评判并发放奖励，返回发出的奖励（没发返回 0）"""
+    result = settle_need(need_id, winner_id)
+    return result["reward"] if result else 0
+
+
+def settle_need(need_id, winner_id=None):
+    """评判并发放奖励（有投票用投票，否则用 judge_open_needs 给出的 winner_id，没有再调LLM评分）。
+    返回 {"need_id", "title", "winner", "reward", "status"}；需求不存在或没有提交返回 None。"""
+    i, need = _find_open(need_id)
+    if need is None:
+        return None
+    subs = need.get("submissions", [])
+    if not subs:
+        return None
+
+    votes = need.get("votes", {})
+    if votes:
+        from collections import Counter
+        counts = Counter(votes.values())
+        winner_id = counts.most_common(1)[0][0]
+    elif winner_id is None:
+        winner_id = verdicts.get(_verdict_key(need)) or _remember(need, _judge_uncached(need))
+
+    result = treasury.withdraw(need["reward"], purpose=f"need:{need_id}")
+    if result is not None:
+        from economy import reward
+        reward(winner_id, need["reward"], source=f"need:{need_id}")
+        status = "completed"
+    else:
+        status = "unfunded"
+    _store.apply(
+        ["set", ["active_needs", i, "winner"], winner_id],
+        ["set", ["active_needs", i, "status"], status],
+    )
+    return {"need_id": need_id, "title": need["title"], "winner": winner_id,
+            "reward": need["reward"] if status == "completed" else 0, "status": status}
 
 def get_open_needs():
     """获取当前开放的需求"""
-    data = _load()
-    return [n for n in data["active_needs"] if n["status"] == "open"]
+    return _assemble([n for n in _store.get("active_needs") if n["status"] == "open"])
 
 def close_day():
-    """结束当天，归档需求"""
-    data = _load()
-    data["history"].extend(data["active_needs"])
-    data["active_needs"] = []
-    _save(data)
+    """结束当天，归档需求，返回归档的需求数"""
+    # 归档的需求带着提交和投票，历史格式不变
+    active = _assemble(_store.get("active_needs"))
+    _store.apply(
+        ["extend", ["history"], active],
+        ["set", ["active_needs"], []],
+    )
+    return len(active)
@@ -3,42 +3,48 @@
 所有居民（包括人类）可以在这里发言、看到彼此的发言。
 就像CIVITAS的广场演讲。
 """
-import json
-import os
 from datetime import datetime
 
-DATA_FILE = "data/plaza.json"
+import storage
 
-def _load():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"messages": []}
+_store = storage.Store("plaza", lambda: {"messages": []},
+                       lists=("messages",), partitioned=("messages",))
 
-def _save(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _load():
+    return _store.load()
 
 def speak(citizen_id, content, day=0):
     """在广场发言"""
-    data = _load()
     msg = {
         "citizen_id": citizen_id,
         "content": content,
         "day": day,
         "time": datetime.now().isoformat()
     }
-    data["messages"].append(msg)
-    _save(data)
+    _store.apply(["append", ["messages"], msg])
     return msg
 
 def get_recent(limit=20):
     """获取最近的广场发言"""
-    data = _load()
-    return data["messages"][-limit:]
+    return _store.tail("messages", limit)
 
 def get_day_messages(day):
     """获取某天的所有发言"""
-    data = _load()
-    return [m for m in data["messages"] if m.get("day") == day]
+    return _store.query("messages", day=day)
+
+def get_page(day, cursor=0, limit=20):
+    """分页读某天的发言：从第 cursor 条起最多 limit 条。
+    返回 (消息, 下一页游标)，没有更多时游标为 None"""
+    # 多取一条判断后面还有没有，剩下正好 limit 条时不给出指向空页的游标
+    messages = _store.page("messages", day, cursor, limit + 1)
+    next_cursor = cursor + limit if len(messages) > limit else None
+    return messages[:limit], next_cursor
+
+def get_since(cursor=None):
+    """游标之后的所有新发言，返回 (消息, 新游标)。
+    游标是 [day, 当天已读条数]，None 表示从头开始；把返回的游标存起来下次接着读。"""
+    return _store.since("messages", cursor)
+
+def get_cursor():
+    """当前最新发言之后的游标，之后可用 get_since 只读新发言"""
+    return _store.end_cursor("messages")
@@ -1,24 +1,71 @@
 """
 对外发布 - 把居民产出推到GitHub Pages
 这是世界与真实世界的接口，也是外部收入的来源。
+这里只写文件并放进发布队列，提交和推送由 publish_queue 在后台合并完成。
+
+已发布的文章记在清单里（data 下的 published：路径、天、作者、标题、内容哈希），
+只在发布时更新。索引、作者页（blog/authors/<居民>.md）和 Atom 订阅（blog/feed.xml）
+都从清单生成：没有新发布的日子什么都不做；有新发布时只重算受影响的作者页，
+渲染结果和上次写出的一样就不写、不进发布队列，当天的 git diff 只有真正变了的文件。
 """
+import hashlib
 import os
-import subprocess
 from datetime import datetime
+from xml.sax.saxutils import escape
 
-OUTPUT_REPO = "/workspace/zuiho-kai.github.io"
+import publish_queue
+import storage
 
+OUTPUT_REPO = os.environ.get("GENESIS_PUBLISH_REPO", "/workspace/zuiho-kai.github.io")
+SITE_URL = os.environ.get("GENESIS_SITE_URL", "https://zuiho-kai.github.io")
+INDEX_FILE = "blog/index.md"
+FEED_FILE = "blog/feed.xml"
+INDEX_LIMIT = 10   # 索引里每类列最近几篇
+FEED_LIMIT = 20    # 订阅里最近几篇
 
-def publish_daily_intel(day, content, author_id):
-    """发布每日情报到GitHub Pages"""
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    filename = f"blog/daily/{date_str}-D{day:03d}.md"
-    filepath = os.path.join(OUTPUT_REPO, filename)
+# posts: 路径 → {"path", "kind", "day", "citizen_id", "title", "hash", "time"}
+# outputs: 生成的文件路径 → 上次写出内容的哈希
+# dirty: 有新发布、作者页待重算的居民
+_store = storage.Store("published", lambda: {"posts": {}, "outputs": {}, "dirty": []},
+                       maps=("posts", "outputs"))
+
+KINDS = {"daily": "每日情报", "research": "自由研究"}
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
+
+def _publish(day, kind, filename, title, author_id, md, message, source):
+    """写文章、记清单、进发布队列，返回发布任务 id；内容和已发布的一样时返回 None"""
+    _ensure_manifest()
+    digest = _hash(md)
+    old = _store.get("posts").get(filename)
+    if old is not None and old["hash"] == digest:
+        return None
+
+    filepath = os.path.join(OUTPUT_REPO, filename)
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(md)
+
+    dirty = _store.get("dirty")
+    _store.apply(["set", ["posts", filename], {
+        "path": filename, "kind": kind, "day": day, "citizen_id": author_id, "title": title,
+        "hash": digest, "time": datetime.now().astimezone().isoformat(timespec="seconds"),
+    }], ["set", ["dirty"], sorted(set(dirty) | {author_id} | ({old["citizen_id"]} if old else set()))])
+    return publish_queue.enqueue(day, OUTPUT_REPO, filename, message, author_id, source)
+
+
+def publish_daily_intel(day, content, author_id, source=None):
+    """发布每日情报到GitHub Pages，返回发布任务 id（内容没变时 None）。
+    source 不为空时推送确认后记一笔外部收入（见 main._credit_publishes）。"""
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    filename = f"blog/daily/{date_str}-D{day:03d}.md"
+    title = f"每日AI/科技情报 — D{day:03d}"
 
     md = (
-        f"# 每日AI/科技情报 — D{day:03d}\n\n"
+        f"# {title}\n\n"
         f"日期: {date_str} | 作者: {author_id} | OpenClaw Genesis\n\n"
         f"---\n\n"
         f"{content}\n\n"
@@ -26,20 +73,15 @@ def publish_daily_intel(day, content, author_id):
         f"*由 OpenClaw Genesis 居民自主搜索、整理、发布。*\n"
     )
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(md)
+    return _publish(day, "daily", filename, title, author_id, md,
+                    f"D{day:03d} 每日情报 by {author_id}", source)
 
-    return _git_push(filename, f"D{day:03d} 每日情报 by {author_id}")
 
-
-def publish_research(day, title, content, author_id):
-    """发布自由研究到GitHub Pages"""
+def publish_research(day, title, content, author_id, source=None):
+    """发布自由研究到GitHub Pages，返回发布任务 id（内容没变时 None）"""
     date_str = datetime.now().strftime("%Y-%m-%d")
     safe_title = title.replace("/", "-").replace(" ", "-")[:50]
     filename = f"blog/research/{date_str}-{safe_title}.md"
-    filepath = os.path.join(OUTPUT_REPO, filename)
-
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
     md = (
         f"# {title}\n\n"
@@ -50,78 +92,176 @@ def publish_research(day, title, content, author_id):
         f"*由 OpenClaw Genesis 居民自主研究、撰写。*\n"
     )
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(md)
+    return _publish(day, "research", filename, title, author_id, md,
+                    f"研究: {title} by {author_id}", source)
 
-    return _git_push(filename, f"研究: {title} by {author_id}")
 
+# ============================================================
+# 索引、作者页、订阅
+# ============================================================
 
 def update_index(day):
-    """更新博客索引"""
-    filepath = os.path.join(OUTPUT_REPO, "blog/index.md")
-
-    daily_files = []
-    research_files = []
-    daily_dir = os.path.join(OUTPUT_REPO, "blog/daily")
-    research_dir = os.path.join(OUTPUT_REPO, "blog/research")
-
-    if os.path.exists(daily_dir):
-        for f in sorted(os.listdir(daily_dir), reverse=True):
-            if f.endswith(".md"):
-                daily_files.append(f)
-    if os.path.exists(research_dir):
-        for f in sorted(os.listdir(research_dir), reverse=True):
-            if f.endswith(".md"):
-                research_files.append(f)
-
-    # 读取现有 blog/index.md，保留专题文章部分
+    """按清单更新索引、作者页和订阅。没有新发布时直接返回；只写内容变了的文件。"""
+    with storage.unit_of_work():
+        _ensure_manifest()
+        dirty = _store.get("dirty")
+        posts = _store.get("posts")
+        if not posts or (not dirty and os.path.exists(os.path.join(OUTPUT_REPO, INDEX_FILE))):
+            return
+        posts = sorted(posts.values(), key=lambda p: p["path"], reverse=True)
+
+        for cid in dirty:
+            mine = [p for p in posts if p["citizen_id"] == cid]
+            _write(day, f"blog/authors/{cid}.md", _render_author(cid, mine), f"更新作者页 {cid}")
+        _write(day, FEED_FILE, _render_feed(posts), f"更新订阅 D{day:03d}")
+        _write_index(day, _render_index(posts))
+        _store.apply(["set", ["dirty"], []])
+
+
+def _write(day, path, text, message):
+    """内容和上次写出的不同才写文件、进发布队列"""
+    digest = _hash(text)
+    if _store.get("outputs").get(path) == digest:
+        return False
+    filepath = os.path.join(OUTPUT_REPO, path)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(text)
+    _store.apply(["set", ["outputs", path], digest])
+    publish_queue.enqueue(day, OUTPUT_REPO, path, message)
+    return True
+
+
+def _write_index(day, section):
+    """索引里只有 Genesis 居民产出一节归我们管，前面的专题文章部分原样保留"""
+    digest = _hash(section)
+    filepath = os.path.join(OUTPUT_REPO, INDEX_FILE)
+    if _store.get("outputs").get(INDEX_FILE) == digest and os.path.exists(filepath):
+        return
     existing = ""
     if os.path.exists(filepath):
         with open(filepath, "r", encoding="utf-8") as f:
             existing = f.read()
 
-    # 找到或追加 Genesis 居民产出 section
-    genesis_section = "\n## Genesis 居民产出\n\n"
-    if daily_files:
-        genesis_section += "### 每日情报\n\n"
-        for f in daily_files[:10]:
-            name = f.replace(".md", "")
-            genesis_section += f"- [{name}](./daily/{f})\n"
-    if research_files:
-        genesis_section += "\n### 自由研究\n\n"
-        for f in research_files[:10]:
-            name = f.replace(".md", "")
-            genesis_section += f"- [{name}](./research/{f})\n"
-    genesis_section += f"\n*最后更新: D{day:03d}*\n"
-
     marker = "## Genesis 居民产出"
     if marker in existing:
-        new_content = existing[:existing.index(marker)] + genesis_section.lstrip()
+        new_content = existing[:existing.index(marker)] + section.lstrip()
     else:
-        new_content = existing.rstrip() + "\n" + genesis_section
+        new_content = existing.rstrip() + "\n" + section
 
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
     with open(filepath, "w", encoding="utf-8") as f:
         f.write(new_content)
+    _store.apply(["set", ["outputs", INDEX_FILE], digest])
+    publish_queue.enqueue(day, OUTPUT_REPO, INDEX_FILE, f"更新居民产出索引 D{day:03d}")
 
-    _git_push("blog/index.md", f"更新居民产出索引 D{day:03d}")
-
-
-def _git_push(filename, message):
-    """提交并推送到GitHub"""
-    try:
-        subprocess.run(
-            ["git", "add", filename],
-            cwd=OUTPUT_REPO, capture_output=True, timeout=10
-        )
-        subprocess.run(
-            ["git", "commit", "-m", message],
-            cwd=OUTPUT_REPO, capture_output=True, timeout=10
-        )
-        result = subprocess.run(
-            ["git", "push"],
-            cwd=OUTPUT_REPO, capture_output=True, text=True, timeout=30
-        )
-        return result.returncode == 0
-    except Exception as e:
-        print(f"[发布] 推送失败: {e}")
-        return False
+
+def _stem(path):
+    return os.path.basename(path)[:-len(".md")]
+
+
+def _render_index(posts):
+    section = "\n## Genesis 居民产出\n\n"
+    daily = [p for p in posts if p["kind"] == "daily"][:INDEX_LIMIT]
+    research = [p for p in posts if p["kind"] == "research"][:INDEX_LIMIT]
+    if daily:
+        section += "### 每日情报\n\n"
+        for p in daily:
+            section += f"- [{_stem(p['path'])}](./daily/{os.path.basename(p['path'])})\n"
+    if research:
+        section += "\n### 自由研究\n\n"
+        for p in research:
+            section += f"- [{_stem(p['path'])}](./research/{os.path.basename(p['path'])})\n"
+    counts = {}
+    for p in posts:
+        counts[p["citizen_id"]] = counts.get(p["citizen_id"], 0) + 1
+    if counts:
+        section += "\n### 作者\n\n"
+        for cid in sorted(counts):
+            section += f"- [{cid}](./authors/{cid}.md)（{counts[cid]} 篇）\n"
+        section += "\n订阅：[Atom](./feed.xml)\n"
+    # 最后更新取最近一次发布的天，没有新发布时索引一字不变
+    latest = max((p["day"] for p in posts), default=0)
+    section += f"\n*最后更新: D{latest:03d}*\n"
+    return section
+
+
+def _render_author(cid, posts):
+    lines = [f"# {cid} 的发布\n\n", f"共 {len(posts)} 篇 | OpenClaw Genesis\n\n"]
+    for p in sorted(posts, key=lambda p: (p["day"], p["path"]), reverse=True):
+        lines.append(f"- D{p['day']:03d} [{p['title']}](../{p['path'][len('blog/'):]})"
+                     f"（{KINDS.get(p['kind'], p['kind'])}）\n")
+    return "".join(lines)
+
+
+def _url(path):
+    """GitHub Pages 把 .md 渲染成同名 .html"""
+    return f"{SITE_URL}/{path[:-len('.md')]}.html"
+
+
+def _render_feed(posts):
+    recent = sorted(posts, key=lambda p: (p["time"], p["path"]), reverse=True)[:FEED_LIMIT]
+    # feed 的 updated 取最新一篇的时间，内容不变时文件也不变
+    updated = recent[0]["time"] if recent else "1970-01-01T00:00:00+00:00"
+    lines = [
+        '<?xml version="1.0" encoding="utf-8"?>\n',
+        '<feed xmlns="http://www.w3.org/2005/Atom">\n',
+        "  <title>OpenClaw Genesis 居民产出</title>\n",
+        f'  <link href="{escape(SITE_URL)}/blog/feed.xml" rel="self"/>\n',
+        f'  <link href="{escape(SITE_URL)}/blog/"/>\n',
+        f"  <id>{escape(SITE_URL)}/blog/feed.xml</id>\n",
+        f"  <updated>{updated}</updated>\n",
+    ]
+    for p in recent:
+        lines += [
+            "  <entry>\n",
+            f"    <title>{escape(p['title'])}</title>\n",
+            f'    <link href="{escape(_url(p["path"]))}"/>\n',
+            f"    <id>{escape(_url(p['path']))}</id>\n",
+            f"    <updated>{p['time']}</updated>\n",
+            f"    <author><name>{escape(p['citizen_id'])}</name></author>\n",
+            f"    <category term=\"{KINDS.get(p['kind'], p['kind'])}\"/>\n",
+            "  </entry>\n",
+        ]
+    lines.append("</feed>\n")
+    return "".join(lines)
+
+
+# ============================================================
+# 清单初始化
+# ============================================================
+
+def _ensure_manifest():
+    """第一次运行时从已有的文章文件建清单（只扫一次目录）"""
+    if _store.exists():
+        return
+    posts = {}
+    for kind in KINDS:
+        directory = os.path.join(OUTPUT_REPO, "blog", kind)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".md"):
+                post = _read_post(kind, f"blog/{kind}/{name}")
+                posts[post["path"]] = post
+    _store.apply(["set", ["posts"], posts], ["set", ["dirty"], sorted({p["citizen_id"] for p in posts.values()})])
+
+
+def _read_post(kind, path):
+    """从文章文件头解析标题、作者、天（格式见 publish_daily_intel / publish_research）"""
+    filepath = os.path.join(OUTPUT_REPO, path)
+    with open(filepath, "r", encoding="utf-8") as f:
+        text = f.read()
+    lines = text.splitlines()
+    title = lines[0].lstrip("# ").strip() if lines else _stem(path)
+    meta = [part.strip() for part in (lines[2] if len(lines) > 2 else "").split("|")]
+    author = next((m.split(":", 1)[1].strip() for m in meta if m.startswith("作者")), "")
+    day = 0
+    for token in meta + [_stem(path)]:
+        tail = token.rsplit("-", 1)[-1]
+        if tail.startswith("D") and tail[1:].isdigit():
+            day = int(tail[1:])
+            break
+    mtime = datetime.fromtimestamp(os.path.getmtime(filepath)).astimezone()
+    return {"path": path, "kind": kind, "day": day, "citizen_id": author, "title": title,
+            "hash": _hash(text), "time": mtime.isoformat(timespec="seconds")}
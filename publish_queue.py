@@ -0,0 +1,302 @@
+"""
+发布队列 - 把 git 提交和推送移出 run_day
+publish 写好文件后只把任务放进磁盘上的队列（data/publish_queue.json）就返回；
+日终 flush(day) 唤醒后台线程，把队列里所有待推送的文件（当天的文章和索引）
+合成一次 commit、一次 push，push 失败退避重试。
+推送确认后任务标记为 pushed，主线程用 confirmed() 读出来记外部收入，收入提交后再 ack() 删掉：
+没推上去的发布不给钱；记完收入、ack 之前退出的，下次还会读到，由调用方按 job_key 去重。
+失败的任务留 FAILED_KEEP 个供查看，更早的删掉。
+
+队列跨进程保存：推送前进程退出了，下次 flush 接着推（已提交没推送的也会推上去）。
+后台线程不碰 storage（工作单元不是线程安全的），只读写队列文件和跑 git。
+
+GENESIS_PUBLISH_RETRIES  push 的重试次数，默认 3
+GENESIS_PUBLISH_WAIT     进程退出前最多等后台推送多少秒，默认 60
+
+查看队列：python publish_queue.py status
+自检（本地裸仓库，不碰 GitHub）：python publish_queue.py selftest
+"""
+import atexit
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import storage
+
+QUEUE_FILE = "publish_queue.json"
+RETRIES = int(os.environ.get("GENESIS_PUBLISH_RETRIES", "3"))
+WAIT = float(os.environ.get("GENESIS_PUBLISH_WAIT", "60"))
+# 第 n 次重试前等 BACKOFF_BASE * 2^(n-1) 秒
+BACKOFF_BASE = 2.0
+GIT_TIMEOUT = 10
+PUSH_TIMEOUT = 30
+FAILED_KEEP = 50   # 队列里最多留多少个失败任务
+
+_lock = threading.Lock()   # 保护队列文件和下面的状态
+_wake = threading.Condition(_lock)
+_requests = []             # 待处理的 flush（day）
+_busy = 0                  # 已请求、还没处理完的 flush 数
+_idle = threading.Event()
+_idle.set()
+_thread = None
+_exit_hooked = False
+
+
+class PublishError(Exception):
+    """git 操作失败。transient 的（push 超时、网络）下次 flush 再试，其余任务记为失败。"""
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+# ============================================================
+# 队列文件
+# ============================================================
+
+def _path():
+    return os.path.join(storage.DATA_DIR, QUEUE_FILE)
+
+
+def _load():
+    try:
+        with open(_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"next_id": 1, "jobs": []}
+
+
+def _save(doc):
+    path = _path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        # 每次入队、更新都整个重写，紧凑格式
+        json.dump(doc, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def enqueue(day, repo, path, message, author=None, source=None):
+    """登记一个待推送的文件（repo 里的相对路径），返回任务 id。
+    source 不为空的任务推送确认后记一笔外部收入给 author。"""
+    with _lock:
+        doc = _load()
+        job_id = doc["next_id"]
+        doc["next_id"] += 1
+        doc["jobs"].append({
+            "id": job_id, "day": day, "repo": repo, "path": path, "message": message,
+            "author": author, "source": source, "state": "pending", "attempts": 0,
+            "time": datetime.now().isoformat(),
+        })
+        _save(doc)
+    return job_id
+
+
+def _update(ids, **fields):
+    with _lock:
+        doc = _load()
+        for job in doc["jobs"]:
+            if job["id"] in ids:
+                job.update(fields)
+                job["attempts"] += 1
+        failed = [j["id"] for j in doc["jobs"] if j["state"] == "failed"]
+        if len(failed) > FAILED_KEEP:
+            drop = set(failed[:-FAILED_KEEP])  # 按 id 即入队顺序，删最早的
+            doc["jobs"] = [j for j in doc["jobs"] if j["id"] not in drop]
+        _save(doc)
+
+
+def confirmed():
+    """已推送确认、还没 ack 的任务，调用方据此记外部收入"""
+    with _lock:
+        return [j for j in _load()["jobs"] if j["state"] == "pushed"]
+
+
+def ack(ids):
+    """收入已经提交，把这些任务从队列里删掉"""
+    ids = set(ids)
+    if not ids:
+        return
+    with _lock:
+        doc = _load()
+        doc["jobs"] = [j for j in doc["jobs"] if j["id"] not in ids]
+        _save(doc)
+
+
+def job_key(job):
+    """任务的唯一标识（id 加入队时间，队列文件重建后 id 重新从 1 开始也不会撞）"""
+    return f"{job['id']}@{job['time']}"
+
+
+def status():
+    """各状态的任务数和失败任务"""
+    with _lock:
+        jobs = _load()["jobs"]
+    counts = {}
+    for job in jobs:
+        counts[job["state"]] = counts.get(job["state"], 0) + 1
+    return {"counts": counts, "failed": [j for j in jobs if j["state"] == "failed"]}
+
+
+# ============================================================
+# 后台推送
+# ============================================================
+
+def flush(day=None):
+    """请后台线程把待推送的任务合成一次提交、一次推送，立即返回"""
+    global _thread, _busy, _exit_hooked
+    with _lock:
+        _busy += 1
+        _idle.clear()
+        _requests.append(day)
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_worker, name="publish", daemon=True)
+            _thread.start()
+        if not _exit_hooked:
+            atexit.register(_at_exit)
+            _exit_hooked = True
+        _wake.notify()
+
+
+def wait(timeout=None):
+    """等后台处理完所有已请求的 flush，超时返回 False"""
+    return _idle.wait(timeout)
+
+
+def _at_exit():
+    if not wait(WAIT):
+        print(f"[发布] 后台推送 {WAIT:.0f} 秒内没有完成，剩下的下次再推")
+
+
+def _worker():
+    global _busy
+    while True:
+        with _lock:
+            while not _requests:
+                _wake.wait()
+            day = _requests.pop(0)
+        try:
+            _drain(day)
+        except Exception as e:
+            print(f"[发布] 后台推送异常: {e}")
+        finally:
+            with _lock:
+                _busy -= 1
+                if not _busy:
+                    _idle.set()
+
+
+def _drain(day):
+    with _lock:
+        batch = [j for j in _load()["jobs"] if j["state"] == "pending"]
+    by_repo = {}
+    for job in batch:
+        by_repo.setdefault(job["repo"], []).append(job)
+    for repo, jobs in by_repo.items():
+        ids = {j["id"] for j in jobs}
+        try:
+            _commit_and_push(repo, jobs, day)
+        except PublishError as e:
+            print(f"[发布] 推送失败（{len(jobs)} 个文件）: {e}")
+            _update(ids, state="pending" if e.transient else "failed", error=str(e))
+        else:
+            _update(ids, state="pushed", pushed_at=datetime.now().isoformat())
+
+
+def _git(repo, *args, timeout=GIT_TIMEOUT):
+    try:
+        return subprocess.run(["git", *args], cwd=repo, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise PublishError(f"git {args[0]} 超时", transient=True)
+    except OSError as e:
+        raise PublishError(f"git {args[0]}: {e}")
+
+
+def _first_line(text):
+    lines = text.strip().splitlines()
+    return lines[0] if lines else ""
+
+
+def _commit_and_push(repo, jobs, day):
+    paths = list(dict.fromkeys(j["path"] for j in jobs))
+    result = _git(repo, "add", "--", *paths)
+    if result.returncode:
+        raise PublishError(f"git add: {_first_line(result.stderr)}")
+    # 上次提交了但没推上去时这里没有新改动，直接推
+    staged = _git(repo, "diff", "--cached", "--name-only").stdout.splitlines()
+    if staged:
+        messages = list(dict.fromkeys(j["message"] for j in jobs))
+        if len(messages) == 1:
+            args = ["-m", messages[0]]
+        else:
+            day = day if day is not None else max(j["day"] for j in jobs)
+            args = ["-m", f"D{day:03d} 发布 {len(staged)} 个文件", "-m", "\n".join(messages)]
+        result = _git(repo, "commit", *args)
+        if result.returncode:
+            raise PublishError(f"git commit: {_first_line(result.stderr or result.stdout)}")
+
+    error = None
+    for attempt in range(RETRIES + 1):
+        if attempt:
+            time.sleep(BACKOFF_BASE * 2 ** (attempt - 1))
+        try:
+            result = _git(repo, "push", timeout=PUSH_TIMEOUT)
+        except PublishError as e:
+            error = e
+            continue
+        if result.returncode == 0:
+            return
+        error = PublishError(f"git push: {_first_line(result.stderr)}", transient=True)
+    raise error
+
+
+# ============================================================
+# 命令行
+# ============================================================
+
+def _selftest():
+    """在临时目录里建一个裸仓库当远端，走一遍发布 → flush → 确认"""
+    import tempfile
+    import publish
+
+    root = tempfile.mkdtemp(prefix="genesis-publish-")
+    remote = os.path.join(root, "remote.git")
+    site = os.path.join(root, "site")
+    subprocess.run(["git", "init", "-q", "--bare", remote], check=True)
+    subprocess.run(["git", "clone", "-q", remote, site], check=True, capture_output=True)
+    for key, value in (("user.name", "genesis"), ("user.email", "genesis@localhost"),
+                       ("push.default", "current")):
+        subprocess.run(["git", "config", key, value], cwd=site, check=True)
+    os.chdir(root)
+    publish.OUTPUT_REPO = site
+
+    publish.publish_daily_intel(1, "今日情报", "C1", source="publish:daily_intel")
+    publish.publish_research(1, "一个研究", "研究内容", "C2", source="publish:open_research")
+    publish.update_index(1)
+    started = time.perf_counter()
+    flush(1)
+    if not wait(WAIT):
+        raise SystemExit("[自检] 后台推送超时")
+    done = confirmed()
+    ack(j["id"] for j in done)
+    commits = subprocess.run(["git", "--git-dir", remote, "log", "--all", "--format=%s"],
+                             capture_output=True, text=True).stdout.splitlines()
+    print(f"[自检] 推送耗时 {time.perf_counter() - started:.2f}s，远端提交 {commits}")
+    print(f"[自检] 确认 {len(done)} 个任务，其中记收入 {sum(1 for j in done if j['source'])} 个")
+    assert len(commits) == 1 and sum(1 for j in done if j["source"]) == 2, "自检失败"
+    assert not confirmed(), "ack 过的任务还在队列里"
+    print(f"[自检] 通过（{root}）")
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "selftest":
+        _selftest()
+    else:
+        s = status()
+        print(f"[发布队列] {s['counts'] or '空'}")
+        for job in s["failed"]:
+            print(f"  失败 #{job['id']} D{job['day']:03d} {job['path']}: {job.get('error', '')}")
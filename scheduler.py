@@ -0,0 +1,136 @@
+"""
+agent 调度器 - 在内存预算内并发运行 openclaw agent 子进程
+每个 agent 是一个 Node 进程（堆上限由 NODE_OPTIONS 限制）。
+启动前读 /proc/meminfo 的 MemAvailable，放得下才放行；放不下就排队，
+等前面的进程结束或主机内存回落再启动。小 VPS 也能安全地同时跑几个居民。
+刚放行的进程还没来得及分配内存，MemAvailable 里看不出来：启动后 WARMUP 秒内
+仍按估算占着一份预留，一波请求不会凭同一个过时的读数全部放行。
+"""
+import asyncio
+import os
+import time
+
+# 同时运行的 agent 进程上限
+MAX_CONCURRENT = int(os.environ.get("GENESIS_MAX_AGENTS", "3"))
+# 所有 agent 进程合计可用的内存预算（MB），0 表示只看主机剩余内存
+MEMORY_BUDGET_MB = int(os.environ.get("GENESIS_AGENT_MEMORY_MB", "0"))
+# 单个 agent 进程的内存估算：256MB 堆 + Node 自身开销
+AGENT_MEMORY_MB = int(os.environ.get("GENESIS_AGENT_RSS_MB", "384"))
+# 启动新进程后主机至少还要剩这么多内存
+HOST_RESERVE_MB = int(os.environ.get("GENESIS_HOST_RESERVE_MB", "256"))
+# 新进程启动后多少秒内还按 AGENT_MEMORY_MB 预留（之后它的内存已反映在 MemAvailable 里）
+WARMUP = float(os.environ.get("GENESIS_AGENT_WARMUP", "30"))
+# 内存不够时多久重新检查一次（秒）
+RECHECK_INTERVAL = 2
+
+
+def mem_available_mb():
+    """主机当前可用内存（MB）。读不到 /proc/meminfo（非 Linux）时返回 None。"""
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+class AgentTimeout(asyncio.TimeoutError):
+    """子进程到截止时间被取消。partial 是取消前已经读到的 stdout。"""
+
+    def __init__(self, partial=""):
+        super().__init__()
+        self.partial = partial
+
+
+async def _pump(stream, chunks):
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return
+        chunks.append(chunk)
+
+
+class AgentScheduler:
+    """并发上限 + 内存准入。一个调度器管一批（通常是一轮）agent 调用。"""
+
+    def __init__(self, max_concurrent=None, budget_mb=None, per_agent_mb=None):
+        self.max_concurrent = max_concurrent or MAX_CONCURRENT
+        self.budget_mb = MEMORY_BUDGET_MB if budget_mb is None else budget_mb
+        self.per_agent_mb = per_agent_mb or AGENT_MEMORY_MB
+        self.running = 0
+        self._started = {}   # 放行序号 → 放行时间（monotonic），退出时删除
+        self._seq = 0
+        self._changed = asyncio.Condition()
+
+    def _warming(self):
+        """放行不到 WARMUP 秒、还在跑的进程数：它们的内存还没计入 MemAvailable"""
+        now = time.monotonic()
+        return sum(1 for t in self._started.values() if now - t < WARMUP)
+
+    def _fits(self):
+        if self.running == 0:
+            return True  # 一个都没在跑时总要放行，保证前进（等同于原来的串行）
+        if self.running >= self.max_concurrent:
+            return False
+        if self.budget_mb and (self.running + 1) * self.per_agent_mb > self.budget_mb:
+            return False
+        available = mem_available_mb()
+        if available is not None and available - (self._warming() + 1) * self.per_agent_mb < HOST_RESERVE_MB:
+            return False
+        return True
+
+    async def _admit(self, label):
+        async with self._changed:
+            waited = False
+            while not self._fits():
+                if not waited:
+                    print(f"  [{label}] 内存/并发已满，排队等待...")
+                    waited = True
+                try:
+                    # 主机内存可能被别的进程释放，定期重查而不是只等通知
+                    await asyncio.wait_for(self._changed.wait(), RECHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.running += 1
+            self._seq += 1
+            self._started[self._seq] = time.monotonic()
+            return self._seq
+
+    async def _release(self, ticket):
+        async with self._changed:
+            self.running -= 1
+            self._started.pop(ticket, None)
+            self._changed.notify_all()
+
+    async def run(self, label, cmd, env=None, timeout=None):
+        """在准入后运行子进程，返回 (returncode, stdout, stderr, 耗时秒数)。
+        耗时从进程启动算起，不含排队。
+        超时杀掉进程并抛 AgentTimeout，带上已经输出的部分 stdout。"""
+        ticket = await self._admit(label)
+        try:
+            started = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, env=env,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+            # 边跑边收输出，超时取消时手里还有已经读到的部分
+            out, err = [], []
+
+            async def drain():
+                await asyncio.gather(_pump(proc.stdout, out), _pump(proc.stderr, err))
+                await proc.wait()
+
+            try:
+                await asyncio.wait_for(drain(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise AgentTimeout(b"".join(out).decode("utf-8", errors="replace"))
+            return (proc.returncode,
+                    b"".join(out).decode("utf-8", errors="replace"),
+                    b"".join(err).decode("utf-8", errors="replace"),
+                    time.monotonic() - started)
+        finally:
+            await self._release(ticket)
@@ -0,0 +1,64 @@
+"""
+日终结算 - 一遍算完需求奖励、生存成本、休眠和需求归档
+整个结算是一个工作单元：needs / economy / treasury 各只读一次，
+全部变更（含编年史事件）在最后一起提交。返回结构化的结算报告，
+run_day 打印和写编年史都直接用它，不再回头重读状态文件。
+"""
+import chronicle
+import dedup
+import economy
+import needs
+import storage
+import treasury
+
+
+def settle(day, verdicts=None, on_award=None):
+    """结算第 day 天。
+    verdicts：needs.judge_open_needs() 的结果 {need_id: winner_id}（有投票的需求仍按投票）。
+    on_award(award, need)：每个发出奖励的需求结算后立即回调（发布、外部收入等），
+    它的写入也在本工作单元里，且先于生存成本扣除，和原来的顺序一致。
+
+    返回报告：
+      awards    [{"need_id", "title", "winner", "reward", "status"}]  按需求顺序，含未拨款的
+      survival  {citizen_id: 状态}  deduct_survival_cost 的结果
+      hibernated [citizen_id]  今天新休眠的
+      archived  归档的需求数
+      treasury  结算后的 treasury.get_status()
+    """
+    verdicts = verdicts or {}
+    events = []
+    report = {"awards": [], "survival": {}, "hibernated": [], "archived": 0, "treasury": None}
+
+    with storage.unit_of_work():
+        for need in needs.get_open_needs():
+            if not need.get("submissions"):
+                continue
+            award = needs.settle_need(need["id"], verdicts.get(need["id"]))
+            if award is None:
+                continue
+            report["awards"].append(award)
+            if award["reward"] <= 0:
+                continue
+            # 只有真付了钱的获胜提交才进查重索引
+            content = next((s["content"] for s in need["submissions"]
+                            if s["citizen_id"] == award["winner"]), None)
+            if content is not None:
+                dedup.remember_winner(day, need["id"], award["winner"], content)
+            winner = award["winner"]
+            events.append(chronicle.make_event(
+                day, "need_completed",
+                f"{winner} 完成了 '{award['title']}'，获得 {award['reward']} token", winner))
+            if on_award is not None:
+                on_award(award, need)
+
+        report["survival"] = economy.deduct_survival_cost()
+        for cid, status in report["survival"].items():
+            if status == "hibernated":
+                report["hibernated"].append(cid)
+                events.append(chronicle.make_event(day, "hibernation", f"{cid} 休眠", cid))
+
+        report["archived"] = needs.close_day()
+        report["treasury"] = treasury.get_status()
+        chronicle.record_events(events)
+
+    return report
@@ -0,0 +1,974 @@
+"""
+存储层 - data/ 下所有状态的统一读写
+
+两种后端（环境变量 GENESIS_STORAGE 选择）：
+  json   → 默认。每次变更追加一行日志（data/<name>.log），日终压缩成快照（data/<name>.json）。
+           写一笔交易的成本只和这笔交易本身有关，不随世界历史增长。
+           快照格式和旧版 json 文件完全一致，旧数据直接可用。
+  sqlite → data/world.db（WAL 模式）。记录型列表按 day / citizen_id / type 建索引，
+           按天、按居民查询走索引而不是全量扫描。
+           旧 json 数据一次性迁移：python storage.py migrate
+
+变更格式：[kind, path, value]
+  ["set", ["citizens", "C1"], {...}]     → doc["citizens"]["C1"] = {...}
+  ["append", ["entries"], {...}]         → doc["entries"].append({...})
+  ["extend", ["history"], [...]]         → doc["history"].extend([...])
+"""
+import copy
+import json
+import os
+import sqlite3
+import struct
+import sys
+from contextlib import contextmanager
+
+DATA_DIR = "data"
+BACKEND = os.environ.get("GENESIS_STORAGE", "json")
+DB_FILE = "world.db"
+
+# 记录型列表上可按索引查询的字段
+INDEX_FIELDS = ("day", "citizen_id", "peer", "type")
+# json 快照里记录日志代数的键（读快照时取出，不进文档）
+GEN_KEY = "__log_gen__"
+
+_stores = {}
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _apply(doc, op):
+    """把一条变更作用到内存文档上"""
+    kind, path, value = op
+    target = doc
+    for key in path[:-1]:
+        target = target[key]
+    last = path[-1]
+    if kind == "set":
+        target[last] = value
+    elif kind == "append":
+        target[last].append(value)
+    elif kind == "extend":
+        target[last].extend(value)
+    else:
+        raise ValueError(f"未知变更类型: {kind}")
+
+
+def _columns(rec):
+    """记录的索引字段。交易记录没有 citizen_id，用 from/to 代替。"""
+    return {
+        "day": rec.get("day"),
+        "citizen_id": rec.get("citizen_id", rec.get("from")),
+        "peer": rec.get("to"),
+        "type": rec.get("type"),
+    }
+
+
+def _match(rec, where):
+    cols = _columns(rec)
+    return all((cols[f] if f in INDEX_FIELDS else rec.get(f)) == v
+               for f, v in where.items())
+
+
+# ============================================================
+# json 后端：快照 + 追加日志
+# ============================================================
+
+class DayPartition:
+    """按天分段的记录列表：<dir>/D001.jsonl … + manifest.json
+    manifest 记录最新一天、每天的条数和段尾偏移，查最新一天/某一天不用碰其他天的数据。
+    每个段旁边有一个 .idx 文件（每条记录起始偏移，8 字节小端），
+    按条取一段范围时只读返回的那部分字节。
+
+    追加时先写段和索引、最后换 manifest，manifest 是唯一的提交点：
+    读取只读到 manifest 记的段尾为止，下次追加前把段和索引截回 manifest 记的长度，
+    中途崩溃多写的半截不会被读到，也不会错开后面记录的偏移。"""
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._manifest = None
+        self._manifest_sig = None
+        self._segments = {}  # path -> (已读偏移, 记录)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def manifest(self):
+        sig = _stat(self.manifest_path)
+        if self._manifest is None or sig != self._manifest_sig:
+            if sig:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {"latest_day": None, "days": {}}
+            self._manifest_sig = sig
+        return self._manifest
+
+    def latest_day(self):
+        return self.manifest()["latest_day"]
+
+    def days(self):
+        return sorted(self.manifest()["days"], key=_day_order)
+
+    def count(self, day):
+        return self.manifest()["days"].get(str(day), {}).get("count", 0)
+
+    def committed_bytes(self, day):
+        return self.manifest()["days"].get(str(day), {}).get("bytes", 0)
+
+    def read_day(self, day):
+        path = self._segment_path(day)
+        size = min((_stat(path) or (0, 0))[1], self.committed_bytes(day))
+        pos, records = self._segments.get(path, (0, []))
+        if size < pos:
+            pos, records = 0, []
+        if size > pos:
+            with open(path, "rb") as f:
+                f.seek(pos)
+                chunk = f.read(size - pos)
+            end = chunk.rfind(b"\n") + 1
+            records = records + _parse_lines(chunk[:end])
+            pos += end
+        self._segments[path] = (pos, records)
+        return records
+
+    def read_all(self):
+        records = []
+        for day in self.days():
+            records.extend(self.read_day(_parse_day(day)))
+        return records
+
+    def read_range(self, day, start, stop):
+        """某天第 start 到 stop 条（不含 stop）"""
+        count = self.count(day)
+        start, stop = max(start, 0), min(stop, count)
+        if start >= stop:
+            return []
+        path = self._segment_path(day)
+        begin = self._offset(day, start)
+        end = self._offset(day, stop) if stop < count else self.manifest()["days"][str(day)]["bytes"]
+        with open(path, "rb") as f:
+            f.seek(begin)
+            return _parse_lines(f.read(end - begin))
+
+    def tail(self, limit):
+        records = []
+        for key in reversed(self.days()):
+            day = _parse_day(key)
+            count = self.count(day)
+            need = limit - len(records)
+            if self._segment_path(day) in self._segments:
+                # 这一段已在内存里（长驻进程），增量读尾部即可
+                records = self.read_day(day)[max(count - need, 0):count] + records
+            else:
+                records = self.read_range(day, count - need, count) + records
+            if len(records) >= limit:
+                break
+        return records
+
+    def end_cursor(self):
+        latest = self.latest_day()
+        return None if latest is None else [latest, self.count(latest)]
+
+    def since(self, cursor):
+        """游标 [day, 当天已读条数] 之后的全部记录和新游标"""
+        start_day, skip = cursor if cursor else (None, 0)
+        records = []
+        for key in self.days():
+            day = _parse_day(key)
+            if day is None or (start_day is not None and day < start_day):
+                continue
+            count = self.count(day)
+            # 追读的调用方（轮次里每个居民各自的游标）会反复读同一天，走 read_day 的增量缓存
+            records.extend(self.read_day(day)[skip if day == start_day else 0:count])
+            cursor = [day, count]
+        return records, cursor
+
+    def append(self, records):
+        manifest = self.manifest()
+        by_day = {}
+        for rec in records:
+            by_day.setdefault(rec.get("day"), []).append(rec)
+        os.makedirs(self.dir, exist_ok=True)
+        for day, recs in by_day.items():
+            self._truncate(day)
+            self._ensure_index(day)
+            offsets = []
+            with open(self._segment_path(day), "ab") as f:
+                for rec in recs:
+                    offsets.append(f.tell())
+                    f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+                size = f.tell()
+            with open(self._index_path(day), "ab") as f:
+                f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+            info = manifest["days"].setdefault(str(day), {"count": 0, "bytes": 0})
+            info["count"] += len(recs)
+            info["bytes"] = size
+            if isinstance(day, int) and (manifest["latest_day"] is None or day > manifest["latest_day"]):
+                manifest["latest_day"] = day
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+        self._manifest_sig = _stat(self.manifest_path)
+
+    def _offset(self, day, n):
+        self._ensure_index(day)
+        with open(self._index_path(day), "rb") as f:
+            f.seek(n * 8)
+            return struct.unpack("<Q", f.read(8))[0]
+
+    def _truncate(self, day):
+        """上次追加写了段、没来得及换 manifest 就崩溃了：截掉没提交的部分"""
+        path = self._segment_path(day)
+        committed = self.committed_bytes(day)
+        if (_stat(path) or (0, 0))[1] > committed:
+            with open(path, "r+b") as f:
+                f.truncate(committed)
+
+    def _ensure_index(self, day):
+        """没有索引（或索引条数和 manifest 不符）的段，扫描已提交的部分重建"""
+        count = self.count(day)
+        index_path = self._index_path(day)
+        if (_stat(index_path) or (0, 0))[1] == count * 8:
+            return
+        offsets, pos = [], 0
+        committed = self.committed_bytes(day)
+        if os.path.exists(self._segment_path(day)):
+            with open(self._segment_path(day), "rb") as f:
+                for line in f:
+                    if pos + len(line) > committed:
+                        break
+                    if line.endswith(b"\n"):
+                        offsets.append(pos)
+                    pos += len(line)
+        with open(index_path, "wb") as f:
+            f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+
+    def _segment_path(self, day):
+        return os.path.join(self.dir, f"{_segment_name(day)}.jsonl")
+
+    def _index_path(self, day):
+        return os.path.join(self.dir, f"{_segment_name(day)}.idx")
+
+
+def _segment_name(day):
+    return f"D{day:03d}" if isinstance(day, int) else f"D_{day}"
+
+
+def _parse_lines(chunk):
+    return [json.loads(line.decode("utf-8")) for line in chunk.splitlines() if line.strip()]
+
+
+def _since(records, cursor):
+    """在内存列表上实现和 DayPartition.since 相同的游标语义"""
+    start_day, skip = cursor if cursor else (None, 0)
+    by_day = {}
+    for r in records:
+        if isinstance(r.get("day"), int) and (start_day is None or r["day"] >= start_day):
+            by_day.setdefault(r["day"], []).append(r)
+    result = []
+    for day in sorted(by_day):
+        result.extend(by_day[day][skip if day == start_day else 0:])
+        cursor = [day, len(by_day[day])]
+    return result, cursor
+
+
+def _parse_day(key):
+    try:
+        return int(key)
+    except ValueError:
+        return None
+
+
+def _day_order(key):
+    day = _parse_day(key)
+    return (0, 0) if day is None else (1, day)
+
+
+class JsonBackend:
+    """一个状态文件 = 快照 + 追加日志。读取时在内存里缓存，只增量读日志尾部。
+    partitioned 列表不进快照，按天分段存在 data/<name>/<key>/ 下。
+
+    快照和日志各带一个代数：日志第一行是 {"gen": n}，快照里记着下一份日志该有的代数。
+    压缩时先换快照（代数 +1）再删日志，中间崩溃留下的旧代日志读取时跳过并删掉，
+    不会在已经包含它的快照上再回放一遍。"""
+
+    def __init__(self, store):
+        self.store = store
+        self.snapshot_path = os.path.join(DATA_DIR, f"{store.name}.json")
+        self.log_path = os.path.join(DATA_DIR, f"{store.name}.log")
+        self.parts = {key: DayPartition(os.path.join(DATA_DIR, store.name, key))
+                      for key in store.partitioned}
+        self._doc = None
+        self._snapshot_sig = None
+        self._log_pos = 0
+        self._gen = None        # 快照的代数，读快照时设置
+        self._log_live = True   # 当前日志是否属于快照这一代
+
+    def exists(self):
+        return (os.path.exists(self.snapshot_path) or os.path.exists(self.log_path)
+                or any(p.exists() for p in self.parts.values()))
+
+    def load(self):
+        doc = dict(self._state())
+        for key, part in self.parts.items():
+            doc[key] = part.read_all()
+        return doc
+
+    def get(self, key):
+        if key in self.parts:
+            return self._part(key).read_all()
+        return self._state()[key]
+
+    def query(self, key, **where):
+        if key in self.parts:
+            part = self._part(key)
+            records = part.read_day(where["day"]) if "day" in where else part.read_all()
+        else:
+            records = self._state()[key]
+        return [r for r in records if _match(r, where)]
+
+    def tail(self, key, limit):
+        if key not in self.parts:
+            return self._state()[key][-limit:]
+        return self._part(key).tail(limit)
+
+    def page(self, key, day, start, limit):
+        if key not in self.parts:
+            return [r for r in self._state()[key] if r.get("day") == day][start:start + limit]
+        return self._part(key).read_range(day, start, start + limit)
+
+    def since(self, key, cursor):
+        if key in self.parts:
+            return self._part(key).since(cursor)
+        return _since(self._state()[key], cursor)
+
+    def end_cursor(self, key):
+        if key in self.parts:
+            return self._part(key).end_cursor()
+        return _since(self._state()[key], None)[1]
+
+    def latest_day(self, key):
+        if key in self.parts:
+            return self._part(key).latest_day()
+        days = [r["day"] for r in self._state()[key] if isinstance(r.get("day"), int)]
+        return max(days) if days else None
+
+    def apply(self, ops):
+        if self._gen is None or not os.path.exists(self.log_path):
+            # 本进程第一次写，或要新开日志：先读一遍快照，拿到代数、清掉过期日志、搬完旧版分段数据。
+            # 别的进程（如 human.py）可能刚压缩过，新日志的代数必须是现在快照的，不能用缓存的
+            self._state()
+        logged = []
+        for op in ops:
+            kind, path, value = op
+            if path[0] in self.parts and len(path) == 1:
+                self.parts[path[0]].append([value] if kind == "append" else value)
+            else:
+                logged.append(list(op))
+        if not logged:
+            return
+        line = json.dumps(logged, ensure_ascii=False) + "\n"
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            if not f.tell():
+                line = json.dumps({"gen": self._gen}) + "\n" + line
+            f.write(line)
+
+    def compact(self):
+        """把日志合并进快照，清空日志"""
+        self._state()
+        self._write_snapshot()
+
+    def _part(self, key):
+        self._state()  # 保证旧版数据已经搬进分段
+        return self.parts[key]
+
+    def _state(self):
+        """快照 + 日志回放后的文档（不含 partitioned 列表）"""
+        sig = _stat(self.snapshot_path)
+        log_size = (_stat(self.log_path) or (0, 0))[1]
+        if self._doc is None or sig != self._snapshot_sig or log_size < self._log_pos:
+            self._doc = self._read_snapshot()
+            self._snapshot_sig = sig
+            self._log_pos = 0
+        if log_size > self._log_pos:
+            self._replay()
+        if not self._log_live:
+            # 上次压缩换完快照、没来得及删的日志：内容已在快照里。压缩正常完成时根本没有日志
+            if log_size:
+                os.remove(self.log_path)
+            self._log_pos = 0
+            self._log_live = True
+        self._absorb_legacy()
+        return self._doc
+
+    def _absorb_legacy(self):
+        """旧版快照里整块存着的 partitioned 列表：一次性搬进分段，再重写快照。
+        分段已经存在说明上次搬完、没来得及重写快照就崩溃了，这次只重写快照。"""
+        moved = False
+        for key, part in self.parts.items():
+            records = self._doc.pop(key, None)
+            if records:
+                if not part.exists():
+                    part.append(records)
+                moved = True
+        if moved:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        gen = self._gen + 1
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**self._doc, GEN_KEY: gen}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.snapshot_path)
+        self._gen = gen
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._snapshot_sig = _stat(self.snapshot_path)
+        self._log_pos = 0
+        self._log_live = True
+
+    def _read_snapshot(self):
+        doc = self.store.default()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        self._gen = doc.pop(GEN_KEY, 0)
+        # 没有代数头的日志（旧版）算第 0 代
+        self._log_live = self._gen == 0
+        return doc
+
+    def _replay(self):
+        """从上次读到的位置继续回放日志。写到一半的末行留到下次。"""
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_pos)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            ops = json.loads(line.decode("utf-8"))
+            if isinstance(ops, dict):
+                self._log_live = ops.get("gen", 0) >= self._gen
+                continue
+            if self._log_live:
+                for op in ops:
+                    _apply(self._doc, op)
+        self._log_pos += end
+
+
+# ============================================================
+# sqlite 后端：记录表 + 文档表
+# ============================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    store TEXT NOT NULL,
+    path TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (store, path)
+);
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    store TEXT NOT NULL,
+    key TEXT NOT NULL,
+    day INTEGER,
+    citizen_id TEXT,
+    peer TEXT,
+    type TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_day ON records (store, key, day);
+CREATE INDEX IF NOT EXISTS idx_records_citizen ON records (store, key, citizen_id);
+CREATE INDEX IF NOT EXISTS idx_records_peer ON records (store, key, peer);
+CREATE INDEX IF NOT EXISTS idx_records_type ON records (store, key, type);
+"""
+
+_conn = None
+_conn_path = None
+
+
+def _db():
+    """共享连接（autocommit，写入时显式开事务）"""
+    global _conn, _conn_path
+    path = os.path.join(DATA_DIR, DB_FILE)
+    if _conn is None or _conn_path != path:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        _conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+        _conn_path = path
+    return _conn
+
+
+def _children(key):
+    """映射 key 的子键行的 path 范围 [key/, key0)：走主键索引（LIKE 用不上，key 里的 _ 还会当通配符）"""
+    return f"{key}/", f"{key}0"
+
+
+class SqliteBackend:
+    """记录型列表（lists）每条一行；映射（maps）每个子键一行；其余顶层键整体一行。"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def exists(self):
+        db = _db()
+        return (db.execute("SELECT 1 FROM docs WHERE store = ? LIMIT 1",
+                           (self.store.name,)).fetchone() is not None
+                or db.execute("SELECT 1 FROM records WHERE store = ? LIMIT 1",
+                              (self.store.name,)).fetchone() is not None)
+
+    def load(self):
+        return {key: self.get(key) for key in self.store.default()}
+
+    def get(self, key):
+        if key in self.store.lists:
+            return self._select(key, "", ())
+        db = _db()
+        if key in self.store.maps:
+            # rowid 是子键第一次写入的顺序（_put 原地更新不换 rowid），和 json 的字典顺序一致
+            rows = db.execute("SELECT path, value FROM docs WHERE store = ? AND path >= ? AND path < ?"
+                              " ORDER BY rowid", (self.store.name, *_children(key))).fetchall()
+            return {path[len(key) + 1:]: json.loads(value) for path, value in rows}
+        row = db.execute("SELECT value FROM docs WHERE store = ? AND path = ?",
+                         (self.store.name, key)).fetchone()
+        return json.loads(row[0]) if row else self.store.default()[key]
+
+    def query(self, key, **where):
+        sql_where = {f: v for f, v in where.items() if f in INDEX_FIELDS}
+        rest = {f: v for f, v in where.items() if f not in INDEX_FIELDS}
+        clause = "".join(f" AND {f} = ?" for f in sql_where)
+        rows = self._select(key, clause, tuple(sql_where.values()))
+        return [r for r in rows if _match(r, rest)] if rest else rows
+
+    def tail(self, key, limit):
+        rows = _db().execute(
+            "SELECT body FROM records WHERE store = ? AND key = ? ORDER BY seq DESC LIMIT ?",
+            (self.store.name, key, limit)).fetchall()
+        return [json.loads(r[0]) for r in reversed(rows)]
+
+    def page(self, key, day, start, limit):
+        rows = _db().execute(
+            "SELECT body FROM records WHERE store = ? AND key = ? AND day = ?"
+            " ORDER BY seq LIMIT ? OFFSET ?",
+            (self.store.name, key, day, limit, start)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def since(self, key, cursor):
+        latest = self.latest_day(key)
+        if latest is None or (cursor and latest < cursor[0]):
+            return [], cursor
+        if cursor:
+            day, skip = cursor
+            records = self._select(key, " AND day = ?", (day, skip), limit=" LIMIT -1 OFFSET ?")
+            records += self._select(key, " AND day > ?", (day,), order="day, seq")
+        else:
+            records = self._select(key, " AND day IS NOT NULL", (), order="day, seq")
+        return records, self.end_cursor(key)
+
+    def end_cursor(self, key):
+        latest = self.latest_day(key)
+        if latest is None:
+            return None
+        count = _db().execute(
+            "SELECT COUNT(*) FROM records WHERE store = ? AND key = ? AND day = ?",
+            (self.store.name, key, latest)).fetchone()[0]
+        return [latest, count]
+
+    def latest_day(self, key):
+        row = _db().execute("SELECT MAX(day) FROM records WHERE store = ? AND key = ?",
+                            (self.store.name, key)).fetchone()
+        return row[0]
+
+    def apply(self, ops):
+        db = _db()
+        if db.in_transaction:
+            # 工作单元提交时外层已经开了事务（见 _commit），各 store 的写入一起提交
+            for op in ops:
+                self._apply_op(db, op)
+            return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for op in ops:
+                self._apply_op(db, op)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def compact(self):
+        _db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def import_doc(self, doc):
+        """用完整文档覆盖该 store 的全部数据（迁移用）"""
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("DELETE FROM docs WHERE store = ?", (self.store.name,))
+        db.execute("DELETE FROM records WHERE store = ?", (self.store.name,))
+        for key, value in doc.items():
+            if key in self.store.lists:
+                self._insert(db, key, value)
+            elif key in self.store.maps:
+                for child, v in value.items():
+                    self._put(db, f"{key}/{child}", v)
+            else:
+                self._put(db, key, value)
+        db.execute("COMMIT")
+
+    def _select(self, key, clause, params, order="seq", limit=""):
+        rows = _db().execute(
+            f"SELECT body FROM records WHERE store = ? AND key = ?{clause} ORDER BY {order}{limit}",
+            (self.store.name, key) + params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def _insert(self, db, key, records):
+        rows = []
+        for rec in records:
+            cols = _columns(rec)
+            rows.append((self.store.name, key, cols["day"], cols["citizen_id"],
+                         cols["peer"], cols["type"], json.dumps(rec, ensure_ascii=False)))
+        db.executemany(
+            "INSERT INTO records (store, key, day, citizen_id, peer, type, body)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _put(self, db, path, value):
+        db.execute("INSERT INTO docs (store, path, value) VALUES (?, ?, ?)"
+                   " ON CONFLICT (store, path) DO UPDATE SET value = excluded.value",
+                   (self.store.name, path, json.dumps(value, ensure_ascii=False)))
+
+    def _apply_op(self, db, op):
+        kind, path, value = op
+        key = path[0]
+        if key in self.store.lists:
+            if len(path) != 1 or kind not in ("append", "extend"):
+                raise ValueError(f"记录型列表 {key} 只支持追加")
+            self._insert(db, key, [value] if kind == "append" else value)
+            return
+        if key in self.store.maps:
+            if len(path) == 1:
+                db.execute("DELETE FROM docs WHERE store = ? AND path >= ? AND path < ?",
+                           (self.store.name, *_children(key)))
+                for child, v in _apply_value(self.get(key), kind, [], value).items():
+                    self._put(db, f"{key}/{child}", v)
+                return
+            row_path, rest = f"{key}/{path[1]}", path[2:]
+        else:
+            row_path, rest = key, path[1:]
+        if not rest and kind == "set":
+            self._put(db, row_path, value)
+            return
+        row = db.execute("SELECT value FROM docs WHERE store = ? AND path = ?",
+                         (self.store.name, row_path)).fetchone()
+        current = json.loads(row[0]) if row else self.store.default().get(key)
+        self._put(db, row_path, _apply_value(current, kind, rest, value))
+
+
+def _apply_value(current, kind, rest, value):
+    """对单个值应用子路径上的变更，返回新值"""
+    holder = {"v": current}
+    _apply(holder, [kind, ["v"] + list(rest), value])
+    return holder["v"]
+
+
+# ============================================================
+# 对外接口
+# ============================================================
+
+class Store:
+    """一份世界状态（经济、金库、编年史……）。
+
+    lists: 只追加的记录型列表（交易、事件、发言），sqlite 下每条一行并建索引
+    maps:  按子键存取的字典（如 citizens），sqlite 下每个子键一行
+    partitioned: lists 中按 day 分段存储的列表，json 下每天一个段文件
+
+    在 unit_of_work() 里：每个键只从后端读一次，之后读内存；
+    写入先作用到内存副本并缓冲，退出时一次性提交。读到的值只读，改动一律走 apply。
+    """
+
+    def __init__(self, name, default, lists=(), maps=(), partitioned=()):
+        self.name = name
+        self.default = default  # 返回全新默认文档的函数
+        self.lists = tuple(lists)
+        self.maps = tuple(maps)
+        self.partitioned = tuple(partitioned)
+        self._backends = {}
+        self._reset_uow()
+        _stores[name] = self
+
+    @property
+    def backend(self):
+        if BACKEND not in self._backends:
+            cls = SqliteBackend if BACKEND == "sqlite" else JsonBackend
+            self._backends[BACKEND] = cls(self)
+        return self._backends[BACKEND]
+
+    def exists(self):
+        return bool(self._pending_ops) or self.backend.exists()
+
+    def load(self):
+        """当前完整状态。返回值只读，调用方不要原地修改。"""
+        if not _uow_depth:
+            return self.backend.load()
+        return {key: self.get(key) for key in self.default()}
+
+    def get(self, key):
+        if not _uow_depth:
+            return self.backend.get(key)
+        if key not in self._cache:
+            value = self.backend.get(key)
+            # 记录型列表只追加，缓存引用即可；其余容器只复制外层，子项在第一次
+            # 被深层写入前才复制（见 _own）。几百个居民时不用每个工作单元深拷贝一遍。
+            if key in self.lists or not isinstance(value, (dict, list)):
+                self._cache[key] = value
+            else:
+                self._cache[key] = copy.copy(value)
+        if key in self.lists and self._pending_records.get(key):
+            return self._cache[key] + self._pending_records[key]
+        return self._cache[key]
+
+    def query(self, key, **where):
+        """列表 key 中字段全部相等的记录（day/citizen_id/peer/type 走索引）"""
+        if not _uow_depth:
+            return self.backend.query(key, **where)
+        cache_key = (key, tuple(sorted(where.items())))
+        if cache_key not in self._query_cache:
+            self._query_cache[cache_key] = self.backend.query(key, **where)
+        pending = [r for r in self._pending_records.get(key, []) if _match(r, where)]
+        return self._query_cache[cache_key] + pending
+
+    def tail(self, key, limit):
+        if not _uow_depth:
+            return self.backend.tail(key, limit)
+        if key not in self._tail_cache or len(self._tail_cache[key]) < limit:
+            self._tail_cache[key] = self.backend.tail(key, limit)
+        return (self._tail_cache[key] + self._pending_records.get(key, []))[-limit:]
+
+    def page(self, key, day, start, limit):
+        """某天第 start 条起最多 limit 条（只读已提交的数据）"""
+        return self.backend.page(key, day, start, limit)
+
+    def since(self, key, cursor=None):
+        """游标之后的全部记录，返回 (记录, 新游标)（只读已提交的数据）。
+        游标是 [day, 当天已读条数]，None 表示从头开始。"""
+        return self.backend.since(key, cursor)
+
+    def end_cursor(self, key):
+        """指向当前最后一条记录之后的游标（只读已提交的数据）"""
+        return self.backend.end_cursor(key)
+
+    def latest_day(self, key):
+        """列表 key 中最大的 day，没有记录时为 None"""
+        day = self.backend.latest_day(key)
+        for r in self._pending_records.get(key, []):
+            if isinstance(r.get("day"), int) and (day is None or r["day"] > day):
+                day = r["day"]
+        return day
+
+    def apply(self, *ops):
+        """原子地执行一次变更（可以包含多条 op）"""
+        if not ops:
+            return
+        if not _uow_depth:
+            self.backend.apply(ops)
+            return
+        for op in ops:
+            kind, path, value = op
+            value = copy.deepcopy(value)
+            key = path[0]
+            if key in self.lists and len(path) == 1:
+                records = self._pending_records.setdefault(key, [])
+                records.extend([value] if kind == "append" else value)
+            else:
+                self.get(key)
+                self._own(kind, path)
+                _apply(self._cache, [kind, path, value])
+            self._pending_ops.append([kind, path, value])
+
+    def _own(self, kind, path):
+        """写入前把 path 沿途会被改到的容器浅复制成工作单元自己的（每个只复制一次）。
+        get 时只复制了最外层；set 改的是父容器，append/extend 改的是目标列表本身。"""
+        depth = len(path) - 1 if kind == "set" else len(path)
+        container = self._cache[path[0]]
+        for i in range(1, depth):
+            prefix = tuple(path[:i + 1])
+            child = container[path[i]]
+            if prefix not in self._owned:
+                child = copy.copy(child)
+                container[path[i]] = child
+                self._owned.add(prefix)
+            container = child
+
+    def compact(self):
+        self.backend.compact()
+
+    def _flush(self):
+        ops = self._coalesced()
+        self._reset_uow()
+        if ops:
+            self.backend.apply(ops)
+
+    def _coalesced(self):
+        """同一记录型列表的追加合并成一条 extend（放在它第一次出现的位置）：
+        一个工作单元里的几十条事件/发言，分段文件和清单只写一次，sqlite 只插一批"""
+        ops = []
+        merged = {}
+        for op in self._pending_ops:
+            kind, path, value = op
+            key = path[0]
+            if key in self.lists and len(path) == 1:
+                if key not in merged:
+                    merged[key] = ["extend", [key], []]
+                    ops.append(merged[key])
+                merged[key][2].extend([value] if kind == "append" else value)
+            else:
+                ops.append(op)
+        return ops
+
+    def _reset_uow(self):
+        self._cache = {}
+        self._query_cache = {}
+        self._tail_cache = {}
+        self._pending_records = {}
+        self._pending_ops = []
+        self._owned = set()
+
+
+_uow_depth = 0
+
+
+@contextmanager
+def unit_of_work():
+    """一个工作单元：期间所有读写走内存，退出时每个 store 只提交一次。
+    可以嵌套，最外层退出时提交；中途抛异常则整个工作单元的写入都不提交。"""
+    global _uow_depth
+    _uow_depth += 1
+    try:
+        yield
+    except BaseException:
+        # 出错的工作单元整个作废：缓冲的写入不提交，缓存也不带进下一个工作单元
+        _uow_depth -= 1
+        if not _uow_depth:
+            _discard()
+        raise
+    _uow_depth -= 1
+    if not _uow_depth:
+        _commit()
+
+
+def _commit():
+    stores = list(_stores.values())
+    # sqlite 下整个工作单元一个事务：每个事务都要把改到的表和索引页写进 WAL，
+    # 一回合几个 store 各提交一次，写入量成倍增长
+    db = _db() if BACKEND == "sqlite" and any(s._pending_ops for s in stores) else None
+    try:
+        if db is not None:
+            db.execute("BEGIN IMMEDIATE")
+        for store in stores:
+            store._flush()
+        if db is not None:
+            db.execute("COMMIT")
+    except BaseException:
+        if db is not None and db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+    finally:
+        for store in stores:
+            store._reset_uow()
+
+
+def _discard():
+    for store in _stores.values():
+        store._reset_uow()
+
+
+def exists(name):
+    """某份状态是否已经有数据"""
+    if name in _stores:
+        return _stores[name].exists()
+    return (os.path.exists(os.path.join(DATA_DIR, f"{name}.json"))
+            or os.path.exists(os.path.join(DATA_DIR, f"{name}.log")))
+
+
+def compact_all():
+    """压缩所有已有数据的状态（日终调用）"""
+    for store in _stores.values():
+        if store.exists():
+            store.compact()
+
+
+def migrate():
+    """把 data/*.json（及未压缩的日志）一次性导入 data/world.db"""
+    import economy, treasury, chronicle, plaza, needs, external, agent_bridge, publish  # noqa: F401  注册所有 store
+    for store in _stores.values():
+        source = JsonBackend(store)
+        if not source.exists():
+            continue
+        doc = source.load()
+        SqliteBackend(store).import_doc(doc)
+        counts = {k: len(doc[k]) for k in store.lists if k in doc}
+        print(f"[迁移] {store.name} → {DB_FILE} {counts}")
+
+
+def _selftest():
+    """json 后端：压缩后重启能读回状态；别的进程压缩后本进程新开的日志不丢；
+    分段追加中途崩溃留下的半截不影响读写"""
+    import tempfile
+    global DATA_DIR
+    DATA_DIR = tempfile.mkdtemp(prefix="genesis-storage-")
+    store = Store("selftest", lambda: {"n": 0, "items": []}, lists=("items",))
+
+    def restart():
+        return JsonBackend(store)  # 新实例没有任何缓存，等同于新进程
+
+    first = restart()
+    first.apply([["set", ["n"], 1], ["append", ["items"], {"day": 1}]])
+    first.compact()
+    assert not os.path.exists(first.log_path), "压缩后日志应该删掉"
+    assert restart().load() == {"n": 1, "items": [{"day": 1}]}, "压缩后重启读不回状态"
+
+    second = restart()
+    second.apply([["set", ["n"], 2]])
+    assert restart().get("n") == 2, "压缩后重启写的日志读不回来"
+
+    # 本进程缓存着旧代数时，别的进程压缩了：新日志要用新代数，不能被当成过期日志删掉
+    mine, other = restart(), restart()
+    mine.get("n")
+    other.compact()
+    mine.apply([["set", ["n"], 3]])
+    assert restart().get("n") == 3, "别的进程压缩后写入丢了"
+
+    # 分段追加写完段和索引、换 manifest 之前崩溃：多出的半截既不能读到，也不能错开之后的记录
+    part = DayPartition(os.path.join(DATA_DIR, "selftest-part"))
+    part.append([{"day": 1, "i": 0}, {"day": 1, "i": 1}])
+    with open(part._segment_path(1), "ab") as f:
+        f.write(b'{"day": 1, "i": "orphan"}\n{"day": 1, "i": "half')
+    with open(part._index_path(1), "ab") as f:
+        f.write(struct.pack("<Q", part.committed_bytes(1)))
+    part = DayPartition(part.dir)
+    assert [r["i"] for r in part.read_day(1)] == [0, 1], "读到了没提交的记录"
+    part.append([{"day": 1, "i": 2}])
+    part = DayPartition(part.dir)
+    assert [r["i"] for r in part.tail(2)] == [1, 2], "崩溃后 tail 错位"
+    assert [r["i"] for r in part.since([1, 1])[0]] == [1, 2], "崩溃后 since 错位"
+    print(f"[自检] 通过（{DATA_DIR}）")
+
+
+if __name__ == "__main__":
+    import storage  # 以模块身份导入，和各 store 共用同一份注册表
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        storage.migrate()
+    elif len(sys.argv) > 1 and sys.argv[1] == "selftest":
+        storage._selftest()
+    else:
+        print("用法: python storage.py migrate | selftest")
@@ -3,73 +3,66 @@
 token不是凭空印的，来自外层真实收入。
 种子基金是唯一的"印钱"，之后全靠居民赚回来。
 """
-import json
-import os
 from datetime import datetime
 
-DATA_FILE = "data/treasury.json"
+import storage
 
-def _load():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {
-        "balance": 800,        # 种子基金800 token（800÷55≈14.5天）
-        "seed_fund": 800,      # 初始种子（记录用，不再增加）
-        "external_income": 0,  # 累计外部收入
-        "total_spent": 0,      # 累计支出
-        "log": []
-    }
-
-def _save(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+_store = storage.Store("treasury", lambda: {
+    "balance": 800,        # 种子基金800 token（800÷55≈14.5天）
+    "seed_fund": 800,      # 初始种子（记录用，不再增加）
+    "external_income": 0,  # 累计外部收入
+    "total_spent": 0,      # 累计支出
+    "log": []
+}, lists=("log",))
 
+# 余额和累计值都是单个键，按键读写；log 只追加，读写余额时不碰它
 def get_balance():
     """金库当前余额"""
-    return _load()["balance"]
+    return _store.get("balance")
 
 def deposit(amount, source="external"):
     """外部收入存入金库"""
-    data = _load()
-    data["balance"] = round(data["balance"] + amount, 2)
-    data["external_income"] = round(data["external_income"] + amount, 2)
-    data["log"].append({
-        "type": "deposit",
-        "amount": amount,
-        "source": source,
-        "time": datetime.now().isoformat(),
-        "balance_after": data["balance"]
-    })
-    _save(data)
-    return data["balance"]
+    balance = round(_store.get("balance") + amount, 2)
+    _store.apply(
+        ["set", ["balance"], balance],
+        ["set", ["external_income"], round(_store.get("external_income") + amount, 2)],
+        ["append", ["log"], {
+            "type": "deposit",
+            "amount": amount,
+            "source": source,
+            "time": datetime.now().isoformat(),
+            "balance_after": balance
+        }],
+    )
+    return balance
 
 def withdraw(amount, purpose="needs"):
     """从金库支出（发放基础需求奖励等）"""
-    data = _load()
-    if data["balance"] < amount:
+    current = _store.get("balance")
+    if current < amount:
         return None  # 金库空了，发不出钱
-    data["balance"] = round(data["balance"] - amount, 2)
-    data["total_spent"] = round(data["total_spent"] + amount, 2)
-    data["log"].append({
-        "type": "withdraw",
-        "amount": amount,
-        "purpose": purpose,
-        "time": datetime.now().isoformat(),
-        "balance_after": data["balance"]
-    })
-    _save(data)
-    return data["balance"]
+    balance = round(current - amount, 2)
+    _store.apply(
+        ["set", ["balance"], balance],
+        ["set", ["total_spent"], round(_store.get("total_spent") + amount, 2)],
+        ["append", ["log"], {
+            "type": "withdraw",
+            "amount": amount,
+            "purpose": purpose,
+            "time": datetime.now().isoformat(),
+            "balance_after": balance
+        }],
+    )
+    return balance
 
 def get_status():
     """金库状态概览"""
-    data = _load()
-    days_left = data["balance"] / 55 if data["balance"] > 0 else 0  # 25蒸发+30需求奖励
+    balance = _store.get("balance")
+    days_left = balance / 55 if balance > 0 else 0  # 25蒸发+30需求奖励
     return {
-        "balance": data["balance"],
-        "external_income": data["external_income"],
-        "total_spent": data["total_spent"],
+        "balance": balance,
+        "external_income": _store.get("external_income"),
+        "total_spent": _store.get("total_spent"),
         "days_left": round(days_left, 1),
-        "healthy": data["balance"] > 50
+        "healthy": balance > 50
     }
@@ -0,0 +1,58 @@
+"""
+评判结果缓存 - 同一批提交不再花钱评第二次
+键是 (需求id, 评判模型, 提示词模板, 按顺序的 (居民, 提交内容)) 的哈希：
+崩溃后重跑当天、回放录放带时，提交一字不差，直接用缓存里的获胜者。
+换模型、改提示词、多一个或改一个提交，键都会变。
+
+缓存跨天保存，条目超过 MAX_ENTRIES 时按最近使用淘汰（LRU），一次淘汰到九成。
+只缓存模型真正给出的结果；调用失败回退到第一个提交的，不缓存。
+"""
+import hashlib
+import json
+import os
+
+import storage
+
+MAX_ENTRIES = int(os.environ.get("GENESIS_VERDICT_CACHE_SIZE", "512"))
+
+_store = storage.Store("verdicts", lambda: {"entries": {}, "clock": 0}, maps=("entries",))
+
+
+def key(need_id, model, template, submissions):
+    blob = json.dumps([need_id, model, template,
+                       [[s["citizen_id"], s["content"]] for s in submissions]],
+                      ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _tick():
+    clock = _store.get("clock") + 1
+    _store.apply(["set", ["clock"], clock])
+    return clock
+
+
+def get(verdict_key):
+    """命中返回获胜者并刷新最近使用时间，未命中返回 None"""
+    entry = _store.get("entries").get(verdict_key)
+    if entry is None:
+        return None
+    _store.apply(["set", ["entries", verdict_key], {**entry, "used": _tick()}])
+    return entry["winner"]
+
+
+def put(verdict_key, winner):
+    entries = _store.get("entries")
+    count = len(entries) + (verdict_key not in entries)
+    _store.apply(["set", ["entries", verdict_key], {"winner": winner, "used": _tick()}])
+    if count > MAX_ENTRIES:
+        _evict()
+
+
+def _evict():
+    entries = _store.get("entries")
+    keep = sorted(entries.items(), key=lambda kv: kv[1]["used"], reverse=True)
+    _store.apply(["set", ["entries"], dict(keep[:max(MAX_ENTRIES * 9 // 10, 1)])])
+
+
+def size():
+    return len(_store.get("entries"))
@@ -0,0 +1,208 @@
+"""
+agent 进程池 - 每个居民一个常驻 worker，跨轮次、跨天保持热启动
+协议见 agent_worker.py：stdin 写一行请求，stdout 读一行回复（之前可以有若干行分块）。
+worker 崩溃、超时或内存超限时自动重启，下一回合拿到的是新进程。
+
+worker 命令（GENESIS_AGENT_WORKER）：
+  不设置  → 没有常驻 worker 可用，pool 后端退回 cli（见 agent_bridge.AGENT_BACKEND）
+  forward → python agent_worker.py --agent {agent} --session-id {session}
+            每个请求仍启动一次 openclaw CLI，只省 Python 侧的启动，不是真正的热启动
+  stub    → 同上加 --stub，不需要 openclaw，用于测试
+  其他    → 自定义命令模板（常驻的 openclaw 进程），{agent} / {session} 会被替换
+
+每个 worker 在自己的会话/进程组里启动：超时和回收时整组杀掉，
+forward 模式下 worker 启动的 openclaw 子进程不会变成孤儿；内存按整组进程的 RSS 之和算。
+"""
+import atexit
+import json
+import os
+import queue
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_worker.py")
+WORKER_CMD = os.environ.get("GENESIS_AGENT_WORKER", "")
+# worker 常驻内存上限（MB），超过后在下一回合前重启
+WORKER_MEMORY_MB = int(os.environ.get("GENESIS_WORKER_MEMORY_MB", "512"))
+
+
+def configured():
+    """是否指定了 worker 命令（没指定时 pool 后端不可用）"""
+    return bool(WORKER_CMD)
+
+
+def _worker_command(agent_name, session_id):
+    if WORKER_CMD in ("forward", "stub"):
+        cmd = [sys.executable, WORKER_SCRIPT, "--agent", agent_name, "--session-id", session_id]
+        return cmd + ["--stub"] if WORKER_CMD == "stub" else cmd
+    return [part.format(agent=agent_name, session=session_id) for part in shlex.split(WORKER_CMD)]
+
+
+def _group_rss_mb(pgid):
+    """进程组里所有进程的常驻内存之和（MB），读不到 /proc（非 Linux）时返回 None"""
+    try:
+        pids = [p for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return None
+    page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+    total_kb = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+                # comm 里可能有空格和括号，从最后一个 ) 之后数：state ppid pgrp
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[2]) != pgid:
+                continue
+            with open(f"/proc/{pid}/statm", "r", encoding="utf-8") as f:
+                total_kb += int(f.read().split()[1]) * page_kb
+        except (OSError, IndexError, ValueError):
+            continue  # 进程刚好退出
+    return total_kb // 1024
+
+
+def _kill_group(proc):
+    """杀掉 worker 和它启动的所有子进程"""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+class AgentWorker:
+    """一个居民的常驻 worker 进程"""
+
+    def __init__(self, citizen_id, agent_name, session_id):
+        self.citizen_id = citizen_id
+        self.cmd = _worker_command(agent_name, session_id)
+        self.proc = None
+        self.restarts = 0
+        self.lock = threading.Lock()
+        self._lines = None
+        self._seq = 0
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        if self.proc is not None:
+            self.restarts += 1
+            print(f"  [{self.citizen_id}] worker 重启（第 {self.restarts} 次）")
+        env = os.environ.copy()
+        env["NODE_OPTIONS"] = "--max-old-space-size=256"
+        self.proc = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1, env=env,
+            start_new_session=hasattr(os, "killpg"),
+        )
+        # 后台线程逐行读 stdout，主线程带超时地从队列取
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc, lines):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def stop(self):
+        if not self.alive():
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        # worker 正常退出后组里也可能还有没结束的子进程
+        _kill_group(self.proc)
+
+    def request(self, message, timeout, agent_timeout=None, ping=False, on_chunk=None):
+        """发一条消息，最多等 timeout 秒，返回 (回复文本, 错误)。
+        agent_timeout 随请求交给 worker，作为这次 openclaw 调用自己的超时。
+        ping=True 只确认 worker 能启动并应答，不调 openclaw。
+        on_chunk：worker 边生成边发的分块（{"id", "chunk"}）逐段回调。"""
+        if not self.alive():
+            self.start()
+        self._seq += 1
+        payload = {"id": self._seq, "ping": True} if ping else {"id": self._seq, "message": message}
+        if agent_timeout:
+            payload["timeout"] = agent_timeout
+        line = json.dumps(payload, ensure_ascii=False) + "\n"
+        try:
+            self.proc.stdin.write(line)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            # 写入前 worker 已经死了：消息没送达，重启后重发一次
+            self.start()
+            self.proc.stdin.write(line)
+            self.proc.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                raw = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+                if raw is None:
+                    self.proc.wait()
+                    return None, f"worker 崩溃（退出码 {self.proc.returncode}）"
+                try:
+                    reply = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue  # worker 打到 stdout 的杂项输出
+                if reply.get("id") != self._seq:
+                    continue
+                if "chunk" not in reply:
+                    break
+                if on_chunk is not None:
+                    on_chunk(reply["chunk"])
+        except queue.Empty:
+            _kill_group(self.proc)
+            return None, f"超时（{timeout}秒）"
+
+        rss = _group_rss_mb(self.proc.pid)
+        if rss is not None and rss > WORKER_MEMORY_MB:
+            print(f"  [{self.citizen_id}] worker 内存 {rss}MB 超过上限，回收")
+            self.stop()
+        return reply.get("text"), reply.get("error")
+
+
+class WorkerPool:
+    """所有居民的 worker。同一居民的请求串行，不同居民互不阻塞。"""
+
+    def __init__(self):
+        self.workers = {}
+        self._lock = threading.Lock()
+
+    def request(self, citizen_id, agent_name, session_id, message, timeout,
+                agent_timeout=None, ping=False, on_chunk=None):
+        with self._lock:
+            worker = self.workers.get(citizen_id)
+            if worker is None:
+                worker = self.workers[citizen_id] = AgentWorker(citizen_id, agent_name, session_id)
+        with worker.lock:
+            try:
+                return worker.request(message, timeout, agent_timeout, ping, on_chunk)
+            except Exception as e:
+                worker.stop()
+                return None, str(e)
+
+    def shutdown(self):
+        for worker in self.workers.values():
+            worker.stop()
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool()
+        atexit.register(_pool.shutdown)
+    return _pool